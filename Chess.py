@@ -5,9 +5,18 @@
 # to refine the existing features and add more functionality as a side project
 
 
-import pygame, os, random, copy, time
+import pygame, os, sys, random, copy, time, threading, weakref, json, csv, zlib
+from array import array
+from collections import deque
 from pygame.locals import *
 from pygame import gfxdraw
+import bitbase, analysis_cache, pgn, openings, chess_clock
+
+# NumPy is only needed for batch evaluation of leaf positions (ChessAI(batch_evaluation=True))
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 # Window width & height constants
@@ -42,10 +51,21 @@ QUEEN = 3
 KING = 4
 PAWN = 5
 
+# Piece names (for image files), point values of each piece kind, and colour names
+PIECE_NAMES = ["rook", "knight", "bishop", "queen", "king", "pawn"]
+PIECE_POINTS = [5, 3, 3, 9, 1000, 1]
+COLOUR_NAMES = ["black", "white"]
+
+# Letters of each piece kind in SAN (standard algebraic notation), pawns have none
+SAN_PIECES = ["R", "N", "B", "Q", "K", ""]
+
+# Starting position in FEN (Forsyth-Edwards Notation)
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
 # AI difficulty constants
 EASY = 1
 MEDIUM = 2
-HARD = 3
+HARD = 4
 
 # Menu option constants
 AI_EASY = 0
@@ -55,15 +75,272 @@ TWO_PLAYER = 3
 HOW_TO_PLAY = 4
 EXIT = 5
 DESELECT_SINGLE_PLAYER = 6
-
-# Neighbour constants for a given piece on the board
-ON_RIGHT = 0
-ON_LEFT = 1
-NO_NEIGHBOUR = 2
+RESIZED = 7                    # The window was resized while on a screen, it has to be drawn again
+CHANGE_TIME_CONTROL = 8        # The time control button was clicked, the next time control is chosen
 
 # Height/width of the board constant
 SIZE = 8
 
+# Directions knights and kings can move in (kings also give the directions of rook/bishop/queen lines)
+KNIGHT_DIRECTIONS = [(-1, -2), (-2, -1), (-1, 2), (-2, 1), (1, -2), (2, -1), (1, 2), (2, 1)]
+KING_DIRECTIONS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+# Squares a king or rook must not have moved from for castling to be allowed
+CASTLING_SLOTS = [(0, 0), (0, 4), (0, 7), (7, 0), (7, 4), (7, 7)]
+
+# Zobrist hashing values, used to make keys for positions (seeded so keys are the same every run)
+zobrist_random = random.Random(2022)
+ZOBRIST_PIECES = [[[[zobrist_random.getrandbits(64) for col in range(SIZE)] for row in range(SIZE)]
+                   for kind in range(6)] for colour in range(2)]
+ZOBRIST_CASTLING = [zobrist_random.getrandbits(64) for slot in CASTLING_SLOTS]
+ZOBRIST_EN_PASSANT = [zobrist_random.getrandbits(64) for col in range(SIZE)]
+ZOBRIST_BLACK_TO_MOVE = zobrist_random.getrandbits(64)
+
+# Search constants
+MATE_SCORE = 1000              # Score for checkmate (minus the number of moves it takes)
+MAX_PLY = 64                   # Deepest the search can go (with extensions)
+ASPIRATION_WINDOW = 25         # Width of the window around the last iteration's score (2.5 pawns)
+NULL_MOVE_REDUCTION = 2        # Depth reduction for null move pruning
+LMR_FULL_MOVES = 3             # Number of moves searched with full depth before late move reductions
+LMR_MIN_DEPTH = 3              # Least depth late move reductions are used at
+
+# Game phase constants, phase goes from PHASE_TOTAL (all pieces on board, middlegame) down to 0 (endgame)
+PHASE_WEIGHTS = [2, 1, 1, 4, 0, 0]   # Phase each piece kind counts for (rook, knight, bishop, queen, king, pawn)
+PHASE_TOTAL = 24
+
+# Piece-square tables, bonus (in hundredths of a pawn) for a white piece on each square, row 0 is black's side.
+# Each piece kind has a middlegame and an endgame table, they are blended by the game phase
+MIDDLEGAME_TABLES = [
+    # Rook
+    [[  0,   0,   0,   0,   0,   0,   0,   0],
+     [  5,  10,  10,  10,  10,  10,  10,   5],
+     [ -5,   0,   0,   0,   0,   0,   0,  -5],
+     [ -5,   0,   0,   0,   0,   0,   0,  -5],
+     [ -5,   0,   0,   0,   0,   0,   0,  -5],
+     [ -5,   0,   0,   0,   0,   0,   0,  -5],
+     [ -5,   0,   0,   0,   0,   0,   0,  -5],
+     [  0,   0,   0,   5,   5,   0,   0,   0]],
+    # Knight
+    [[-50, -40, -30, -30, -30, -30, -40, -50],
+     [-40, -20,   0,   0,   0,   0, -20, -40],
+     [-30,   0,  10,  15,  15,  10,   0, -30],
+     [-30,   5,  15,  20,  20,  15,   5, -30],
+     [-30,   0,  15,  20,  20,  15,   0, -30],
+     [-30,   5,  10,  15,  15,  10,   5, -30],
+     [-40, -20,   0,   5,   5,   0, -20, -40],
+     [-50, -40, -30, -30, -30, -30, -40, -50]],
+    # Bishop
+    [[-20, -10, -10, -10, -10, -10, -10, -20],
+     [-10,   0,   0,   0,   0,   0,   0, -10],
+     [-10,   0,   5,  10,  10,   5,   0, -10],
+     [-10,   5,   5,  10,  10,   5,   5, -10],
+     [-10,   0,  10,  10,  10,  10,   0, -10],
+     [-10,  10,  10,  10,  10,  10,  10, -10],
+     [-10,   5,   0,   0,   0,   0,   5, -10],
+     [-20, -10, -10, -10, -10, -10, -10, -20]],
+    # Queen
+    [[-20, -10, -10,  -5,  -5, -10, -10, -20],
+     [-10,   0,   0,   0,   0,   0,   0, -10],
+     [-10,   0,   5,   5,   5,   5,   0, -10],
+     [ -5,   0,   5,   5,   5,   5,   0,  -5],
+     [  0,   0,   5,   5,   5,   5,   0,  -5],
+     [-10,   5,   5,   5,   5,   5,   0, -10],
+     [-10,   0,   5,   0,   0,   0,   0, -10],
+     [-20, -10, -10,  -5,  -5, -10, -10, -20]],
+    # King (stay castled behind the pawns)
+    [[-30, -40, -40, -50, -50, -40, -40, -30],
+     [-30, -40, -40, -50, -50, -40, -40, -30],
+     [-30, -40, -40, -50, -50, -40, -40, -30],
+     [-30, -40, -40, -50, -50, -40, -40, -30],
+     [-20, -30, -30, -40, -40, -30, -30, -20],
+     [-10, -20, -20, -20, -20, -20, -20, -10],
+     [ 20,  20,   0,   0,   0,   0,  20,  20],
+     [ 20,  30,  10,   0,   0,  10,  30,  20]],
+    # Pawn
+    [[  0,   0,   0,   0,   0,   0,   0,   0],
+     [ 50,  50,  50,  50,  50,  50,  50,  50],
+     [ 10,  10,  20,  30,  30,  20,  10,  10],
+     [  5,   5,  10,  25,  25,  10,   5,   5],
+     [  0,   0,   0,  20,  20,   0,   0,   0],
+     [  5,  -5, -10,   0,   0, -10,  -5,   5],
+     [  5,  10,  10, -20, -20,  10,  10,   5],
+     [  0,   0,   0,   0,   0,   0,   0,   0]]]
+
+ENDGAME_TABLES = [
+    # Rook
+    MIDDLEGAME_TABLES[ROOK],
+    # Knight
+    MIDDLEGAME_TABLES[KNIGHT],
+    # Bishop
+    MIDDLEGAME_TABLES[BISHOP],
+    # Queen
+    MIDDLEGAME_TABLES[QUEEN],
+    # King (come to the centre)
+    [[-50, -40, -30, -20, -20, -30, -40, -50],
+     [-30, -20, -10,   0,   0, -10, -20, -30],
+     [-30, -10,  20,  30,  30,  20, -10, -30],
+     [-30, -10,  30,  40,  40,  30, -10, -30],
+     [-30, -10,  30,  40,  40,  30, -10, -30],
+     [-30, -10,  20,  30,  30,  20, -10, -30],
+     [-30, -30,   0,   0,   0,   0, -30, -30],
+     [-50, -30, -30, -30, -30, -30, -30, -50]],
+    # Pawn (push towards promotion)
+    [[  0,   0,   0,   0,   0,   0,   0,   0],
+     [ 80,  80,  80,  80,  80,  80,  80,  80],
+     [ 50,  50,  50,  50,  50,  50,  50,  50],
+     [ 30,  30,  30,  30,  30,  30,  30,  30],
+     [ 15,  15,  15,  15,  15,  15,  15,  15],
+     [  5,   5,   5,   5,   5,   5,   5,   5],
+     [  0,   0,   0,   0,   0,   0,   0,   0],
+     [  0,   0,   0,   0,   0,   0,   0,   0]]]
+
+# Material value of each piece kind (hundredths of a pawn) in the middlegame and endgame, kings are always on the
+# board so they have none (the evaluation adds these to the piece-square tables)
+MIDDLEGAME_MATERIAL = [500, 300, 300, 900, 0, 100]
+ENDGAME_MATERIAL = [500, 300, 300, 900, 0, 100]
+
+# File of evaluation weights made by python tune_evaluation.py (replacing the material values and piece-square
+# tables above), the hand-picked ones are used if there isn't one
+EVALUATION_WEIGHTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "evaluation_weights.json")
+
+# Endgame bitbase constants
+BITBASE_WIN_SCORE = 500        # Bonus for a position the bitbases say is won (less than checkmate)
+
+# Batch evaluation constants
+BATCH_MIN_MOVES = 12           # Fewest moves a node on the last ply needs for its positions to be batch scored
+
+# Packed move constants (moves are 16 bit integers: from square, to square, promotion piece, flag)
+MOVE_NORMAL = 0
+MOVE_PROMOTION = 1
+MOVE_EN_PASSANT = 2
+MOVE_CASTLING = 3
+NO_MOVE = 0                    # A move can't start and end on the same square, so 0 is never a move
+MAX_MOVES = 256                # Most moves a position can have (size of each move buffer)
+HASH_MOVE_ORDER = 1000         # Move ordering score of the best move from the last search of a position
+GOOD_CAPTURE_ORDER = 100       # Added to the ordering score of captures that don't lose material
+MOVE_ORDER_SCALE = 16          # Capture values are scaled by this, the rest is random (same values shuffled)
+
+# Search table constants
+TABLE_MAX_ENTRIES = 200000     # Tables are cleared once they hold this many positions
+
+# Hint analysis constants
+HINT_LINES = 3                 # Number of best moves (lines) shown by the hint
+HINT_LINE_MOVES = 4            # Most moves of each line shown
+
+# Opening explorer constants
+OPENING_MIN_GAMES = 5          # Fewest games a move has to have been played in for the AI to play it from the index
+HINT_OPENING_MOVES = 3         # Number of moves from the index shown with the hint
+
+# Analysis cache constants (searches kept on disk between runs)
+ANALYSIS_CACHE_VERSION = 1     # Change when the evaluation or search changes, so old results aren't reused
+
+# Performance overlay constants
+PERFORMANCE_KEY = K_F3         # Key that shows and hides the performance overlay
+PERFORMANCE_FRAMES = 120       # Number of recent frames the frame time and FPS are averaged over
+PERFORMANCE_LOG_SECONDS = 1.0  # Seconds between rows written to the performance log
+PERFORMANCE_LOG_MAX_BYTES = 1000000   # Size a performance log grows to before it's rolled over
+PERFORMANCE_LOG_FILES = 3      # Number of rolled over logs kept (log.1 newest)
+PERFORMANCE_FIELDS = ["time", "fps", "frame_ms", "max_frame_ms", "click_latency_ms", "search_seconds",
+                      "search_depth", "search_nodes"]
+
+# Animation constants
+FRAME_RATE = 60                # Frames per second the game is drawn at
+TIMESTEP = 1/FRAME_RATE        # Animations move on in steps of this many seconds, however long frames take
+MOVE_SECONDS = 0.3             # Time a moved piece takes to slide to its new slot
+THREAD_SWITCH_SECONDS = 0.001  # How often the AI's threads give the game's thread a turn (Python's default is 5 ms)
+
+# Board drawing constants, sizes are for the board drawn at BOARD_IMAGE_SIZE and scaled to the size it's drawn at
+IMAGE_FOLDER = os.path.dirname(os.path.abspath(__file__))   # Folder the images are loaded from
+BOARD_IMAGE_SIZE = 600         # Size the board is drawn at in the game's design co-ordinates
+SQUARE_SIZE = 75
+PIECE_SIZE = 65
+PIECE_OFFSET = 5               # Pieces are drawn this far in from the top left corner of their square
+BOX_WIDTH = 3                  # Width of the lines of boxes around squares
+MOVE_CIRCLE_RADIUS = 23        # Radius of the circles on the squares the selected piece can move to
+LAST_MOVE_HIGHLIGHT = (255, 215, 0, 110)  # Colour (with transparency) of the squares of the last move
+CHECK_HIGHLIGHT = (255, 0, 0, 120)        # Colour (with transparency) of the square of a king in check
+
+# Time control constants, the clock button on the menu goes through them (None is untimed)
+TIME_CONTROLS = [None, chess_clock.TimeControl(60), chess_clock.TimeControl(180, 2),
+                 chess_clock.TimeControl(300, 0, 3), chess_clock.TimeControl(600, 5)]
+LOW_TIME_SECONDS = 10          # Clocks with less time left than this are drawn in red
+
+# Pondering constants (searching while the human player is thinking)
+PONDER_MAX_SECONDS = 60        # Longest time spent pondering one position
+PONDER_MAX_REPLIES = 6         # Number of human moves the AI's reply is pondered for
+PONDER_NODE_CHECK = 256        # How often (in nodes) the search checks if it has been cancelled
+
+
+def load_evaluation_weights(path=EVALUATION_WEIGHTS_PATH):
+    """Returns the evaluation weights (material values and piece-square tables for the middlegame and endgame)
+    from a weights file made by tune_evaluation.py and a name for them (changes when they do), the hand-picked
+    weights and None if there is no file or it isn't a weights file"""
+
+    weights = {"middlegame_material": MIDDLEGAME_MATERIAL, "endgame_material": ENDGAME_MATERIAL,
+               "middlegame_tables": MIDDLEGAME_TABLES, "endgame_tables": ENDGAME_TABLES}
+    if not os.path.exists(path):
+        return weights, None
+
+    try:
+        with open(path) as file:
+            text = file.read()
+        loaded = json.loads(text)
+        for name in ("middlegame_material", "endgame_material"):
+            if len(loaded[name]) != 6 or not all(isinstance(value, int) for value in loaded[name]):
+                return weights, None
+        for name in ("middlegame_tables", "endgame_tables"):
+            if len(loaded[name]) != 6 or not all(len(table) == SIZE and
+                                                 all(len(row) == SIZE and all(isinstance(value, int) for value in row)
+                                                     for row in table) for table in loaded[name]):
+                return weights, None
+    except (OSError, ValueError, KeyError, TypeError):
+        return weights, None
+
+    for name in weights:
+        weights[name] = loaded[name]
+    return weights, format(zlib.crc32(text.encode()), "08x")
+
+
+def create_piece_square_tables(tables, material):
+    """Creates and returns piece-square tables for each colour, piece kind and slot, in board score units
+    (tenths of a pawn) with the piece's material value included, white adds and black subtracts (black's tables
+    are flipped)"""
+
+    scores = [[], []]
+    for kind in range(len(tables)):
+        white = [[0 for col in range(SIZE)] for row in range(SIZE)]
+        black = [[0 for col in range(SIZE)] for row in range(SIZE)]
+        for row in range(SIZE):
+            for col in range(SIZE):
+                # Round material and bonus each to nearest tenth of a pawn (halves away from 0)
+                value = 0
+                for part in (material[kind], tables[kind][row][col]):
+                    if part >= 0:
+                        value += (part + 5)//10
+                    else:
+                        value -= (-part + 5)//10
+                white[row][col] = value
+                black[7 - row][col] = -value
+        scores[WHITE].append(white)
+        scores[BLACK].append(black)
+    return scores
+
+
+# Evaluation weights (tuned ones if there is a weights file), and piece-square tables with the material values
+# worked out from them once when the game starts
+EVALUATION_WEIGHTS, EVALUATION_WEIGHTS_NAME = load_evaluation_weights()
+PIECE_SQUARE_MIDDLEGAME = create_piece_square_tables(EVALUATION_WEIGHTS["middlegame_tables"],
+                                                     EVALUATION_WEIGHTS["middlegame_material"])
+PIECE_SQUARE_ENDGAME = create_piece_square_tables(EVALUATION_WEIGHTS["endgame_tables"],
+                                                  EVALUATION_WEIGHTS["endgame_material"])
+
+
+# Endgame bitbases (KQK, KRK, KPK), only used if they have been built (python bitbase.py)
+BITBASES = bitbase.Bitbases()
+
+# Opening explorer index, only used if it has been built (python index_openings.py games.pgn)
+OPENINGS = openings.OpeningIndex()
+
 
 def terminate():
     """Called when the user closes the window or presses the ESC key, terminates the program"""
@@ -72,18 +349,18 @@ def terminate():
     
 
 def draw_text(text, font, surface, x, y, textcolour):
-    """Draws the text on the surface, starting at the specified location"""
+    """Draws the text on the surface, starting at the specified location (design co-ordinates)"""
     textobj = font.render(text, 1, textcolour)
     textrect = textobj.get_rect()
-    textrect.topleft = (x, y)
+    textrect.topleft = LAYOUT.point(x, y)
     surface.blit(textobj, textrect)
 
 
 def draw_text_middle(text, font, surface, x, y, textcolour):
-    """Draws the text on the surface, centered at the specified location"""
+    """Draws the text on the surface, centered at the specified location (design co-ordinates)"""
     textobj = font.render(text, 1, textcolour)
     textrect = textobj.get_rect()
-    textrect.midtop = (x, y)
+    textrect.midtop = LAYOUT.point(x, y)
     surface.blit(textobj, textrect)
 
 
@@ -94,6 +371,20 @@ def load_image(filename):
     return image
 
 
+def create_pieces(images):
+    """Creates and returns the pieces (pieces[colour][kind]), without images if images is False (for using
+    the AI without a window)"""
+
+    pieces = create_2D_array(2, 6, None)
+    for colour in (BLACK, WHITE):
+        for kind in range(len(PIECE_NAMES)):
+            image = None
+            if images:
+                image = load_image(COLOUR_NAMES[colour] + "_" + PIECE_NAMES[kind] + ".png")
+            pieces[colour][kind] = Piece(image, colour, kind, PIECE_POINTS[kind])
+    return pieces
+
+
 def create_2D_array(rows, cols, value):
     """Creates and returns 2D array of inputted dimensions, each cell is set to input value"""
     array = [[value for x in range(cols)] for y in range(rows)]
@@ -108,20 +399,92 @@ def opposite_colour(colour):
         return BLACK
 
 
+def encode_move(firstslot, secondslot, promotion, flag):
+    """Packs a move into a 16 bit integer, bits 0-5 from square, 6-11 to square, 12-13 promotion piece, 14-15 flag"""
+    return ((firstslot[0]*8 + firstslot[1]) | ((secondslot[0]*8 + secondslot[1]) << 6)
+            | (promotion << 12) | (flag << 14))
+
+
+def move_from(move):
+    """Returns the starting slot of a packed move"""
+    return ((move & 63) >> 3, move & 7)
+
+
+def move_to(move):
+    """Returns the ending slot of a packed move"""
+    return ((move >> 9) & 7, (move >> 6) & 7)
+
+
+def move_promotion(move):
+    """Returns the piece a pawn promotes to in a packed move (ROOK, KNIGHT, BISHOP or QUEEN)"""
+    return (move >> 12) & 3
+
+
+def move_flag(move):
+    """Returns the flag of a packed move (MOVE_NORMAL, MOVE_PROMOTION, MOVE_EN_PASSANT or MOVE_CASTLING)"""
+    return move >> 14
+
+
+def move_to_tuple(move):
+    """Returns the (initial slot, final slot) tuple of a packed move, used by the game/display"""
+    return (move_from(move), move_to(move))
+
+
+def slot_name(slot):
+    """Returns the name of a slot on the board (e.g. (6, 4) is e2)"""
+    return "abcdefgh"[slot[1]] + str(SIZE - slot[0])
+
+
+def replay_game(moves, pieces):
+    """Generator, plays the SAN moves from the starting position and yields the board, the colour to move
+    and the packed move before each move is made. The same board is used (and changed) the whole game, so
+    copy it to keep a position. Raises ValueError at a move that isn't legal"""
+
+    board = Board(pieces)
+    board.set_up_initial_board()
+    colour = WHITE
+    for san in moves:
+        move = board.parse_san(san, colour)
+        yield board, colour, move
+        board.play_move(move, None)
+        colour = opposite_colour(colour)
+
+
+def move_name(move):
+    """Returns a packed move as from and to slots, e.g. "e2e4" (with the promotion piece, e.g. "e7e8q")"""
+    name = slot_name(move_from(move)) + slot_name(move_to(move))
+    if move_flag(move) == MOVE_PROMOTION:
+        name += SAN_PIECES[move_promotion(move)].lower()
+    return name
+
+
+def score_text(score):
+    """Returns a score (for the side to move, pawn is 10) as text, in pawns or moves until checkmate"""
+    if abs(score) >= MATE_SCORE - MAX_PLY:
+        moves = (MATE_SCORE - abs(score) + 1)//2
+        if score > 0:
+            return "M" + str(moves)
+        return "-M" + str(moves)
+    if score > 0:
+        return "+" + str(score/10)
+    return str(score/10)
+
+
 def draw_border_lines(windowSurface, top, bottom, left, right, lightcolour, darkcolour):                      
-    """Used for drawing lines around rectangle for 3D effect"""
+    """Used for drawing lines around rectangle for 3D effect (design co-ordinates)"""
+
+    # Rectangle in the window, the lines are 2 pixels wide at the design size
+    rect = LAYOUT.rect(left, top, right - left + 1, bottom - top + 1)
+    width = LAYOUT.length(2)
 
     # Light colour, top and left of rectangle
-    pygame.draw.line(windowSurface, lightcolour, (left, top-1), (right, top-1))
-    pygame.draw.line(windowSurface, lightcolour, (left, top-2), (right+1, top-2))
-    pygame.draw.line(windowSurface, lightcolour, (left-1, top-2), (left-1, bottom))
-    pygame.draw.line(windowSurface, lightcolour, (left-2, top-2), (left-2, bottom+1))
+    # (edges are in window pixels already)
+    pygame.draw.rect(windowSurface, lightcolour, pygame.Rect(rect.left - width, rect.top - width, rect.width + width, width))
+    pygame.draw.rect(windowSurface, lightcolour, pygame.Rect(rect.left - width, rect.top - width, width, rect.height + width))
 
     # Dark colour, bottom and right of rectangle
-    pygame.draw.line(windowSurface, darkcolour, (right+1, top-1), (right+1, bottom+2))
-    pygame.draw.line(windowSurface, darkcolour, (right+2, top-2), (right+2, bottom+2))
-    pygame.draw.line(windowSurface, darkcolour, (left-1, bottom+1), (right, bottom+1))
-    pygame.draw.line(windowSurface, darkcolour, (left-2, bottom+2), (right, bottom+2))
+    pygame.draw.rect(windowSurface, darkcolour, pygame.Rect(rect.right, rect.top - width, width, rect.height + 2*width))
+    pygame.draw.rect(windowSurface, darkcolour, pygame.Rect(rect.left - width, rect.bottom, rect.width + width, width))
 
 
 def display_instructions(windowSurface, homeicon, hinticon, soundicon, menuhomeicon):
@@ -131,20 +494,20 @@ def display_instructions(windowSurface, homeicon, hinticon, soundicon, menuhomei
     windowSurface.fill(TAN_COLOUR)
 
     # Display home icon
-    windowSurface.blit(homeicon.image, homeicon.rect)
+    LAYOUT.blit(windowSurface, homeicon)
 
     # Set up fonts
-    titleFont = pygame.font.SysFont("Times New Roman", 90, italic=True)
-    headerFont = pygame.font.SysFont("Times New Roman", 40)
-    basicFont = pygame.font.SysFont("Times New Roman", 30)
+    titleFont = LAYOUT.font("Times New Roman", 90, italic=True)
+    headerFont = LAYOUT.font("Times New Roman", 40)
+    basicFont = LAYOUT.font("Times New Roman", 30)
 
     # Draw title
-    draw_text_middle("How To Play", titleFont, windowSurface, windowSurface.get_rect().centerx, 5, BLACK_COLOUR)
+    draw_text_middle("How To Play", titleFont, windowSurface, WINDOW_WIDTH//2, 5, BLACK_COLOUR)
 
     # Display buttons
-    windowSurface.blit(hinticon.image, hinticon.rect)
-    windowSurface.blit(soundicon.image, soundicon.rect)
-    windowSurface.blit(menuhomeicon.image, menuhomeicon.rect)
+    LAYOUT.blit(windowSurface, hinticon)
+    LAYOUT.blit(windowSurface, soundicon)
+    LAYOUT.blit(windowSurface, menuhomeicon)
 
     # Display buttons text
     draw_text("Buttons:", headerFont, windowSurface, 100, 150, BLACK_COLOUR)
@@ -158,6 +521,11 @@ def display_instructions(windowSurface, homeicon, hinticon, soundicon, menuhomei
     draw_text("- Click on piece to select or unselect it", basicFont, windowSurface, 100, 440, BLACK_COLOUR)
     draw_text("- Legal moves will be displayed with green circles", basicFont, windowSurface, 100, 480, BLACK_COLOUR)
     draw_text("- Click on square you wish to move piece to", basicFont, windowSurface, 100, 520, BLACK_COLOUR)
+    draw_text("- Undo/Redo (or left/right arrow keys) take back and replay moves", basicFont, windowSurface, 100, 560,
+              BLACK_COLOUR)
+    draw_text("- F3 shows frame, click and AI search times", basicFont, windowSurface, 100, 600, BLACK_COLOUR)
+    draw_text("- Clock on the menu chooses the time control, running out of time loses", basicFont, windowSurface, 100,
+              640, BLACK_COLOUR)
    
     # Update screen
     pygame.display.update()
@@ -174,51 +542,62 @@ def process_instructions():
             elif event.type == KEYUP:
                 if event.key == K_ESCAPE:
                     terminate()
+            elif event.type == VIDEORESIZE:
+                LAYOUT.resize(event.w, event.h)
+                return RESIZED
             elif event.type == MOUSEBUTTONUP:
+                pos = LAYOUT.to_design(event.pos)    # Click in design co-ordinates
                 #Clicked the home button, return to main menu
-                if (event.pos[0] >= 960 and event.pos[0] < 995
-                and event.pos[1] >= 5 and event.pos[1] < 40):
+                if (pos[0] >= 960 and pos[0] < 995
+                and pos[1] >= 5 and pos[1] < 40):
                     return
                 
 
-def display_menu(windowSurface, bigbishop, bigknight):
-    """Displays the main menu and its options"""
+def display_menu(windowSurface, bigbishop, bigknight, timecontrol):
+    """Displays the main menu and its options, with the time control games are played with"""
 
     # Fill background
     windowSurface.fill(TAN_COLOUR)
 
     # Set up fonts
-    basicFont = pygame.font.SysFont("Arial", 40)
-    titleFont = pygame.font.SysFont("Times New Roman", 170, italic=True)
+    basicFont = LAYOUT.font("Arial", 40)
+    titleFont = LAYOUT.font("Times New Roman", 170, italic=True)
 
     # Draw title
-    draw_text_middle("Chess", titleFont, windowSurface, windowSurface.get_rect().centerx, 1, BLACK_COLOUR)
+    draw_text_middle("Chess", titleFont, windowSurface, WINDOW_WIDTH//2, 1, BLACK_COLOUR)
 
     # Draw rectangles to be clicked on                                     
-    pygame.draw.rect(windowSurface, MENU_GRAY_COLOUR, (windowSurface.get_rect().centerx - 125, 215, 250, 60))                                      
-    pygame.draw.rect(windowSurface, MENU_GRAY_COLOUR, (windowSurface.get_rect().centerx - 125, 285, 250, 60))
-    pygame.draw.rect(windowSurface, MENU_GRAY_COLOUR, (windowSurface.get_rect().centerx - 125, 355, 250, 60))                                      
-    pygame.draw.rect(windowSurface, MENU_GRAY_COLOUR, (windowSurface.get_rect().centerx - 125, 425, 250, 60))
+    pygame.draw.rect(windowSurface, MENU_GRAY_COLOUR, LAYOUT.rect(WINDOW_WIDTH//2 - 125, 215, 250, 60))                                      
+    pygame.draw.rect(windowSurface, MENU_GRAY_COLOUR, LAYOUT.rect(WINDOW_WIDTH//2 - 125, 285, 250, 60))
+    pygame.draw.rect(windowSurface, MENU_GRAY_COLOUR, LAYOUT.rect(WINDOW_WIDTH//2 - 125, 355, 250, 60))                                      
+    pygame.draw.rect(windowSurface, MENU_GRAY_COLOUR, LAYOUT.rect(WINDOW_WIDTH//2 - 125, 425, 250, 60))
+    pygame.draw.rect(windowSurface, MENU_GRAY_COLOUR, LAYOUT.rect(WINDOW_WIDTH//2 - 125, 495, 250, 60))
     
     # Draw options to click on
-    draw_text_middle("Single Player", basicFont, windowSurface, windowSurface.get_rect().centerx, 220, BLACK_COLOUR)
-    draw_text_middle("Two Player", basicFont, windowSurface, windowSurface.get_rect().centerx, 290, BLACK_COLOUR)
-    draw_text_middle("How To Play", basicFont, windowSurface, windowSurface.get_rect().centerx, 360, BLACK_COLOUR)
-    draw_text_middle("Exit", basicFont, windowSurface, windowSurface.get_rect().centerx, 430, BLACK_COLOUR)
+    draw_text_middle("Single Player", basicFont, windowSurface, WINDOW_WIDTH//2, 220, BLACK_COLOUR)
+    draw_text_middle("Two Player", basicFont, windowSurface, WINDOW_WIDTH//2, 290, BLACK_COLOUR)
+    draw_text_middle("How To Play", basicFont, windowSurface, WINDOW_WIDTH//2, 360, BLACK_COLOUR)
+    draw_text_middle("Exit", basicFont, windowSurface, WINDOW_WIDTH//2, 430, BLACK_COLOUR)
+    if timecontrol == None:
+        draw_text_middle("Clock: Off", basicFont, windowSurface, WINDOW_WIDTH//2, 500, BLACK_COLOUR)
+    else:
+        draw_text_middle("Clock: " + timecontrol.name(), basicFont, windowSurface, WINDOW_WIDTH//2, 500, BLACK_COLOUR)
 
     # Draw lines around rectangles for 3d effect
-    draw_border_lines(windowSurface, 215, 274, windowSurface.get_rect().centerx - 125, windowSurface.get_rect().centerx + 124,
+    draw_border_lines(windowSurface, 215, 274, WINDOW_WIDTH//2 - 125, WINDOW_WIDTH//2 + 124,
                       LIGHT_GRAY_COLOUR, DARK_GRAY_COLOUR)
-    draw_border_lines(windowSurface, 285, 344, windowSurface.get_rect().centerx - 125, windowSurface.get_rect().centerx + 124,
+    draw_border_lines(windowSurface, 285, 344, WINDOW_WIDTH//2 - 125, WINDOW_WIDTH//2 + 124,
                       LIGHT_GRAY_COLOUR, DARK_GRAY_COLOUR)
-    draw_border_lines(windowSurface, 355, 414, windowSurface.get_rect().centerx - 125, windowSurface.get_rect().centerx + 124,
+    draw_border_lines(windowSurface, 355, 414, WINDOW_WIDTH//2 - 125, WINDOW_WIDTH//2 + 124,
                       LIGHT_GRAY_COLOUR, DARK_GRAY_COLOUR)
-    draw_border_lines(windowSurface, 425, 484, windowSurface.get_rect().centerx - 125, windowSurface.get_rect().centerx + 124,
+    draw_border_lines(windowSurface, 425, 484, WINDOW_WIDTH//2 - 125, WINDOW_WIDTH//2 + 124,
+                      LIGHT_GRAY_COLOUR, DARK_GRAY_COLOUR)
+    draw_border_lines(windowSurface, 495, 554, WINDOW_WIDTH//2 - 125, WINDOW_WIDTH//2 + 124,
                       LIGHT_GRAY_COLOUR, DARK_GRAY_COLOUR)
              
     # Draw big knight and bishop
-    windowSurface.blit(bigbishop.image, bigbishop.rect)
-    windowSurface.blit(bigknight.image, bigknight.rect)
+    LAYOUT.blit(windowSurface, bigbishop)
+    LAYOUT.blit(windowSurface, bigknight)
        
     # Update screen
     pygame.display.update()
@@ -235,50 +614,58 @@ def process_menu(windowSurface):
             elif event.type == KEYUP:
                 if event.key == K_ESCAPE:
                     terminate()      
+            elif event.type == VIDEORESIZE:
+                LAYOUT.resize(event.w, event.h)
+                return RESIZED
             elif event.type == MOUSEBUTTONUP:
+                pos = LAYOUT.to_design(event.pos)    # Click in design co-ordinates
                 # Within the first option selection area (single player)
-                if (event.pos[0] >= 375 and event.pos[0] <= 625 and
-                    event.pos[1] >= 215 and event.pos[1] <= 274):
+                if (pos[0] >= 375 and pos[0] <= 625 and
+                    pos[1] >= 215 and pos[1] <= 274):
                     #Run code for selecting difficulty
                     display_AI_options(windowSurface)
                     return process_AI_options()    
                 # Within the second option selection area (two player)
-                elif (event.pos[0] >= 375 and event.pos[0] <= 625 and
-                    event.pos[1] >= 285 and event.pos[1] <= 344):
+                elif (pos[0] >= 375 and pos[0] <= 625 and
+                    pos[1] >= 285 and pos[1] <= 344):
                     return TWO_PLAYER
                 # Within the third option selection area (how to play)
-                elif (event.pos[0] >= 375 and event.pos[0] <= 625 and
-                    event.pos[1] >= 355 and event.pos[1] <= 414):
+                elif (pos[0] >= 375 and pos[0] <= 625 and
+                    pos[1] >= 355 and pos[1] <= 414):
                     return HOW_TO_PLAY
                 # Within the fourth option selection area (exit)
-                elif (event.pos[0] >= 375 and event.pos[0] <= 625 and
-                    event.pos[1] >= 425 and event.pos[1] <= 484):
+                elif (pos[0] >= 375 and pos[0] <= 625 and
+                    pos[1] >= 425 and pos[1] <= 484):
                     return EXIT
+                # Within the fifth option selection area (time control)
+                elif (pos[0] >= 375 and pos[0] <= 625 and
+                    pos[1] >= 495 and pos[1] <= 554):
+                    return CHANGE_TIME_CONTROL
 
 
 def display_AI_options(windowSurface):
     """Display the screen for when player is selecting AI difficulty"""
 
     # Set up font
-    basicFont = pygame.font.SysFont("Arial", 40)
+    basicFont = LAYOUT.font("Arial", 40)
 
     # Draw rectangles to be clicked on                                     
-    pygame.draw.rect(windowSurface, MENU_BEIGE_COLOUR, (windowSurface.get_rect().centerx - 125, 285, 250, 60))
-    pygame.draw.rect(windowSurface, MENU_BEIGE_COLOUR, (windowSurface.get_rect().centerx - 125, 355, 250, 60))                                      
-    pygame.draw.rect(windowSurface, MENU_BEIGE_COLOUR, (windowSurface.get_rect().centerx - 125, 425, 250, 60))
+    pygame.draw.rect(windowSurface, MENU_BEIGE_COLOUR, LAYOUT.rect(WINDOW_WIDTH//2 - 125, 285, 250, 60))
+    pygame.draw.rect(windowSurface, MENU_BEIGE_COLOUR, LAYOUT.rect(WINDOW_WIDTH//2 - 125, 355, 250, 60))                                      
+    pygame.draw.rect(windowSurface, MENU_BEIGE_COLOUR, LAYOUT.rect(WINDOW_WIDTH//2 - 125, 425, 250, 60))
     
     # Draw options to click on
-    draw_text_middle("Easy", basicFont, windowSurface, windowSurface.get_rect().centerx, 290, BLACK_COLOUR)
-    draw_text_middle("Medium", basicFont, windowSurface, windowSurface.get_rect().centerx, 360, BLACK_COLOUR)
-    draw_text_middle("Hard", basicFont, windowSurface, windowSurface.get_rect().centerx, 430, BLACK_COLOUR)
+    draw_text_middle("Easy", basicFont, windowSurface, WINDOW_WIDTH//2, 290, BLACK_COLOUR)
+    draw_text_middle("Medium", basicFont, windowSurface, WINDOW_WIDTH//2, 360, BLACK_COLOUR)
+    draw_text_middle("Hard", basicFont, windowSurface, WINDOW_WIDTH//2, 430, BLACK_COLOUR)
 
     # Draw lines around rectangles for 3d effect
-    draw_border_lines(windowSurface, 285, 344, windowSurface.get_rect().centerx - 125,
-                      windowSurface.get_rect().centerx + 124, LIGHT_BEIGE_COLOUR, DARK_BEIGE_COLOUR)
-    draw_border_lines(windowSurface, 355, 414, windowSurface.get_rect().centerx - 125,
-                      windowSurface.get_rect().centerx + 124, LIGHT_BEIGE_COLOUR, DARK_BEIGE_COLOUR)
-    draw_border_lines(windowSurface, 425, 484, windowSurface.get_rect().centerx - 125,
-                      windowSurface.get_rect().centerx + 124, LIGHT_BEIGE_COLOUR, DARK_BEIGE_COLOUR)     
+    draw_border_lines(windowSurface, 285, 344, WINDOW_WIDTH//2 - 125,
+                      WINDOW_WIDTH//2 + 124, LIGHT_BEIGE_COLOUR, DARK_BEIGE_COLOUR)
+    draw_border_lines(windowSurface, 355, 414, WINDOW_WIDTH//2 - 125,
+                      WINDOW_WIDTH//2 + 124, LIGHT_BEIGE_COLOUR, DARK_BEIGE_COLOUR)
+    draw_border_lines(windowSurface, 425, 484, WINDOW_WIDTH//2 - 125,
+                      WINDOW_WIDTH//2 + 124, LIGHT_BEIGE_COLOUR, DARK_BEIGE_COLOUR)     
                     
     # Update screen
     pygame.display.update()
@@ -295,46 +682,55 @@ def process_AI_options():
             elif event.type == KEYUP:
                 if event.key == K_ESCAPE:
                     terminate()
+            elif event.type == VIDEORESIZE:
+                LAYOUT.resize(event.w, event.h)
+                return RESIZED
             elif event.type == MOUSEBUTTONUP:
+                pos = LAYOUT.to_design(event.pos)    # Click in design co-ordinates
                 # Within the first option selection area (back to main menu (don't show single player difficulties)
-                if (event.pos[0] >= 375 and event.pos[0] <= 625 and
-                    event.pos[1] >= 215 and event.pos[1] <= 274):
+                if (pos[0] >= 375 and pos[0] <= 625 and
+                    pos[1] >= 215 and pos[1] <= 274):
                     return DESELECT_SINGLE_PLAYER
                 # Within the second option selection area (easy difficulty)
-                elif (event.pos[0] >= 375 and event.pos[0] <= 625 and
-                    event.pos[1] >= 285 and event.pos[1] <= 344):
+                elif (pos[0] >= 375 and pos[0] <= 625 and
+                    pos[1] >= 285 and pos[1] <= 344):
                     return AI_EASY
                 # Within the third option selection area (medium difficulty)
-                elif (event.pos[0] >= 375 and event.pos[0] <= 625 and
-                    event.pos[1] >= 355 and event.pos[1] <= 414):
+                elif (pos[0] >= 375 and pos[0] <= 625 and
+                    pos[1] >= 355 and pos[1] <= 414):
                     return AI_MEDIUM
                 # Within the fourth option selection area (hard difficulty)
-                elif (event.pos[0] >= 375 and event.pos[0] <= 625 and
-                    event.pos[1] >= 425 and event.pos[1] <= 484):
+                elif (pos[0] >= 375 and pos[0] <= 625 and
+                    pos[1] >= 425 and pos[1] <= 484):
                     return AI_HARD
 
 
-def run_main_menu(windowSurface, bigbishop, bigknight, homeicon, hinticon, soundicon, menuhomeicon):
-    """Run the main menu"""
+def run_main_menu(windowSurface, bigbishop, bigknight, homeicon, hinticon, soundicon, menuhomeicon, cache,
+                  performance, timecontrol):
+    """Run the main menu, timecontrol is the time control chosen last (TIME_CONTROLS)"""
 
     while True:
         # Display and process the home menu
-        display_menu(windowSurface, bigbishop, bigknight)
+        display_menu(windowSurface, bigbishop, bigknight, timecontrol)
         chosen = process_menu(windowSurface)
         
         # Return/initiate code for selected option
         if chosen == AI_EASY:
-            return Game(True, EASY)     #Run game on easy (AI)
+            return Game(True, EASY, cache, performance, timecontrol)     #Run game on easy (AI)
         elif chosen == AI_MEDIUM:
-            return Game(True, MEDIUM)   #Run game on medium (AI)
+            return Game(True, MEDIUM, cache, performance, timecontrol)   #Run game on medium (AI)
         elif chosen == AI_HARD:
-            return Game(True, HARD)     #Run game on hard (AI)
+            return Game(True, HARD, cache, performance, timecontrol)     #Run game on hard (AI)
         elif chosen == TWO_PLAYER:
-            return Game(False, -1)      #Run game (two player)
+            return Game(False, -1, cache, performance, timecontrol)      #Run game (two player)
+        elif chosen == CHANGE_TIME_CONTROL:
+            # Next time control (back to untimed after the last one)
+            timecontrol = TIME_CONTROLS[(TIME_CONTROLS.index(timecontrol) + 1) % len(TIME_CONTROLS)]
         elif chosen == HOW_TO_PLAY:
-            # Run code for instructions screen
+            # Run code for instructions screen (drawn again if the window is resized)
             display_instructions(windowSurface, homeicon, hinticon, soundicon, menuhomeicon)
-            process_instructions()   
+            while process_instructions() == RESIZED:
+                display_instructions(windowSurface, homeicon, hinticon, soundicon, menuhomeicon)
         elif chosen == EXIT:
             terminate()
 
@@ -350,18 +746,104 @@ def process_win_screen():
             elif event.type == KEYUP:
                 if event.key == K_ESCAPE:
                     terminate()
+            elif event.type == VIDEORESIZE:
+                LAYOUT.resize(event.w, event.h)
+                return RESIZED
             elif event.type == MOUSEBUTTONUP:
+                pos = LAYOUT.to_design(event.pos)    # Click in design co-ordinates
                 # Within the "DONE" selection area
-                if (event.pos[0] >= 290 and event.pos[0] <= 410 and
-                    event.pos[1] >= 353 and event.pos[1] <= 387):
+                if (pos[0] >= 290 and pos[0] <= 410 and
+                    pos[1] >= 353 and pos[1] <= 387):
                     return
     
 
+class Layout():
+    """Where things are drawn in the window. Screens are drawn in design co-ordinates (a window of WINDOW_WIDTH
+    by WINDOW_HEIGHT), the layout scales them to fit the actual window (same scale both ways, centred). Fonts
+    and images scaled to the window are kept until it's resized, so frames don't scale anything"""
+
+    def __init__(self, width=WINDOW_WIDTH, height=WINDOW_HEIGHT):
+        self.resize(width, height)
+
+
+    def resize(self, width, height):
+        """Lays out a window of the new size, scaled fonts and images are made again when they're next used"""
+
+        self.width = width                                        # Window width
+        self.height = height                                      # Window height
+        self.scale = max(0.1, min(width/WINDOW_WIDTH, height/WINDOW_HEIGHT))   # Window pixels per design pixel
+        self.left = (width - WINDOW_WIDTH*self.scale)/2           # Window co-ordinates of the design's top left
+        self.top = (height - WINDOW_HEIGHT*self.scale)/2
+        self.fonts = {}                                           # (name, design size, italic) -> scaled font
+        self.images = weakref.WeakKeyDictionary()                 # Original image -> {window size: scaled image}
+
+
+    def point(self, x, y):
+        """Returns the window co-ordinates of a design point"""
+
+        return (round(self.left + x*self.scale), round(self.top + y*self.scale))
+
+
+    def length(self, length):
+        """Returns a design length (line width, radius) in window pixels, at least 1"""
+
+        return max(1, round(length*self.scale))
+
+
+    def rect(self, left, top, width, height):
+        """Returns the window rectangle of a design rectangle, edges are rounded so rectangles that touch in
+        the design still touch in the window"""
+
+        topleft = self.point(left, top)
+        bottomright = self.point(left + width, top + height)
+        return pygame.Rect(topleft[0], topleft[1], bottomright[0] - topleft[0], bottomright[1] - topleft[1])
+
+
+    def to_design(self, position):
+        """Returns the design co-ordinates of a window position (mouse clicks)"""
+
+        return ((position[0] - self.left)/self.scale, (position[1] - self.top)/self.scale)
+
+
+    def font(self, name, size, italic=False):
+        """Returns the system font at a design size scaled to the window, made the first time it's needed"""
+
+        key = (name, size, italic)
+        if key not in self.fonts:
+            self.fonts[key] = pygame.font.SysFont(name, self.length(size), italic=italic)
+        return self.fonts[key]
+
+
+    def blit(self, surface, sprite):
+        """Draws a sprite at its rectangle (design co-ordinates)"""
+
+        self.draw_image(surface, sprite.source, sprite.rect.left, sprite.rect.top, sprite.rect.width,
+                        sprite.rect.height)
+
+
+    def draw_image(self, surface, image, left, top, width, height):
+        """Draws an original image at a design rectangle (which can be between pixels), returns the window
+        rectangle drawn. The image is scaled to the window size the first time it's drawn at that size (and
+        dropped once the image isn't used any more)"""
+
+        rect = self.rect(left, top, width, height)
+        scaled = self.images.setdefault(image, {})
+        if rect.size not in scaled:
+            scaled[rect.size] = pygame.transform.smoothscale(image, rect.size)
+        surface.blit(scaled[rect.size], rect)
+        return rect
+
+
+# The layout of the window (resized with it)
+LAYOUT = Layout()
+
+
 class Surfaceboard(pygame.sprite.Sprite):
     """The actual chess board image"""
     def __init__(self, image):
         pygame.sprite.Sprite.__init__(self)
         
+        self.source = image    # Original image, the layout scales it to the window
         self.image = pygame.transform.scale(image, (600, 600))
         self.rect = self.image.get_rect()
         self.rect.top = 50
@@ -373,6 +855,7 @@ class BigBishopImage(pygame.sprite.Sprite):
     def __init__(self, image, left, ymiddle):
         pygame.sprite.Sprite.__init__(self)
         
+        self.source = image    # Original image, the layout scales it to the window
         self.image = pygame.transform.scale(image, (300, 300))
         self.rect = self.image.get_rect()
         self.rect.centery = ymiddle - 2
@@ -384,6 +867,7 @@ class BigKnightImage(pygame.sprite.Sprite):
     def __init__(self, image, left, ymiddle):
         pygame.sprite.Sprite.__init__(self)
         
+        self.source = image    # Original image, the layout scales it to the window
         self.image = pygame.transform.scale(image, (300, 300))
         self.rect = self.image.get_rect()
         self.rect.centery = ymiddle
@@ -395,6 +879,7 @@ class HomeIcon(pygame.sprite.Sprite):
     def __init__(self, image, top, left):
         pygame.sprite.Sprite.__init__(self)
         
+        self.source = image    # Original image, the layout scales it to the window
         self.image = pygame.transform.scale(image, (35, 35))
         self.rect = self.image.get_rect()
         self.rect.top = top
@@ -406,6 +891,7 @@ class SoundIcon(pygame.sprite.Sprite):
     def __init__(self, image, top, left):
         pygame.sprite.Sprite.__init__(self)
         
+        self.source = image    # Original image, the layout scales it to the window
         self.image = pygame.transform.scale(image, (35, 35))
         self.rect = self.image.get_rect()
         self.rect.top = top
@@ -417,6 +903,7 @@ class HintIcon(pygame.sprite.Sprite):
     def __init__(self, image, top, left):
         pygame.sprite.Sprite.__init__(self)
         
+        self.source = image    # Original image, the layout scales it to the window
         self.image = pygame.transform.scale(image, (35, 35))
         self.rect = self.image.get_rect()
         self.rect.top = top
@@ -436,103 +923,680 @@ class Piece(pygame.sprite.Sprite):
     def __init__(self, image, colour, kind, points):
         pygame.sprite.Sprite.__init__(self)
 
-        self.image = pygame.transform.scale(image, (65, 65))   # Image for piece
-        self.rect = self.image.get_rect()                      # Rectangle of iamge
+        # Pieces used without a window (AI only) have no image
+        if image != None:
+            self.source = image                                    # Original image, the layout scales it to the window
+            self.image = pygame.transform.scale(image, (65, 65))   # Image for piece
+            self.rect = self.image.get_rect()                      # Rectangle of iamge
+        else:
+            self.source = None
+            self.image = None
+            self.rect = None
         self.colour = colour                                   # Colour of piece
         self.kind = kind                                       # Type of piece
         self.points = points                                   # Point value of piece
 
 
+class SearchStopped(Exception):
+    """Raised inside the AI search when it has been cancelled or has run out of time"""
+
+
+class BatchEvaluator():
+    """Scores many boards in one NumPy call, each board is turned into piece planes (one 8x8 plane of 0s and 1s
+    for each colour and piece kind) which are multiplied by the piece-square weights (with material). Gives the
+    same score as get_board_score for boards that aren't checkmate, stalemate or a bitbase endgame"""
+
+    def __init__(self, pieces):
+        self.pieces = pieces    # Pieces the weights were made for
+        self.planes = {}        # Piece -> plane number (empty square is the last number, it has no plane)
+
+        # Weights for each plane and square (piece-square tables include material, black subtracts)
+        self.middlegame = numpy.zeros((12, SIZE*SIZE))
+        self.endgame = numpy.zeros((12, SIZE*SIZE))
+        for colour in (BLACK, WHITE):
+            for kind in range(len(pieces[colour])):
+                plane = colour*6 + kind
+                self.planes[pieces[colour][kind]] = plane
+                self.middlegame[plane] = numpy.array(PIECE_SQUARE_MIDDLEGAME[colour][kind]).flatten()
+                self.endgame[plane] = numpy.array(PIECE_SQUARE_ENDGAME[colour][kind]).flatten()
+        self.planes[None] = 12
+        self.middlegame = self.middlegame.flatten()
+        self.endgame = self.endgame.flatten()
+
+
+    def evaluate(self, boards):
+        """Returns the scores of the boards (white adds, black subtracts) and the number of pieces on each"""
+
+        # Plane number of each square of each board
+        planes = self.planes
+        squares = numpy.array([[planes[piece] for row in board.board for piece in row] for board in boards])
+
+        # Piece planes (boards x planes x squares), multiplied by the weights
+        tensor = (squares[:, None, :] == numpy.arange(12)[None, :, None]).reshape(len(boards), 12*SIZE*SIZE)
+        middlegame = (tensor @ self.middlegame).round().astype(numpy.int64)
+        endgame = (tensor @ self.endgame).round().astype(numpy.int64)
+
+        # Blend middlegame and endgame by game phase
+        phase = numpy.clip(numpy.array([board.phase for board in boards]), 0, PHASE_TOTAL)
+        scores = (middlegame*phase + endgame*(PHASE_TOTAL - phase))//PHASE_TOTAL
+
+        return scores.tolist(), (squares != 12).sum(axis=1).tolist()
+
+
+class AnalysisLine():
+    """One of the best moves found by ChessAI.get_best_moves"""
+    def __init__(self, score, moves):
+        self.score = score      # Score after the move, white positive/black negative (same as get_board_score)
+        self.moves = moves      # Moves expected to be played (packed), best move first
+        self.line = [move_to_tuple(move) for move in moves]  # Same moves as (initial slot, final slot)
+        self.move = self.line[0]  # The move
+
+
 class ChessAI():
     """The logic/algorithm used for the AI"""
 
-    def get_best_move(self, board, colour, depth, beta, alpha):
-        """Returns score, initial slot, and final slot of best possible move with inputted colour and depth"""
+    def __init__(self, pvs=True, aspiration=True, null_move=True, late_move_reductions=True, check_extensions=True,
+                 batch_evaluation=False, quiescence=True, static_exchange=True, cache=None, openings=None):
+        self.results = {}         # Finished searches, (position key, depth) -> (score, initial slot, final slot)
+        self.analyses = {}        # Finished multi-line searches, (position key, depth, lines) -> list of AnalysisLine
+        self.cache = cache        # Analysis cache on disk (analysis_cache.AnalysisCache), None if not used
+        self.openings = openings  # Opening explorer index the AI plays its opening moves from, None if not used
+        self.hashmoves = {}       # Best move (packed) found for each searched position, tried first when searched again
+        self.rootmove = NO_MOVE   # Best move (packed) found at the root of the current search
+        self.nodes = 0            # Number of positions searched
+        self.stop_event = None    # Set from another thread to cancel the search (pondering or searching in a thread)
+        self.deadline = None      # Time (time.monotonic()) the search has to stop by (pondering or on the clock)
+        self.laststats = None     # (seconds, depth, nodes) of the last finished get_best_move, None before one
+
+        # Search features, can be turned off to compare (benchmark) the search with and without them
+        self.pvs = pvs                                    # Principal variation search (null windows)
+        self.aspiration = aspiration                      # Aspiration windows around the last iteration's score
+        self.null_move = null_move                        # Null move pruning
+        self.late_move_reductions = late_move_reductions  # Search late quiet moves with less depth
+        self.check_extensions = check_extensions          # Search further when in check
+        self.batch_evaluation = batch_evaluation and numpy != None  # Score last ply's positions together (NumPy,
+                                                                    # only used without quiescence)
+        self.evaluator = None                             # Batch evaluator (made when first needed)
+        self.quiescence = quiescence                      # Search captures at the end of the search
+        self.static_exchange = static_exchange            # Order captures by static exchange, skip losing ones
+
+        # Move buffers for each ply (packed moves and their ordering scores), made once so the search
+        # doesn't make new lists at every node (two spare buffers, one past the deepest ply is for generate_all_moves)
+        self.movebuffers = [array("H", [NO_MOVE])*MAX_MOVES for ply in range(MAX_PLY + 2)]
+        self.scorebuffers = [array("l", [0])*MAX_MOVES for ply in range(MAX_PLY + 2)]
+        self.random = random.Random()
+
+
+    def search(self, board, colour, depth, soft=None, hard=None):
+        """Returns the same as get_best_move, reusing the result if this position has already been searched.
+        Soft and hard are the seconds the search can take when playing on a clock (see get_best_move)"""
+
+        # Move from the opening index (chosen at random each time, so not stored)
+        if self.openings != None:
+            move = self.opening_move(board, colour)
+            if move != NO_MOVE:
+                return (board.get_board_score(colour), move_from(move), move_to(move))
+
+        key = (board.get_position_key(colour), depth)
+        if key in self.results:
+            return self.results[key]
+
+        # Searched in an earlier game or run
+        if self.cache != None:
+            stored = self.cache.get(key[0], depth, 0)
+            if stored != None and len(stored) > 0:
+                score, moves = stored[0]
+                if moves[0] == NO_MOVE:
+                    stats = (score, (-1, -1), (-1, -1))
+                else:
+                    self.hashmoves[key[0]] = moves[0]
+                    stats = (score, move_from(moves[0]), move_to(moves[0]))
+                self.results[key] = stats
+                return stats
 
-        # End of recursion/reached max depth
-        if depth == 0:
-            
-            # Check for stalemate at this position
-            if not board.is_in_check(opposite_colour(colour)):
-                if board.get_out_check(opposite_colour(colour)) == 0:
-                    return (0, (-1, -1), (-1, -1))
+        stats = self.get_best_move(board, colour, depth, 1000, -1000, soft, hard)
+
+        # Store finished search, under the depth reached if it ran out of time (clear the table if it has grown
+        # too big)
+        depth = self.laststats[1]
+        key = (key[0], depth)
+        if self.cache != None:
+            self.cache.put(key[0], depth, 0, [(stats[0], [self.rootmove])])
+        if len(self.results) >= TABLE_MAX_ENTRIES:
+            self.results.clear()
+        self.results[key] = stats
+
+        return stats
+
+
+    def analyse(self, board, colour, depth, lines):
+        """Returns the same as get_best_moves, reusing the result if this position has already been analysed"""
+
+        key = (board.get_position_key(colour), depth, lines)
+        if key in self.analyses:
+            return self.analyses[key]
+
+        # Analysed in an earlier game or run
+        analysis = None
+        if self.cache != None:
+            stored = self.cache.get(key[0], depth, lines)
+            if stored != None:
+                analysis = [AnalysisLine(score, moves) for score, moves in stored]
+                if len(stored) > 0:
+                    self.hashmoves[key[0]] = stored[0][1][0]
+
+        if analysis == None:
+            analysis = self.get_best_moves(board, colour, depth, lines)
+            if self.cache != None:
+                self.cache.put(key[0], depth, lines, [(line.score, line.moves) for line in analysis])
+
+        # Store finished analysis (clear the table if it has grown too big)
+        if len(self.analyses) >= TABLE_MAX_ENTRIES:
+            self.analyses.clear()
+        self.analyses[key] = analysis
+
+        return analysis
 
-            # Return the score of the board at this depth
-            return (board.get_board_score(colour), (-1, -1), (-1, -1))
 
-        # Colour is white, maximize possible score
+    def opening_moves(self, board, colour):
+        """Returns the legal moves played from this position in the opening index (openings.OpeningMove),
+        most played first"""
+
+        if self.openings == None:
+            return []
+
+        # Stored move could be from a different position with the same key, make sure it's legal
+        moves = []
+        for opening in self.openings.lookup(board.get_position_key(colour)):
+            firstslot, secondslot = move_to_tuple(opening.move)
+            piece = board.board[firstslot[0]][firstslot[1]]
+            if piece == None or piece.colour != colour:
+                continue
+            current = board.do_not_move_into_check(board.valid_moves(firstslot[0], firstslot[1]), firstslot,
+                                                   opposite_colour(colour))
+            if secondslot in current:
+                moves.append(opening)
+        return moves
+
+
+    def opening_move(self, board, colour):
+        """Returns a move from the opening index (packed), chosen at random by how often each was played,
+        NO_MOVE if the position isn't in the index or its moves haven't been played enough"""
+
+        moves = [opening for opening in self.opening_moves(board, colour) if opening.games >= OPENING_MIN_GAMES]
+        if len(moves) == 0:
+            return NO_MOVE
+        return self.random.choices(moves, [opening.games for opening in moves])[0].move
+
+
+    def has_result(self, board, colour, depth):
+        """Returns if this position has already been searched to inputted depth"""
+
+        return (board.get_position_key(colour), depth) in self.results
+
+
+    def check_stop(self):
+        """Stops the search if it has been cancelled or run out of time, lets other threads run"""
+
+        if self.stop_event.is_set():
+            raise SearchStopped()
+        if self.deadline != None and time.monotonic() > self.deadline:
+            raise SearchStopped()
+
+        # Give up the processor so the game stays responsive while pondering
+        time.sleep(0)
+
+
+    def get_best_move(self, board, colour, depth, beta, alpha, soft=None, hard=None):
+        """Returns score, initial slot, and final slot of best possible move with inputted colour and depth.
+        Score is white positive/black negative (same as get_board_score). When playing on a clock, soft and hard
+        are seconds: no deeper iteration is started after soft seconds, and one still running after hard seconds
+        is stopped, the deepest finished iteration's move is played. Depth 1 always finishes, so there is a move"""
+
+        # Scores in the search are for the colour to move, convert window (white adds, black subtracts)
         if colour == WHITE:
-            best_score = -10000
+            sign = 1
+            low, high = alpha, beta
+        else:
+            sign = -1
+            low, high = -beta, -alpha
+
+        # Iterations after the first check the clock's deadline as they go (a stop event is needed for the search
+        # to check it)
+        stop_event, deadline = self.stop_event, self.deadline
+        if soft != None and self.stop_event == None:
+            self.stop_event = threading.Event()
+
+        # Iterative deepening, each depth orders the next one through the hash moves
+        start = time.perf_counter()
+        clockstart = time.monotonic()
+        startnodes = self.nodes
+        self.rootmove = NO_MOVE
+        score = 0
+        finished = (0, score, NO_MOVE)   # Depth, score and best move of the deepest finished iteration
+        try:
+            for current in range(1, depth + 1):
+                if soft != None and current > 1:
+                    if time.monotonic() - clockstart >= soft:
+                        break
+                    self.deadline = clockstart + hard
+
+                # Search a small window around the last score first, search again with full window if outside of it
+                try:
+                    if self.aspiration and current > 1 and abs(score) < MATE_SCORE - MAX_PLY:
+                        windowlow = max(low, score - ASPIRATION_WINDOW)
+                        windowhigh = min(high, score + ASPIRATION_WINDOW)
+                        score = self.negamax(board, colour, current, windowlow, windowhigh, 0, True)
+                        if (score <= windowlow and windowlow > low) or (score >= windowhigh and windowhigh < high):
+                            score = self.negamax(board, colour, current, low, high, 0, True)
+                    else:
+                        score = self.negamax(board, colour, current, low, high, 0, True)
+                except SearchStopped:
+                    # Cancelled (rather than out of time), stop the whole search
+                    if soft == None or current == 1 or self.stop_event.is_set():
+                        raise
+                    break
+                finished = (current, score, self.rootmove)
+        finally:
+            self.stop_event, self.deadline = stop_event, deadline
+        depth, score, self.rootmove = finished
+
+        # Time, depth and nodes of the search (shown by the performance overlay)
+        self.laststats = (time.perf_counter() - start, depth, self.nodes - startnodes)
+
+        # If no moves possible from given board
+        if self.rootmove == NO_MOVE:
+            return (sign*score, (-1, -1), (-1, -1))
+
+        # Return the move with the best score
+        return (sign*score, move_from(self.rootmove), move_to(self.rootmove))
 
-            # Generate all moves for colour with current board
-            each_possible_move = self.generate_all_moves(board, colour) 
 
-            # Make each possible move
-            for move in each_possible_move:
+    def get_best_moves(self, board, colour, depth, lines):
+        """Returns the best moves (up to lines of them) with their scores and expected lines as AnalysisLines,
+        best first. All moves are searched in one tree: a move only gets an exact score if it beats the
+        worst of the best moves found so far, the rest are only proven to be worse (null window)"""
+
+        if colour == WHITE:
+            sign = 1
+        else:
+            sign = -1
+
+        # Root moves, searched in order of the last iteration's scores
+        key = board.get_position_key(colour)
+        count = self.generate_moves(board, colour, 0, self.hashmoves.get(key, NO_MOVE))
+        rootmoves = []
+        for i in range(count):
+            self.pick_move(0, i, count)
+            rootmoves.append(self.movebuffers[0][i])
+        if count == 0:
+            return []
+
+        # Search one move further when in check (same as negamax)
+        extension = 0
+        if self.check_extensions and board.is_in_check(opposite_colour(colour)):
+            extension = 1
+
+        # Iterative deepening, each depth orders the next one through the hash moves
+        for current in range(1, depth + 1):
+            self.nodes += 1
+            best = []            # (score, move) of the best moves so far, best first
+            others = []          # Moves proven to be worse than the best moves
+            for move in rootmoves:
                 new_board = board.make_copy()
-                new_board.make_move(move[0], move[1], None)
-                new_board.does_pawn_promote(move[1][0], move[1][1])
+                new_board.play_move(move, None)
 
-                # Generate score of move
-                score = (self.get_best_move(new_board, opposite_colour(colour), depth - 1, beta, alpha))[0]
+                # Score a move has to beat to be one of the best moves
+                if len(best) < lines:
+                    alpha = -10000
+                else:
+                    alpha = best[-1][0]
+
+                # Null window first (only need to prove it's not better), full window to get its score if it is
+                if alpha > -10000 and self.pvs:
+                    score = -self.negamax(new_board, opposite_colour(colour), current - 1 + extension,
+                                          -alpha - 1, -alpha, 1, True)
+                    if score > alpha:
+                        score = -self.negamax(new_board, opposite_colour(colour), current - 1 + extension,
+                                              -10000, -alpha, 1, True)
+                else:
+                    score = -self.negamax(new_board, opposite_colour(colour), current - 1 + extension,
+                                          -10000, -alpha, 1, True)
+
+                # Insert into the best moves (in order), last one drops out if there are too many
+                if score > alpha:
+                    position = len(best)
+                    while position > 0 and best[position - 1][0] < score:
+                        position -= 1
+                    best.insert(position, (score, move))
+                    if len(best) > lines:
+                        others.insert(0, best.pop()[1])
+                else:
+                    others.append(move)
 
-                # Update best score and best move
-                if score > best_score:
-                    best_score = score
-                    best_move = move
+            rootmoves = [move for score, move in best] + others
+
+        # Remember best move for next time this position is searched
+        if len(self.hashmoves) >= TABLE_MAX_ENTRIES:
+            self.hashmoves.clear()
+        self.hashmoves[key] = best[0][1]
+        self.rootmove = best[0][1]
+
+        # Follow the best moves stored for the positions after each move to get its line
+        analysis = []
+        for score, move in best:
+            analysis.append(AnalysisLine(sign*score, self.principal_variation(board, colour, move, depth)))
+        return analysis
 
-                # Handle alpha & beta (optimization)
-                if best_score >= beta:
-                    break
-                if best_score > alpha:
-                    alpha = best_score
 
-        # Colour is black, minimize possible score    
+    def principal_variation(self, board, colour, move, length):
+        """Returns the line expected after move (up to length moves long) as packed moves, made by following
+        the best moves stored for each position"""
+
+        line = [move]
+        board = board.make_copy()
+        board.play_move(move, None)
+        colour = opposite_colour(colour)
+        seen = set()
+
+        while len(line) < length:
+            key = board.get_position_key(colour)
+            move = self.hashmoves.get(key, NO_MOVE)
+            if move == NO_MOVE or key in seen:
+                break
+            seen.add(key)
+
+            # Stored move could be from a different position with the same key, make sure it's legal
+            firstslot, secondslot = move_to_tuple(move)
+            piece = board.board[firstslot[0]][firstslot[1]]
+            if piece == None or piece.colour != colour:
+                break
+            current = board.do_not_move_into_check(board.valid_moves(firstslot[0], firstslot[1]), firstslot,
+                                                   opposite_colour(colour))
+            if secondslot not in current:
+                break
+
+            line.append(move)
+            board.play_move(move, None)
+            colour = opposite_colour(colour)
+
+        return line
+
+
+    def negamax(self, board, colour, depth, alpha, beta, ply, allow_null):
+        """Returns score of board for colour to move (positive is good for colour), principal variation
+        alpha-beta search with null move pruning, late move reductions and check extensions"""
+
+        # Count node, check if the search has been cancelled (only while pondering)
+        self.nodes += 1
+        if self.stop_event != None and self.nodes % PONDER_NODE_CHECK == 0:
+            self.check_stop()
+
+        incheck = board.is_in_check(opposite_colour(colour))
+
+        # Search one move further when in check (don't stop the search in the middle of a checking sequence)
+        if incheck and self.check_extensions and ply < MAX_PLY:
+            depth += 1
+
+        # End of recursion/reached max depth
+        if depth <= 0 or ply >= MAX_PLY:
+
+            # Check for checkmate or stalemate at this position
+            if board.get_out_check(opposite_colour(colour)) == 0:
+                if incheck:
+                    return -(MATE_SCORE - ply)
+                return 0
+
+            # Search captures until the position is quiet
+            if self.quiescence:
+                return self.quiesce(board, colour, alpha, beta, ply)
+
+            # Return the score of the board at this depth
+            if colour == WHITE:
+                return board.get_board_score(colour)
+            return -board.get_board_score(colour)
+
+        # Null move pruning, if passing the turn still beats beta the position is too good to search fully
+        # (not used when only king and pawns are left, where passing could be better than any move (zugzwang),
+        # or at the root, which has to find a move)
+        if (self.null_move and allow_null and ply > 0 and not incheck and depth > NULL_MOVE_REDUCTION
+        and beta < MATE_SCORE - MAX_PLY and board.has_non_pawn_pieces(colour)):
+            new_board = board.make_copy()
+            new_board.make_null_move(colour)
+            score = -self.negamax(new_board, opposite_colour(colour), depth - 1 - NULL_MOVE_REDUCTION,
+                                  -beta, -beta + 1, ply + 1, False)
+            if score >= beta:
+                return beta
+
+        # Generate all moves for colour with current board, best move previously found at this position first
+        key = board.get_position_key(colour)
+        count = self.generate_moves(board, colour, ply, self.hashmoves.get(key, NO_MOVE))
+
+        # If no moves possible from given board (checkmate or stalemate)
+        if count == 0:
+            if incheck:
+                return -(MATE_SCORE - ply)
+            return 0
+
+        # Last ply with many moves, score the positions after each move together (only without quiescence, the
+        # positions would otherwise each need their captures searched, which the batch evaluator can't do)
+        if depth == 1 and self.batch_evaluation and not self.quiescence and count >= BATCH_MIN_MOVES:
+            best_score, best_move = self.search_frontier(board, colour, ply, count, alpha, beta)
+            if len(self.hashmoves) >= TABLE_MAX_ENTRIES:
+                self.hashmoves.clear()
+            self.hashmoves[key] = best_move
+            if ply == 0:
+                self.rootmove = best_move
+            return best_score
+
+        best_score = -10000
+
+        # Make each possible move, highest ordering score first
+        moves = self.movebuffers[ply]
+        for i in range(count):
+            self.pick_move(ply, i, count)
+            move = moves[i]
+            quiet = (board.board[(move >> 9) & 7][(move >> 6) & 7] == None and move_flag(move) != MOVE_EN_PASSANT
+                     and move_flag(move) != MOVE_PROMOTION)
+            new_board = board.make_copy()
+            new_board.play_move(move, None)
+
+            # First move (most likely best) is searched with full window
+            if i == 0:
+                score = -self.negamax(new_board, opposite_colour(colour), depth - 1, -beta, -alpha, ply + 1, True)
+
+            else:
+                # Late quiet moves (not captures, promotions or checks) are searched with less depth
+                reduction = 0
+                if (self.late_move_reductions and i >= LMR_FULL_MOVES and depth >= LMR_MIN_DEPTH
+                and not incheck and quiet and not new_board.is_in_check(colour)):
+                    reduction = 1
+
+                # Other moves are searched with null window (only need to prove they are not better)
+                if self.pvs:
+                    windowhigh = alpha + 1
+                else:
+                    windowhigh = beta
+                score = -self.negamax(new_board, opposite_colour(colour), depth - 1 - reduction,
+                                      -windowhigh, -alpha, ply + 1, True)
+
+                # Reduced move turned out better, search again with full depth
+                if reduction > 0 and score > alpha:
+                    score = -self.negamax(new_board, opposite_colour(colour), depth - 1,
+                                          -windowhigh, -alpha, ply + 1, True)
+
+                # Move turned out better, search again with full window to get its score
+                if self.pvs and score > alpha and score < beta:
+                    score = -self.negamax(new_board, opposite_colour(colour), depth - 1, -beta, -alpha, ply + 1, True)
+
+            # Update best score and best move
+            if score > best_score:
+                best_score = score
+                best_move = move
+
+            # Handle alpha & beta (optimization)
+            if best_score > alpha:
+                alpha = best_score
+            if alpha >= beta:
+                break
+
+        # Remember best move for next time this position is searched
+        if len(self.hashmoves) >= TABLE_MAX_ENTRIES:
+            self.hashmoves.clear()
+        self.hashmoves[key] = best_move
+        if ply == 0:
+            self.rootmove = best_move
+
+        return best_score
+
+
+    def quiesce(self, board, colour, alpha, beta, ply):
+        """Returns score of board for colour to move after searching captures (so the score isn't taken in
+        the middle of an exchange), captures that lose material by static exchange are skipped"""
+
+        # Count node, check if the search has been cancelled (only while pondering)
+        self.nodes += 1
+        if self.stop_event != None and self.nodes % PONDER_NODE_CHECK == 0:
+            self.check_stop()
+
+        # Score if no capture is made (colour doesn't have to capture)
+        if colour == WHITE:
+            best_score = board.get_board_score(colour)
         else:
-            best_score = 10000
+            best_score = -board.get_board_score(colour)
 
-            # Generate all moves for colour with current board
-            each_possible_move = self.generate_all_moves(board, colour)
-            
-            # Make each possible move
-            for move in each_possible_move:
-                new_board = board.make_copy()
-                new_board.make_move(move[0], move[1], None)
-                new_board.does_pawn_promote(move[1][0], move[1][1])
+        # Board score is a flat MATE_SCORE for checkmate, score it by ply like the rest of the search (so
+        # quicker mates score higher)
+        if best_score == -MATE_SCORE:
+            return -(MATE_SCORE - ply)
+        if best_score >= beta or ply >= MAX_PLY:
+            return best_score
+        if best_score > alpha:
+            alpha = best_score
 
-                # Generate score of move
-                score = (self.get_best_move(new_board, opposite_colour(colour), depth - 1, beta, alpha))[0]
+        count = self.generate_moves(board, colour, ply, NO_MOVE, True)
+        moves = self.movebuffers[ply]
+        scores = self.scorebuffers[ply]
+        for i in range(count):
+            self.pick_move(ply, i, count)
 
-                # Update best score and best move
-                if score < best_score:
-                    best_score = score
-                    best_move = move
+            # Losing captures are last, none of the rest are worth searching
+            if self.static_exchange and scores[i] < 0:
+                break
 
-                # Handle alpha & beta (optimization)
-                if best_score <= alpha:
-                    break
-                if best_score < beta:
-                    beta = best_score
+            new_board = board.make_copy()
+            new_board.play_move(moves[i], None)
+            score = -self.quiesce(new_board, opposite_colour(colour), -beta, -alpha, ply + 1)
 
+            if score > best_score:
+                best_score = score
+            if best_score > alpha:
+                alpha = best_score
+            if alpha >= beta:
+                break
 
-        #If no moves possible from given board
-        if best_score == 10000 or best_score == -10000:
+        return best_score
 
-            if not board.is_in_check(opposite_colour(colour)):
-                if board.get_out_check(opposite_colour(colour)) == 0:
-                    return (0, (-1, -1), (-1, -1))
 
-            result = (board.get_board_score(colour,), (-1, -1), (-1, -1))
-            return result
+    def search_frontier(self, board, colour, ply, count, alpha, beta):
+        """Returns best score and move for a node one ply from the end of the search (moves already in the
+        move buffer). The first move is searched normally since it's the most likely to cause a cutoff,
+        if it doesn't, the positions after the other moves are scored by the batch evaluator in one call"""
+
+        best_score = -10000
+        best_move = NO_MOVE
+
+        if colour == WHITE:
+            sign = 1
+        else:
+            sign = -1
+
+        if self.evaluator == None or self.evaluator.pieces is not board.pieces:
+            self.evaluator = BatchEvaluator(board.pieces)
+
+        leaves = []
+        leafmoves = []
+        moves = self.movebuffers[ply]
+        for i in range(count):
+            self.pick_move(ply, i, count)
+            new_board = board.make_copy()
+            new_board.play_move(moves[i], None)
+
+            # First move and moves that give check are searched normally (check extension or checkmate)
+            if i == 0 or new_board.is_in_check(colour):
+                score = -self.negamax(new_board, opposite_colour(colour), 0, -beta, -alpha, ply + 1, True)
+                if score > best_score:
+                    best_score = score
+                    best_move = moves[i]
+                if best_score > alpha:
+                    alpha = best_score
+                if alpha >= beta:
+                    return best_score, best_move
+            else:
+                leaves.append(new_board)
+                leafmoves.append(moves[i])
+
+        if len(leaves) == 0:
+            return best_score, best_move
+
+        # Score all the other positions together
+        self.nodes += len(leaves)
+        scores, counts = self.evaluator.evaluate(leaves)
+        for i in range(len(leaves)):
+            # Bitbase endgames are scored by get_board_score
+            if counts[i] == 3:
+                scores[i] = leaves[i].get_board_score(opposite_colour(colour))
+            scores[i] = sign*scores[i]
+
+        # Best score first, a position is only checked for stalemate if it could be the best
+        order = sorted(range(len(leaves)), key=lambda i: -scores[i])
+        for i in order:
+            if scores[i] <= best_score:
+                break
+            if leaves[i].get_out_check(colour) == 0:
+                if 0 > best_score:
+                    best_score = 0
+                    best_move = leafmoves[i]
+            else:
+                best_score = scores[i]
+                best_move = leafmoves[i]
+                break
+
+        return best_score, best_move
 
-        # Return the move with the best score
-        return (best_score, best_move[0], best_move[1])
-                    
 
-    def generate_all_moves(self, board, colour):
-        """Generate and return all possible moves of inputted colour"""
+    def generate_all_moves(self, board, colour, hashmove=None):
+        """Generate and return all possible moves of inputted colour as ((row, col), (row, col), capture value)
+        tuples, in the order the search tries them, hashmove (if given) is put first"""
+
+        if hashmove != None:
+            hashmove = board.encode_move(hashmove[0], hashmove[1], QUEEN)
+        else:
+            hashmove = NO_MOVE
+
+        # Use the spare buffers past the deepest ply
+        ply = MAX_PLY + 1
+        count = self.generate_moves(board, colour, ply, hashmove)
 
         moves = []
+        for i in range(count):
+            self.pick_move(ply, i, count)
+            move = self.movebuffers[ply][i]
+            points = 0
+            if board.board[(move >> 9) & 7][(move >> 6) & 7] != None:
+                points = board.board[(move >> 9) & 7][(move >> 6) & 7].points
+            moves.append((move_from(move), move_to(move), points))
+        return moves
+
+
+    def generate_moves(self, board, colour, ply, hashmove, captures_only=False):
+        """Generate all possible moves (or only captures) of inputted colour into the move buffer of ply as packed
+        moves, returns the number of moves. Each move gets an ordering score: hashmove first, then captures that
+        don't lose material (by static exchange), then quiet moves, then captures that lose material"""
+
+        moves = self.movebuffers[ply]
+        scores = self.scorebuffers[ply]
+        count = 0
 
         # Colour is white, start in top left to optimize move generation time (alpha/beta related)
         if colour == WHITE:
@@ -552,66 +1616,313 @@ class ChessAI():
                 if board.board[row][col] != None and board.board[row][col].colour == colour:
                     # Generate all possible moves from chosen piece
                     current = board.valid_moves(row, col)
+                    if captures_only:
+                        current = [slot for slot in current if board.board[slot[0]][slot[1]] != None]
                     # Remove moves that result in check
                     current = board.do_not_move_into_check(current, (row, col), opposite_colour(colour))
                     
-                    # Append starting and ending position of each valid move to final move list
-                    for i in range(len(current)):
-                        moves.append(((row,col), current[i]))
+                    # Add each valid move to the buffer with its score, moves with the same score are shuffled
+                    # (random part of the score)
+                    for secondslot in current:
+                        moves[count] = board.encode_move((row, col), secondslot, QUEEN)
+                        if moves[count] == hashmove:
+                            scores[count] = HASH_MOVE_ORDER*MOVE_ORDER_SCALE
+                        elif board.board[secondslot[0]][secondslot[1]] != None:
+                            # Captures by material won in the exchange on the square (or by piece captured)
+                            if self.static_exchange:
+                                exchange = board.static_exchange((row, col), secondslot)
+                                if exchange >= 0:
+                                    exchange += GOOD_CAPTURE_ORDER
+                            else:
+                                exchange = GOOD_CAPTURE_ORDER + board.board[secondslot[0]][secondslot[1]].points
+                            scores[count] = exchange*MOVE_ORDER_SCALE + self.random.randrange(MOVE_ORDER_SCALE)
+                        else:
+                            scores[count] = self.random.randrange(MOVE_ORDER_SCALE)
+                        count += 1
 
-        # If there are any moves, go to sorting function
-        if len(moves) > 0:
-            moves = self.rank_moves(board, moves)
+        return count
 
-        return moves
 
+    def pick_move(self, ply, index, count):
+        """Swaps the highest scored move from index onwards into index (sorts as the moves are searched,
+        the rest don't need sorting if there's a cutoff)"""
+
+        moves = self.movebuffers[ply]
+        scores = self.scorebuffers[ply]
+
+        best = index
+        for i in range(index + 1, count):
+            if scores[i] > scores[best]:
+                best = i
+
+        if best != index:
+            moves[index], moves[best] = moves[best], moves[index]
+            scores[index], scores[best] = scores[best], scores[index]
+
+
+class Ponderer():
+    """Searches in a background thread while the human player is thinking, so the hint
+    and the AI's reply can be taken from searches that have already finished"""
+
+    def __init__(self, ai):
+        self.ai = ai                           # The AI whose tables are filled while pondering
+        self.thread = None                     # The background thread (None when not pondering)
+        self.stop_event = threading.Event()    # Set to cancel pondering
+
+
+    def start(self, board, colour, hintdepth, replydepth):
+        """Start pondering the position for colour to move (replydepth is -1 if no AI will reply)"""
+
+        self.stop()
+
+        # Search resources are capped by time, the search checks the stop event and deadline as it goes
+        self.stop_event.clear()
+        self.ai.stop_event = self.stop_event
+        self.ai.deadline = time.monotonic() + PONDER_MAX_SECONDS
 
-    def rank_moves(self, board, moves):
-        """Sorts moves into order of how likely they are to be made/how extreme
-        they are, optimizes alpha beta and time taken for AI to select a move"""
+        # Ponder on a copy so the game's board can change while the thread runs
+        self.thread = threading.Thread(target=self.run, args=(board.make_copy(), colour, hintdepth, replydepth))
+        self.thread.daemon = True
+        self.thread.start()
 
-        scored_moves = []
-        # Assign values to each move (do they capture a piece, and what piece they captured
-        for move in moves:
-            score = 0
-            if board.board[move[1][0]][move[1][1]] != None: 
-                score += board.board[move[1][0]][move[1][1]].points
 
-            move = move + (score,)     # Add score to tuple
-            scored_moves.append(move)  # Add tuple to new list
+    def pondering(self):
+        """Returns if the background thread is still searching"""
 
-        # Sort moves by score then reverse (higher scores processed first when AI chooses move)
-        sorted_moves = sorted(scored_moves, key=lambda new: new[2])
-        sorted_moves.reverse()
+        return self.thread != None and self.thread.is_alive()
 
-        # Randomize moves that result in the same score 
-        final_list = []
-        value = sorted_moves[0][2]   # The score of the current piece in list
-        temp_list = []               # Temperary list of all moves with same current score (value)
 
-        # Go though each move
-        for x in range(len(sorted_moves)):
-            # If moved on to lower score section
-            if sorted_moves[x][2] != value:
+    def stop(self):
+        """Cancel pondering and wait for the thread to finish, the AI can be used normally afterwards"""
 
-                # Shuffle the moves from temperary list and add it to final list
-                random.shuffle(temp_list)
-                final_list.extend(temp_list)
+        if self.thread != None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
 
-                # Reset values with next score (ex 9 to 7)
-                value = sorted_moves[x][2]
-                temp_list = [sorted_moves[x]]
+        self.ai.stop_event = None
+        self.ai.deadline = None
 
-            # Append this move to temperary list of same scores
+
+    def run(self, board, colour, hintdepth, replydepth):
+        """Thread function, searches the position then the AI's replies to the most likely human moves"""
+
+        try:
+            # Analyse the human's position (used for the hint and to order the likely human moves)
+            self.ai.analyse(board, colour, hintdepth, HINT_LINES)
+
+            if replydepth == -1:
+                return
+
+            # Search the AI's reply to the most likely human moves, best move first
+            hashmove = self.ai.hashmoves.get(board.get_position_key(colour), NO_MOVE)
+            if hashmove != NO_MOVE:
+                moves = self.ai.generate_all_moves(board, colour, move_to_tuple(hashmove))
             else:
-                temp_list.append(sorted_moves[x])
+                moves = self.ai.generate_all_moves(board, colour)
+            for move in moves[:PONDER_MAX_REPLIES]:
+                new_board = board.make_copy()
+                new_board.make_move(move[0], move[1], None)
+                new_board.does_pawn_promote(move[1][0], move[1][1])
+                self.ai.search(new_board, opposite_colour(colour), replydepth)
 
-        # Shuffle and add moves of last score in list (9, 8, 5, 2, 0 (shuffle 0 score moves))
-        random.shuffle(temp_list)
-        final_list.extend(temp_list) 
-                
-        # Return the sorted list
-        return final_list
+        # Cancelled or out of time, anything finished so far stays in the AI's tables
+        except SearchStopped:
+            pass
+
+
+class MoveSearch():
+    """Searches the AI's move in a background thread, so the game keeps drawing, animating and responding to
+    the player while the AI thinks"""
+
+    def __init__(self, ai):
+        self.ai = ai                           # The AI making the move
+        self.thread = None                     # The background thread (None when not searching)
+        self.stop_event = threading.Event()    # Set to cancel the search
+        self.result = None                     # Result of the finished search (same as ChessAI.search)
+
+
+    def start(self, board, colour, depth, soft=None, hard=None):
+        """Start searching the move of colour (the AI can't be used for anything else until it's finished).
+        Playing on a clock, soft and hard are the seconds the search can take (see ChessAI.get_best_move)"""
+
+        self.stop()
+        self.result = None
+
+        # The search yields to the game's thread at each stop check (only cancelled by time on a clock)
+        self.stop_event.clear()
+        self.ai.stop_event = self.stop_event
+        self.ai.deadline = None
+
+        # Search a copy so the game's board can be drawn while the thread runs
+        self.thread = threading.Thread(target=self.run, args=(board.make_copy(), colour, depth, soft, hard))
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def searching(self):
+        """Returns if a search has been started and its result hasn't been taken yet"""
+
+        return self.thread != None
+
+
+    def done(self):
+        """Returns if the search has finished"""
+
+        return self.thread != None and not self.thread.is_alive()
+
+
+    def finish(self):
+        """Waits for the search to finish and returns its result"""
+
+        self.thread.join()
+        self.thread = None
+        self.ai.stop_event = None
+        return self.result
+
+
+    def stop(self):
+        """Cancel the search and wait for the thread to finish, the AI can be used normally afterwards"""
+
+        if self.thread != None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+            self.ai.stop_event = None
+
+
+    def run(self, board, colour, depth, soft, hard):
+        """Thread function, searches the move"""
+
+        try:
+            self.result = self.ai.search(board, colour, depth, soft, hard)
+        except SearchStopped:
+            pass
+
+
+class MateResult:
+    """The result of looking for a forced checkmate"""
+    def __init__(self, n, line, nodes, seconds):
+        self.n = n                      # Number of moves (of the attacking colour) searched
+        self.line = line                # Moves of the shortest mate (initial, final), empty if there is no mate
+        self.mate = len(line) > 0       # If there is a forced mate in n moves or less
+        self.moves = (len(line) + 1)//2 # Number of attacking moves the mate takes
+        self.nodes = nodes              # Number of positions searched
+        self.seconds = seconds          # Time taken
+
+
+class MateSolver():
+    """Finds forced checkmates (needed for puzzles). Much faster than the AI search to the same depth,
+    only checkmate matters so every move is a yes or no, the attacker's last move has to be a check,
+    and positions already proven to have no mate are never searched again"""
+
+    def __init__(self, checks_only=False):
+        self.ai = ChessAI()               # Used for generating moves
+        self.checks_only = checks_only    # Only try checking moves for the attacker (faster, only proves no mate by checks)
+        self.no_mate = {}                 # Position key -> most moves proven to have no mate
+        self.mates = {}                   # Position key -> moves of shortest mate found
+        self.nodes = 0                    # Number of positions searched
+
+
+    def solve(self, board, colour, n):
+        """Returns the shortest forced mate for colour in n moves or less, or proof that there isn't one"""
+
+        start = time.monotonic()
+        self.nodes = 0
+
+        # Try each number of moves in order, so the first mate found is the shortest
+        line = None
+        for moves in range(1, n + 1):
+            line = self.attack(board, colour, moves)
+            if line != None:
+                break
+
+        if line == None:
+            line = []
+        return MateResult(n, line, self.nodes, time.monotonic() - start)
+
+
+    def attack(self, board, colour, n):
+        """Returns moves of a mate in n for colour to move (attacker), None if there is no mate"""
+
+        self.nodes += 1
+
+        # Already proven there is no mate from this position, or already found one
+        key = board.get_position_key(colour)
+        if self.no_mate.get(key, 0) >= n:
+            return None
+        if key in self.mates and (len(self.mates[key]) + 1)//2 <= n:
+            return self.mates[key]
+
+        # Checking moves first, they are the most likely to mate
+        moves = []
+        checks = []
+        for move in self.ai.generate_all_moves(board, colour):
+            new_board = board.make_copy()
+            new_board.make_move(move[0], move[1], None)
+            new_board.does_pawn_promote(move[1][0], move[1][1])
+            if new_board.is_in_check(colour):
+                checks.append((move, new_board))
+            # Last move has to be a check to be checkmate
+            elif n > 1 and not self.checks_only:
+                moves.append((move, new_board))
+
+        for move, new_board in checks + moves:
+            line = self.defend(new_board, opposite_colour(colour), n)
+            if line != None:
+                # Remember the mate (clear the table if it has grown too big)
+                if len(self.mates) >= TABLE_MAX_ENTRIES:
+                    self.mates.clear()
+                self.mates[key] = [(move[0], move[1])] + line
+                return self.mates[key]
+
+        # Remember that there is no mate
+        if len(self.no_mate) >= TABLE_MAX_ENTRIES:
+            self.no_mate.clear()
+        self.no_mate[key] = n
+        return None
+
+
+    def defend(self, board, colour, n):
+        """Returns moves of the longest defence for colour to move (defender) if every move is mated
+        within n - 1 more attacking moves, empty if already checkmated, None if there is a way out"""
+
+        self.nodes += 1
+        incheck = board.is_in_check(opposite_colour(colour))
+
+        # Checkmate or stalemate
+        if board.get_out_check(opposite_colour(colour)) == 0:
+            if incheck:
+                return []
+            return None
+
+        # Attacker is out of moves
+        if n == 1:
+            return None
+
+        # Every move has to be mated, keep the one that takes the longest
+        longest = []
+        for move in self.ai.generate_all_moves(board, colour):
+            new_board = board.make_copy()
+            new_board.make_move(move[0], move[1], None)
+            new_board.does_pawn_promote(move[1][0], move[1][1])
+
+            # This move escapes the mate
+            line = self.attack(new_board, opposite_colour(colour), n - 1)
+            if line == None:
+                return None
+
+            # Look for a shorter mate after this move (only needed for the line, not the proof)
+            for moves in range(1, (len(line) + 1)//2):
+                shorter = self.attack(new_board, opposite_colour(colour), moves)
+                if shorter != None:
+                    line = shorter
+                    break
+
+            if len(line) + 1 > len(longest):
+                longest = [(move[0], move[1])] + line
+
+        return longest
 
 
 class Board():
@@ -624,6 +1935,7 @@ class Board():
         self.recentblack = RecentMove((-1,-1), (-1,-1), None)      # Create most recent black move
         self.recentwhite = RecentMove((-1,-1), (-1,-1), None)      # Create most recent white move
         self.incheck = [False, False]                              # Assign both colours to not in check
+        self.phase = 0                                             # Game phase (PHASE_TOTAL middlegame, 0 endgame)
 
 
     def set_up_initial_board(self):
@@ -665,6 +1977,83 @@ class Board():
         for col in range(SIZE):
             self.board[6][col] = self.pieces[WHITE][PAWN]        
 
+        self.update_phase()
+
+
+    def set_up_fen(self, fen):
+        """Set up the position written in FEN, returns the colour to move. Raises ValueError if it isn't valid"""
+
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError("Not a FEN position: " + fen)
+        rows = fields[0].split("/")
+        if len(rows) != SIZE:
+            raise ValueError("FEN position needs 8 rows: " + fen)
+
+        # Pieces, row 0 (black's side) first, white's pieces are upper case
+        self.board = create_2D_array(8, 8, None)
+        for row in range(SIZE):
+            col = 0
+            for letter in rows[row]:
+                if letter in "12345678":
+                    col += int(letter)
+                    continue
+                if letter.upper() not in "RNBQKP" or col >= SIZE:
+                    raise ValueError("Not a FEN position: " + fen)
+                colour = BLACK
+                if letter.isupper():
+                    colour = WHITE
+                self.board[row][col] = self.pieces[colour]["RNBQKP".index(letter.upper())]
+                col += 1
+            if col != SIZE:
+                raise ValueError("FEN row doesn't have 8 slots: " + rows[row])
+        if self.find_king(WHITE) == (-1, -1) or self.find_king(BLACK) == (-1, -1):
+            raise ValueError("FEN position needs both kings: " + fen)
+
+        # Colour to move
+        if fields[1] not in ("w", "b"):
+            raise ValueError("Not a colour to move: " + fields[1])
+        colour = WHITE
+        if fields[1] == "b":
+            colour = BLACK
+
+        # Castling, kings and rooks that can't castle count as having moved
+        self.moved = create_2D_array(8, 8, True)
+        rights = {"K": [(7, 4), (7, 7)], "Q": [(7, 4), (7, 0)], "k": [(0, 4), (0, 7)], "q": [(0, 4), (0, 0)]}
+        for letter in fields[2]:
+            if letter in rights:
+                for slot in rights[letter]:
+                    self.moved[slot[0]][slot[1]] = False
+
+        # En passant, the pawn that just moved two slots
+        self.recentblack = RecentMove((-1,-1), (-1,-1), None)
+        self.recentwhite = RecentMove((-1,-1), (-1,-1), None)
+        if fields[3] != "-":
+            if len(fields[3]) != 2 or fields[3][0] not in "abcdefgh" or fields[3][1] not in "36":
+                raise ValueError("Not an en passant slot: " + fields[3])
+            col = "abcdefgh".index(fields[3][0])
+            if colour == BLACK:
+                self.recentwhite = RecentMove((6, col), (4, col), PAWN)
+            else:
+                self.recentblack = RecentMove((1, col), (3, col), PAWN)
+
+        self.incheck = [False, False]
+        self.incheck[colour] = self.is_in_check(opposite_colour(colour))
+        self.update_phase()
+
+        return colour
+
+
+    def update_phase(self):
+        """Works out the game phase from the pieces on the board (needed when pieces are placed directly,
+        make_move and promote keep it up to date)"""
+
+        self.phase = 0
+        for row in range(SIZE):
+            for col in range(SIZE):
+                if self.board[row][col] != None:
+                    self.phase += PHASE_WEIGHTS[self.board[row][col].kind]
+
 
     def make_copy(self):
         """Make and return a copy of the board class instance"""
@@ -679,8 +2068,44 @@ class Board():
         # Make the list of pieces that have moved carry over
         for row in range(len(self.moved)):
             board_copy.moved[row] = copy.copy(self.moved[row])
+
+        # Make the most recent moves carry over (needed for en passant) and the game phase
+        board_copy.recentblack = self.recentblack
+        board_copy.recentwhite = self.recentwhite
+        board_copy.phase = self.phase
             
         return board_copy
+
+
+    def get_position_key(self, colour_to_move):
+        """Returns a (zobrist) hash key of the position, used to store and reuse AI searches"""
+
+        key = 0
+
+        # Pieces on the board
+        for row in range(SIZE):
+            for col in range(SIZE):
+                if self.board[row][col] != None:
+                    key ^= ZOBRIST_PIECES[self.board[row][col].colour][self.board[row][col].kind][row][col]
+
+        # Kings and rooks that haven't moved (castling)
+        for i in range(len(CASTLING_SLOTS)):
+            if not self.moved[CASTLING_SLOTS[i][0]][CASTLING_SLOTS[i][1]]:
+                key ^= ZOBRIST_CASTLING[i]
+
+        # Pawn that has just moved two squares (en passant)
+        if colour_to_move == BLACK:
+            recent = self.recentwhite
+        else:
+            recent = self.recentblack
+        if recent.kind == PAWN and abs(recent.initial[0] - recent.final[0]) == 2:
+            key ^= ZOBRIST_EN_PASSANT[recent.final[1]]
+
+        # Colour to move
+        if colour_to_move == BLACK:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+
+        return key
     
 
     def does_collide(self, row, col, validmoves, colour):
@@ -934,8 +2359,9 @@ class Board():
             self.board[firstslot[0]][5] = self.board[firstslot[0]][7]
             self.board[firstslot[0]][7] = None
             
-        # Check if piece has been captured, append to graveyard
+        # Check if piece has been captured, append to graveyard, update game phase
         if self.board[secondslot[0]][secondslot[1]] != None:
+            self.phase -= PHASE_WEIGHTS[self.board[secondslot[0]][secondslot[1]].kind]
             if graveyard != None:
                 graveyard[self.board[secondslot[0]][secondslot[1]].colour].append(self.board[secondslot[0]][secondslot[1]])
 
@@ -943,25 +2369,179 @@ class Board():
         self.board[secondslot[0]][secondslot[1]] = self.board[firstslot[0]][firstslot[1]]
         self.board[firstslot[0]][firstslot[1]] = None
 
-        # Update that piece has moved (needed for castling)
-        self.moved[firstslot[0]][firstslot[1]] = True
+        # Update that piece has moved (needed for castling)
+        self.moved[firstslot[0]][firstslot[1]] = True
+
+
+    def is_in_check(self, colour):
+        """Checks if king of opposite colour is in check"""
+
+        # Go through each spot on board, find king of opposite colour
+        for row in range(SIZE):
+            for col in range(SIZE):
+                if self.board[row][col] != None:
+                    if self.board[row][col].kind == KING and self.board[row][col].colour != colour:
+                        # If this square is attacked by the other team, this king is in check
+                        return self.is_attacked(row, col, colour)
+        return False
+
+
+    def is_attacked(self, row, col, colour):
+        """Checks if a piece of inputted colour attacks the slot, same as looking for it in create_all_moves
+        but only looks outwards from the slot (much faster)"""
+
+        # Knights
+        for dir in KNIGHT_DIRECTIONS:
+            r = row + dir[0]
+            c = col + dir[1]
+            if r >= 0 and c >= 0 and r < 8 and c < 8 and self.board[r][c] != None:
+                if self.board[r][c].colour == colour and self.board[r][c].kind == KNIGHT:
+                    return True
+
+        # Kings
+        for dir in KING_DIRECTIONS:
+            r = row + dir[0]
+            c = col + dir[1]
+            if r >= 0 and c >= 0 and r < 8 and c < 8 and self.board[r][c] != None:
+                if self.board[r][c].colour == colour and self.board[r][c].kind == KING:
+                    return True
+
+        # Pawns (white pawns attack upwards, so they are below the slot)
+        if colour == WHITE:
+            r = row + 1
+        else:
+            r = row - 1
+        if r > 0 and r < 7:
+            for c in (col - 1, col + 1):
+                if c >= 0 and c < 8 and self.board[r][c] != None:
+                    if self.board[r][c].colour == colour and self.board[r][c].kind == PAWN:
+                        return True
+
+        # Rooks, bishops and queens, look along each line until a piece or edge of board is hit
+        for dir in KING_DIRECTIONS:
+            r = row + dir[0]
+            c = col + dir[1]
+            while r >= 0 and c >= 0 and r < 8 and c < 8:
+                if self.board[r][c] != None:
+                    if self.board[r][c].colour == colour:
+                        kind = self.board[r][c].kind
+                        if kind == QUEEN:
+                            return True
+                        # Straight line (rook) or diagonal (bishop)
+                        if (dir[0] == 0 or dir[1] == 0) and kind == ROOK:
+                            return True
+                        if dir[0] != 0 and dir[1] != 0 and kind == BISHOP:
+                            return True
+                    break
+                r += dir[0]
+                c += dir[1]
+
+        return False
+
+
+    def least_valuable_attacker(self, row, col, colour):
+        """Returns the slot of the lowest point piece of inputted colour attacking the slot, (-1, -1) if none"""
+
+        best = (-1, -1)
+        points = 0
+
+        # Pawns (white pawns attack upwards, so they are below the slot)
+        if colour == WHITE:
+            r = row + 1
+        else:
+            r = row - 1
+        if r > 0 and r < 7:
+            for c in (col - 1, col + 1):
+                if c >= 0 and c < 8 and self.board[r][c] != None:
+                    if self.board[r][c].colour == colour and self.board[r][c].kind == PAWN:
+                        return (r, c)
+
+        # Knights and kings
+        for directions, kind in ((KNIGHT_DIRECTIONS, KNIGHT), (KING_DIRECTIONS, KING)):
+            for dir in directions:
+                r = row + dir[0]
+                c = col + dir[1]
+                if r >= 0 and c >= 0 and r < 8 and c < 8 and self.board[r][c] != None:
+                    if self.board[r][c].colour == colour and self.board[r][c].kind == kind:
+                        if best == (-1, -1) or self.board[r][c].points < points:
+                            best = (r, c)
+                            points = self.board[r][c].points
+
+        # Rooks, bishops and queens, first piece along each line
+        for dir in KING_DIRECTIONS:
+            r = row + dir[0]
+            c = col + dir[1]
+            while r >= 0 and c >= 0 and r < 8 and c < 8:
+                if self.board[r][c] != None:
+                    if self.board[r][c].colour == colour:
+                        kind = self.board[r][c].kind
+                        if (kind == QUEEN or ((dir[0] == 0 or dir[1] == 0) and kind == ROOK)
+                        or (dir[0] != 0 and dir[1] != 0 and kind == BISHOP)):
+                            if best == (-1, -1) or self.board[r][c].points < points:
+                                best = (r, c)
+                                points = self.board[r][c].points
+                    break
+                r += dir[0]
+                c += dir[1]
+
+        return best
+
+
+    def static_exchange(self, firstslot, secondslot):
+        """Returns the points won (negative if lost) by the move and the captures that follow on the same square,
+        each side captures with its least valuable piece and stops when capturing again would lose points"""
+
+        # Gain after each capture if the sequence stopped there
+        gains = [0]
+        if self.board[secondslot[0]][secondslot[1]] != None:
+            gains[0] = self.board[secondslot[0]][secondslot[1]].points
+
+        # Take the pieces off the board as they capture (lines open up behind them), put them back after
+        removed = [firstslot]
+        onsquare = self.board[firstslot[0]][firstslot[1]]
+        pieces = [onsquare]
+        self.board[firstslot[0]][firstslot[1]] = None
+        colour = opposite_colour(onsquare.colour)
+
+        while True:
+            slot = self.least_valuable_attacker(secondslot[0], secondslot[1], colour)
+            if slot == (-1, -1):
+                break
+            gains.append(onsquare.points - gains[-1])
+            onsquare = self.board[slot[0]][slot[1]]
+            removed.append(slot)
+            pieces.append(onsquare)
+            self.board[slot[0]][slot[1]] = None
+            colour = opposite_colour(colour)
 
+        for i in range(len(removed)):
+            self.board[removed[i][0]][removed[i][1]] = pieces[i]
 
-    def is_in_check(self, colour):
-        """Checks if king of opposite colour is in check"""
+        # Work backwards, each side either captures or stops (whichever is better for it)
+        for i in range(len(gains) - 1, 0, -1):
+            gains[i - 1] = -max(-gains[i - 1], gains[i])
+
+        return gains[0]
+
+
+    def make_null_move(self, colour):
+        """Passes the turn of inputted colour without moving (needed for AI null move pruning)"""
 
-        # Creates all possible moves for the entered colour
-        moves = self.create_all_moves(colour)
+        # Other team can't capture en passant after a pass
+        if colour == WHITE:
+            self.recentwhite = RecentMove((-1,-1), (-1,-1), None)
+        else:
+            self.recentblack = RecentMove((-1,-1), (-1,-1), None)
+
+
+    def has_non_pawn_pieces(self, colour):
+        """Returns if colour has pieces other than king and pawns"""
 
-        # Go through each spot on board
         for row in range(SIZE):
             for col in range(SIZE):
-                if self.board[row][col] != None:
-                    # Check if piece is king of opposite colour
-                    if self.board[row][col].kind == KING and self.board[row][col].colour != colour:
-                        # If this square is a possible move of other team, this king is in check
-                        if (row, col) in moves:
-                            return True
+                if self.board[row][col] != None and self.board[row][col].colour == colour:
+                    if self.board[row][col].kind != KING and self.board[row][col].kind != PAWN:
+                        return True
         return False
 
 
@@ -1013,23 +2593,96 @@ class Board():
                     return 1000
 
         # Iterate through each slot/square on board
+        count = 0
+        middlegame = 0
+        endgame = 0
         for row in range(SIZE):
             for col in range(SIZE):
-                if self.board[row][col] != None:
-                    
-                    # Piece is white, add points based on piece, add points for advancement on board (aggresive AI)
-                    if self.board[row][col].colour == WHITE:
-                        score += (self.board[row][col].points)*10
-                        score += min(7 - row, 4)
-                        # Advancement bonus. Only add points until row before pawns so no pointless sacrifices
-                            
-                    # Piece is black, subtract points based on piece, subtract points for advancement on board (aggresive AI)
-                    elif self.board[row][col].colour == BLACK:
-                        score -= (self.board[row][col].points)*10
-                        score -= min(row, 4)
-                        # Advancement bonus. Only add points until row before pawns so no pointless sacrifices
+                piece = self.board[row][col]
+                if piece != None:
+                    count += 1
+
+                    # Add the piece's value on the square it's on (tables include material, and already
+                    # subtract for black)
+                    middlegame += PIECE_SQUARE_MIDDLEGAME[piece.colour][piece.kind][row][col]
+                    endgame += PIECE_SQUARE_ENDGAME[piece.colour][piece.kind][row][col]
+
+        # Blend middlegame and endgame bonuses by the game phase
+        phase = min(max(self.phase, 0), PHASE_TOTAL)
+        score += (middlegame*phase + endgame*(PHASE_TOTAL - phase))//PHASE_TOTAL
+
+        # Endgame with three pieces left, the bitbases know if it's won or drawn
+        if count == 3:
+            result = self.probe_bitbase(colour_to_move)
+            if result == bitbase.DRAW:
+                return 0
+            elif result != None:
+                # Add bonus for the winning colour, and for pushing the losing king to the edge and corner it
+                if (result == bitbase.WIN) == (colour_to_move == WHITE):
+                    winner = WHITE
+                    sign = 1
+                else:
+                    winner = BLACK
+                    sign = -1
+                winningking = self.find_king(winner)
+                losingking = self.find_king(opposite_colour(winner))
+                edge = max(abs(2*losingking[0] - 7), abs(2*losingking[1] - 7))
+                distance = abs(winningking[0] - losingking[0]) + abs(winningking[1] - losingking[1])
+                score += sign*(BITBASE_WIN_SCORE + 2*edge + 14 - distance)
 
         return score
+
+
+    def find_king(self, colour):
+        """Returns the slot of the king of inputted colour"""
+
+        for row in range(SIZE):
+            for col in range(SIZE):
+                if self.board[row][col] != None:
+                    if self.board[row][col].kind == KING and self.board[row][col].colour == colour:
+                        return (row, col)
+        return (-1, -1)
+
+
+    def probe_bitbase(self, colour_to_move):
+        """Returns the bitbase result (bitbase.WIN, DRAW or LOSS) for colour to move, None if the
+        position isn't one of the bitbase endgames (or it hasn't been built)"""
+
+        # Find the pieces, needs two kings and a queen, rook or pawn
+        kings = [(-1, -1), (-1, -1)]
+        piece = None
+        for row in range(SIZE):
+            for col in range(SIZE):
+                if self.board[row][col] != None:
+                    if self.board[row][col].kind == KING:
+                        kings[self.board[row][col].colour] = (row, col)
+                    elif piece == None:
+                        piece = (row, col)
+                    else:
+                        return None
+        if piece == None or kings[BLACK] == (-1, -1) or kings[WHITE] == (-1, -1):
+            return None
+
+        # Bitbases have the strong side moving up the board (like white), flip the board if it's black
+        strong = self.board[piece[0]][piece[1]].colour
+        kind = self.board[piece[0]][piece[1]].kind
+        if kind == QUEEN:
+            endgame = bitbase.KQK
+        elif kind == ROOK:
+            endgame = bitbase.KRK
+        elif kind == PAWN:
+            endgame = bitbase.KPK
+        else:
+            return None
+
+        squares = []
+        for slot in (kings[strong], kings[opposite_colour(strong)], piece):
+            if strong == WHITE:
+                squares.append(slot[0]*8 + slot[1])
+            else:
+                squares.append((7 - slot[0])*8 + slot[1])
+
+        return BITBASES.probe(endgame, colour_to_move == strong, squares[0], squares[1], squares[2])
     
 
     def does_pawn_promote(self, row, col):
@@ -1040,9 +2693,172 @@ class Board():
         if self.board[row][col].kind == PAWN:
             if (colour == BLACK and row == 7) or (colour == WHITE and row == 0):
                 # Change piece to queen
-                self.board[row][col] = self.pieces[colour][QUEEN]
+                self.promote(row, col, QUEEN)
+
+
+    def promote(self, row, col, kind):
+        """Changes the pawn on the slot into inputted piece kind, updates game phase"""
+
+        self.board[row][col] = self.pieces[self.board[row][col].colour][kind]
+        self.phase += PHASE_WEIGHTS[kind]
     
 
+    def encode_move(self, firstslot, secondslot, promotion):
+        """Returns the packed move from firstslot to secondslot, with its flag (promotion is the piece a pawn
+        reaching the other side turns into)"""
+
+        piece = self.board[firstslot[0]][firstslot[1]]
+
+        # Pawn reaching other side of board
+        if piece.kind == PAWN and (secondslot[0] == 0 or secondslot[0] == 7):
+            return encode_move(firstslot, secondslot, promotion, MOVE_PROMOTION)
+        # Pawn moving diagonally to an empty square
+        if piece.kind == PAWN and firstslot[1] != secondslot[1] and self.board[secondslot[0]][secondslot[1]] == None:
+            return encode_move(firstslot, secondslot, 0, MOVE_EN_PASSANT)
+        # King moving two squares
+        if piece.kind == KING and abs(firstslot[1] - secondslot[1]) == 2:
+            return encode_move(firstslot, secondslot, 0, MOVE_CASTLING)
+        return encode_move(firstslot, secondslot, 0, MOVE_NORMAL)
+
+
+    def play_move(self, move, graveyard):
+        """Makes a packed move, including promoting the pawn"""
+
+        secondslot = move_to(move)
+        self.make_move(move_from(move), secondslot, graveyard)
+        if move_flag(move) == MOVE_PROMOTION:
+            self.promote(secondslot[0], secondslot[1], move_promotion(move))
+
+
+    def get_san(self, firstslot, secondslot, promotion):
+        """Returns the move (not made yet) in SAN, e.g. "Nbd7", "exd5", "O-O", "e8=Q+" (promotion is the piece
+        a pawn reaching the other side turns into)"""
+
+        piece = self.board[firstslot[0]][firstslot[1]]
+        move = self.encode_move(firstslot, secondslot, promotion)
+        capture = self.board[secondslot[0]][secondslot[1]] != None or move_flag(move) == MOVE_EN_PASSANT
+
+        # Castling
+        if move_flag(move) == MOVE_CASTLING:
+            if secondslot[1] > firstslot[1]:
+                san = "O-O"
+            else:
+                san = "O-O-O"
+
+        # Pawn, file it came from if capturing
+        elif piece.kind == PAWN:
+            san = ""
+            if capture:
+                san = slot_name(firstslot)[0] + "x"
+            san += slot_name(secondslot)
+            if move_flag(move) == MOVE_PROMOTION:
+                san += "=" + SAN_PIECES[promotion]
+
+        else:
+            # Another piece of the same kind that can move to the same slot, add file (or row, or both) it came from
+            samefile = False
+            samerow = False
+            ambiguous = False
+            for row in range(SIZE):
+                for col in range(SIZE):
+                    other = self.board[row][col]
+                    if (other != None and other.colour == piece.colour and other.kind == piece.kind
+                    and (row, col) != firstslot):
+                        current = self.do_not_move_into_check(self.valid_moves(row, col), (row, col),
+                                                              opposite_colour(piece.colour))
+                        if secondslot in current:
+                            ambiguous = True
+                            if col == firstslot[1]:
+                                samefile = True
+                            if row == firstslot[0]:
+                                samerow = True
+
+            san = SAN_PIECES[piece.kind]
+            if ambiguous:
+                if not samefile:
+                    san += slot_name(firstslot)[0]
+                elif not samerow:
+                    san += slot_name(firstslot)[1]
+                else:
+                    san += slot_name(firstslot)
+            if capture:
+                san += "x"
+            san += slot_name(secondslot)
+
+        # Check or checkmate
+        new_board = self.make_copy()
+        new_board.play_move(move, None)
+        if new_board.is_in_check(piece.colour):
+            if new_board.get_out_check(piece.colour) == 0:
+                san += "#"
+            else:
+                san += "+"
+
+        return san
+
+
+    def parse_san(self, san, colour):
+        """Returns the packed move of colour written in SAN, raises ValueError if it isn't a legal move"""
+
+        text = san.rstrip("+#!?")
+        if colour == WHITE:
+            backrow = 7
+        else:
+            backrow = 0
+
+        # Castling, king moves two slots
+        if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+            candidates = [(backrow, 4)]
+            if len(text) == 3:
+                secondslot = (backrow, 6)
+            else:
+                secondslot = (backrow, 2)
+            promotion = QUEEN
+
+        else:
+            # Promotion piece at the end
+            promotion = QUEEN
+            if len(text) > 0 and text[-1] in "RNBQ":
+                promotion = SAN_PIECES.index(text[-1])
+                text = text[:-1].rstrip("=")
+
+            # Piece letter at the start (none for pawns), slot at the end, anything else tells where it came from
+            kind = PAWN
+            if len(text) > 0 and text[0] in "RNBQK":
+                kind = SAN_PIECES.index(text[0])
+                text = text[1:]
+            if len(text) < 2 or text[-2] not in "abcdefgh" or text[-1] not in "12345678":
+                raise ValueError("Not a move: " + san)
+            secondslot = (SIZE - int(text[-1]), "abcdefgh".index(text[-2]))
+            origin = text[:-2].replace("x", "")
+
+            # Pieces that fit what's written (pawns that don't capture stay on the same file)
+            candidates = []
+            for row in range(SIZE):
+                for col in range(SIZE):
+                    piece = self.board[row][col]
+                    if piece == None or piece.colour != colour or piece.kind != kind:
+                        continue
+                    name = slot_name((row, col))
+                    if any(letter != name[0] and letter != name[1] for letter in origin):
+                        continue
+                    if kind == PAWN and origin == "" and col != secondslot[1]:
+                        continue
+                    candidates.append((row, col))
+
+        # Only one of them can legally move to the slot
+        moves = []
+        for firstslot in candidates:
+            current = self.do_not_move_into_check(self.valid_moves(firstslot[0], firstslot[1]), firstslot,
+                                                  opposite_colour(colour))
+            if secondslot in current:
+                moves.append(firstslot)
+        if len(moves) != 1:
+            raise ValueError("Not a legal move: " + san)
+
+        return self.encode_move(moves[0], secondslot, promotion)
+
+
     def get_out_check(self, colour_just_moved):
         """Returns if player has any valid moves or not"""
         
@@ -1060,17 +2876,348 @@ class Board():
         return 0
 
 
+class PerformanceMonitor():
+    """Frame time, FPS, click latency and the AI's last search, shown in an overlay (PERFORMANCE_KEY) and
+    written to a log every PERFORMANCE_LOG_SECONDS if a log file is given (CSV, or JSON lines if it ends in
+    .json or .jsonl). The log is rolled over once it reaches PERFORMANCE_LOG_MAX_BYTES"""
+
+    def __init__(self, logpath=None):
+        self.visible = False                                   # If the overlay is shown
+        self.framestarts = deque(maxlen=PERFORMANCE_FRAMES)   # Start time (perf_counter) of recent frames
+        self.frametimes = deque(maxlen=PERFORMANCE_FRAMES)    # Seconds taken to draw and show recent frames
+        self.maxframe = 0                                      # Longest frame since the last log row (seconds)
+        self.clicktime = None       # Time the last click was processed, until a frame has shown it
+        self.clicklatency = None    # Seconds from the last click being processed to the frame showing it
+        self.logpath = logpath      # Log file, None if not logging
+        self.lastlog = time.perf_counter()
+
+
+    def toggle(self):
+        """Shows or hides the overlay"""
+
+        self.visible = not self.visible
+
+
+    def click(self):
+        """Called when a click is processed, the next frame shown gives its latency"""
+
+        self.clicktime = time.perf_counter()
+
+
+    def frame_finished(self, start, ai):
+        """Called once a frame started at start (perf_counter) has been shown, writes a log row if it's time"""
+
+        now = time.perf_counter()
+        self.framestarts.append(start)
+        self.frametimes.append(now - start)
+        self.maxframe = max(self.maxframe, now - start)
+        if self.clicktime != None:
+            self.clicklatency = now - self.clicktime
+            self.clicktime = None
+
+        if self.logpath != None and now - self.lastlog >= PERFORMANCE_LOG_SECONDS:
+            self.lastlog = now
+            self.write_log(ai)
+            self.maxframe = 0
+
+
+    def fps(self):
+        """Returns the frames per second over the recent frames, 0 if there aren't enough yet"""
+
+        if len(self.framestarts) < 2 or self.framestarts[-1] == self.framestarts[0]:
+            return 0
+        return (len(self.framestarts) - 1)/(self.framestarts[-1] - self.framestarts[0])
+
+
+    def frame_time(self):
+        """Returns the average seconds taken by the recent frames"""
+
+        if len(self.frametimes) == 0:
+            return 0
+        return sum(self.frametimes)/len(self.frametimes)
+
+
+    def row(self, ai):
+        """Returns the current numbers as a log row (dictionary of PERFORMANCE_FIELDS)"""
+
+        row = {"time": round(time.time(), 3), "fps": round(self.fps(), 1),
+               "frame_ms": round(self.frame_time()*1000, 2), "max_frame_ms": round(self.maxframe*1000, 2),
+               "click_latency_ms": None, "search_seconds": None, "search_depth": None, "search_nodes": None}
+        if self.clicklatency != None:
+            row["click_latency_ms"] = round(self.clicklatency*1000, 2)
+        if ai.laststats != None:
+            row["search_seconds"] = round(ai.laststats[0], 3)
+            row["search_depth"] = ai.laststats[1]
+            row["search_nodes"] = ai.laststats[2]
+        return row
+
+
+    def write_log(self, ai):
+        """Adds a row to the log, rolls the log over first if it's full. Logging stops if the file can't be written"""
+
+        json_lines = self.logpath.endswith(".json") or self.logpath.endswith(".jsonl")
+        try:
+            # Roll over, log.1 is the newest old log
+            if os.path.exists(self.logpath) and os.path.getsize(self.logpath) >= PERFORMANCE_LOG_MAX_BYTES:
+                for number in range(PERFORMANCE_LOG_FILES - 1, 0, -1):
+                    if os.path.exists(self.logpath + "." + str(number)):
+                        os.replace(self.logpath + "." + str(number), self.logpath + "." + str(number + 1))
+                os.replace(self.logpath, self.logpath + ".1")
+
+            new = not os.path.exists(self.logpath)
+            with open(self.logpath, "a", newline="") as file:
+                if json_lines:
+                    file.write(json.dumps(self.row(ai)) + "\n")
+                else:
+                    writer = csv.DictWriter(file, PERFORMANCE_FIELDS)
+                    if new:
+                        writer.writeheader()
+                    writer.writerow(self.row(ai))
+        except OSError:
+            self.logpath = None
+
+
+    def draw(self, windowSurface, ai):
+        """Draws the overlay over the top left of the board"""
+
+        lines = ["FPS: " + str(round(self.fps(), 1)),
+                 "Frame: " + str(round(self.frame_time()*1000, 2)) + " ms (max " +
+                 str(round(max(self.frametimes, default=0)*1000, 1)) + " ms)"]
+        if self.clicklatency != None:
+            lines.append("Click latency: " + str(round(self.clicklatency*1000, 1)) + " ms")
+        else:
+            lines.append("Click latency: -")
+        if ai.laststats != None:
+            seconds, depth, nodes = ai.laststats
+            lines.append("Search: " + str(round(seconds, 3)) + " s, depth " + str(depth))
+            lines.append("Nodes: " + str(nodes) + " (" + str(round(nodes/max(seconds, 0.000001))) + " per second)")
+        else:
+            lines.append("Search: -")
+
+        # Dark see-through box behind the text
+        rect = LAYOUT.rect(55, 55, 270, 10 + 20*len(lines))
+        box = pygame.Surface(rect.size, SRCALPHA)
+        box.fill((0, 0, 0, 170))
+        windowSurface.blit(box, rect)
+
+        font = LAYOUT.font("Arial", 16)
+        for i in range(len(lines)):
+            draw_text(lines[i], font, windowSurface, 62, 60 + 20*i, WHITE_COLOUR)
+
+
+class BoardRenderer():
+    """Draws boards onto surfaces of one size (the board area of the game's window, or offscreen surfaces for
+    images), the board and piece images are scaled to the size once and kept"""
+
+    def __init__(self, size):
+        self.size = size                                  # Width and height of the rendered board
+        self.scale = size/BOARD_IMAGE_SIZE                # Scale of the sizes in the game
+        self.pieces = create_pieces(False)                # Pieces (without images) for setting up boards
+        self.boardimage = pygame.transform.smoothscale(load_image(os.path.join(IMAGE_FOLDER, "board.png")),
+                                                       (size, size))
+        self.pieceimages = {}                             # (colour, kind) -> piece image scaled to the size
+
+
+    def piece_image(self, piece):
+        """Returns the image of the piece scaled to the size, loads and scales it the first time"""
+
+        key = (piece.colour, piece.kind)
+        if key not in self.pieceimages:
+            filename = COLOUR_NAMES[piece.colour] + "_" + PIECE_NAMES[piece.kind] + ".png"
+            side = round(PIECE_SIZE*self.scale)
+            self.pieceimages[key] = pygame.transform.smoothscale(load_image(os.path.join(IMAGE_FOLDER, filename)),
+                                                                 (side, side))
+        return self.pieceimages[key]
+
+
+    def square_rect(self, slot, flipped):
+        """Returns the rectangle of the slot's square (rows and columns reversed if the board is flipped)"""
+
+        row, col = slot
+        if flipped:
+            row, col = SIZE - 1 - row, SIZE - 1 - col
+        left = round(col*SQUARE_SIZE*self.scale)
+        top = round(row*SQUARE_SIZE*self.scale)
+        right = round((col + 1)*SQUARE_SIZE*self.scale)
+        bottom = round((row + 1)*SQUARE_SIZE*self.scale)
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+
+    def render(self, board, colour=None, lastmove=None, hint=None, selected=None, validmoves=(), flipped=False,
+               surface=None, hidden=()):
+        """Draws the board onto surface (a new one if None) and returns it. lastmove and hint are (from, to)
+        slots, selected is the slot of the selected piece and validmoves the slots it can move to, the king
+        of colour (the colour to move, if given) is highlighted if it's in check. Flipped draws black's side
+        at the bottom. Pieces on the hidden slots aren't drawn (they're being animated)"""
+
+        if surface == None:
+            surface = pygame.Surface((self.size, self.size))
+        surface.fill(WHITE_COLOUR)
+        surface.blit(self.boardimage, (0, 0))
+
+        # Squares of the last move and a king in check are tinted
+        incheck = colour != None and board.is_in_check(opposite_colour(colour))
+        if lastmove != None or incheck:
+            tint = pygame.Surface((self.size, self.size), SRCALPHA)
+            if lastmove != None:
+                for slot in lastmove:
+                    tint.fill(LAST_MOVE_HIGHLIGHT, self.square_rect(slot, flipped))
+            if incheck:
+                tint.fill(CHECK_HIGHLIGHT, self.square_rect(board.find_king(colour), flipped))
+            surface.blit(tint, (0, 0))
+
+        # Boxes around the hint (red) and selected piece (lime)
+        width = max(1, round(BOX_WIDTH*self.scale))
+        if hint != None:
+            for slot in hint:
+                pygame.draw.rect(surface, RED_COLOUR, self.square_rect(slot, flipped), width)
+        if selected != None:
+            pygame.draw.rect(surface, LIME_COLOUR, self.square_rect(selected, flipped), width)
+
+        # Circles on the squares the selected piece can move to
+        radius = max(1, round(MOVE_CIRCLE_RADIUS*self.scale))
+        for slot in validmoves:
+            centre = self.square_rect(slot, flipped).center
+            gfxdraw.aacircle(surface, centre[0], centre[1], radius, LIME_COLOUR)
+            gfxdraw.filled_circle(surface, centre[0], centre[1], radius, LIME_COLOUR)
+
+        # Pieces
+        offset = round(PIECE_OFFSET*self.scale)
+        for row in range(SIZE):
+            for col in range(SIZE):
+                if board.board[row][col] != None and (row, col) not in hidden:
+                    rect = self.square_rect((row, col), flipped)
+                    surface.blit(self.piece_image(board.board[row][col]), (rect.left + offset, rect.top + offset))
+
+        return surface
+
+
+    def render_game(self, fen, moves, flipped=False):
+        """Generator, yields a surface of the starting position then one after each SAN move (with the move
+        highlighted). The same surface is drawn on each time, so copy it to keep a frame. Raises ValueError at
+        a move that isn't legal"""
+
+        board = Board(self.pieces)
+        colour = board.set_up_fen(fen)
+        surface = pygame.Surface((self.size, self.size))
+        yield self.render(board, colour, flipped=flipped, surface=surface)
+
+        for san in moves:
+            move = board.parse_san(san, colour)
+            board.play_move(move, None)
+            colour = opposite_colour(colour)
+            yield self.render(board, colour, (move_from(move), move_to(move)), flipped=flipped, surface=surface)
+
+
+class MoveAnimation():
+    """Pieces sliding from one slot to another (the moved piece, and the rook when castling). Moves on in
+    fixed steps of TIMESTEP however long frames take, and is drawn part way between steps. Only the
+    rectangles around the sliding pieces are drawn and updated, the rest of the window is left as it was"""
+
+    def __init__(self, sprites):
+        self.sprites = sprites             # (piece, from slot, to slot) of each sliding piece
+        self.steps = max(1, round(MOVE_SECONDS/TIMESTEP))   # Number of steps the slide takes
+        self.step = 0                      # Steps taken so far
+        self.accumulator = 0               # Seconds passed that haven't made a whole step yet
+        self.last = time.perf_counter()    # Time the animation was last moved on
+        self.background = None             # Copy of the window without the sliding pieces
+        self.drawn = []                    # Window rectangles the sliding pieces were drawn at last frame
+
+
+    def hidden(self):
+        """Returns the slots whose pieces are drawn by the animation instead of the board"""
+
+        return [sprite[2] for sprite in self.sprites]
+
+
+    def advance(self):
+        """Moves the animation on by the whole steps that fit in the time passed"""
+
+        now = time.perf_counter()
+        self.accumulator += now - self.last
+        self.last = now
+        while self.accumulator >= TIMESTEP and self.step < self.steps:
+            self.step += 1
+            self.accumulator -= TIMESTEP
+
+
+    def finished(self):
+        """Returns if the pieces have reached their new slots"""
+
+        return self.step >= self.steps
+
+
+    def progress(self):
+        """Returns how far along the slide is drawn (0 to 1), eased in and out"""
+
+        fraction = min(1, (self.step + min(1, self.accumulator/TIMESTEP))/self.steps)
+        return fraction*fraction*(3 - 2*fraction)
+
+
+    def draw(self, windowSurface):
+        """Draws the sliding pieces, restores the background where they were last frame and updates only
+        those rectangles of the window"""
+
+        for rect in self.drawn:
+            windowSurface.blit(self.background, rect, rect)
+
+        progress = self.progress()
+        rects = []
+        for piece, firstslot, secondslot in self.sprites:
+            left = 55 + (firstslot[1] + (secondslot[1] - firstslot[1])*progress)*(600/8)
+            top = 55 + (firstslot[0] + (secondslot[0] - firstslot[0])*progress)*(600/8)
+            rects.append(LAYOUT.draw_image(windowSurface, piece.source, left, top, 65, 65))
+
+        pygame.display.update(self.drawn + rects)
+        self.drawn = rects
+
+
+class GameState():
+    """How the game was after a move (or at the start), kept so moves can be undone and redone. Everything
+    is copied, so putting the game back is the same amount of work however long the game is"""
+
+    def __init__(self, game):
+        self.board = game.board.make_copy()                # Board position (with moved pieces and en passant)
+        self.incheck = list(game.board.incheck)            # If each colour is in check
+        self.graveyard = [list(row) for row in game.graveyard]  # Captured pieces
+        self.whitescore = game.whitescore                  # Scores of each team
+        self.blackscore = game.blackscore
+        self.win = list(game.win)                          # If each team has won
+        self.tie = game.tie                                # If the game is tied
+        self.turn = game.turn                              # Colour to move
+
+
+    def restore(self, game):
+        """Puts the game back to this state (copies again, so this state stays the same if the game goes on)"""
+
+        game.board = self.board.make_copy()
+        game.board.incheck = list(self.incheck)
+        game.graveyard = [list(row) for row in self.graveyard]
+        game.whitescore = self.whitescore
+        game.blackscore = self.blackscore
+        game.win = list(self.win)
+        game.tie = self.tie
+        game.turn = self.turn
+        game.game_over = self.win[BLACK] or self.win[WHITE] or self.tie
+
+
 class Game():
     """Represents an instance of the game"""
 
-    def __init__(self, AI, difficulty):
+    def __init__(self, AI, difficulty, cache=None, performance=None, timecontrol=None):
         """Constructor. Create all attributes and initialize the game"""
 
         self.game_over = False
 
+        # Frame, click and search numbers (kept from game to game, so the overlay and log carry on)
+        if performance == None:
+            performance = PerformanceMonitor()
+        self.performance = performance
+
         # Load the background board image in
         surfaceimage = load_image("board.png")
         self.surfaceboard = Surfaceboard(surfaceimage)
+        self.renderer = None        # Draws the board area, made again when the window is resized
 
         # Load the home icon image in
         homeiconimage = load_image("home_icon.png")
@@ -1088,42 +3235,12 @@ class Game():
         hintimage = load_image("lightbulb.png")
         self.hinticon = HintIcon(hintimage, 5, 877)
 
-        # Create pieces list
-        self.pieces = create_2D_array(2, 6, None)
-
         # Create graveyard list (captures)
         self.graveyard = create_2D_array(2, 1, None)
 
 
-        # Load and create the pieces:
-        # ---------------------------
-        # BLACK
-        brimage = load_image("black_rook.png")
-        self.pieces[BLACK][ROOK] = Piece(brimage, BLACK, ROOK, 5)
-        bkimage = load_image("black_knight.png")
-        self.pieces[BLACK][KNIGHT] = Piece(bkimage, BLACK, KNIGHT, 3)
-        bbimage = load_image("black_bishop.png")
-        self.pieces[BLACK][BISHOP] = Piece(bbimage, BLACK, BISHOP, 3)
-        bqimage = load_image("black_queen.png")
-        self.pieces[BLACK][QUEEN] = Piece(bqimage, BLACK, QUEEN, 9)
-        bgimage = load_image("black_king.png")
-        self.pieces[BLACK][KING] = Piece(bgimage, BLACK, KING, 1000)
-        bpimage = load_image("black_pawn.png")
-        self.pieces[BLACK][PAWN] = Piece(bpimage, BLACK, PAWN, 1)
-
-        # WHITE
-        wrimage = load_image("white_rook.png")
-        self.pieces[WHITE][ROOK] = Piece(wrimage, WHITE, ROOK, 5)
-        wkimage = load_image("white_knight.png")
-        self.pieces[WHITE][KNIGHT] = Piece(wkimage, WHITE, KNIGHT, 3)
-        wbimage = load_image("white_bishop.png")
-        self.pieces[WHITE][BISHOP] = Piece(wbimage, WHITE, BISHOP, 3)
-        wqimage = load_image("white_queen.png")
-        self.pieces[WHITE][QUEEN] = Piece(wqimage, WHITE, QUEEN, 9)
-        wgimage = load_image("white_king.png")
-        self.pieces[WHITE][KING] = Piece(wgimage, WHITE, KING, 1000)
-        wpimage = load_image("white_pawn.png")
-        self.pieces[WHITE][PAWN] = Piece(wpimage, WHITE, PAWN, 1)
+        # Load and create the pieces
+        self.pieces = create_pieces(True)
 
         # Instantiate board with pieces
         self.board = Board(self.pieces)
@@ -1139,12 +3256,25 @@ class Game():
         self.AI = AI                  # If the AI is runnning or not (boolean)
         self.difficulty = difficulty  # The difficulty of the AI (how much depth for recursion)
 
+        # Set up the AI (used for hints and AI moves) with searches kept between runs, and pondering on the
+        # human player's time
+        self.ai = ChessAI(cache=cache, openings=OPENINGS)
+        self.ponderer = Ponderer(self.ai)
+        self.mover = MoveSearch(self.ai)    # Searches the AI's moves without stopping the game
+
+        # Pieces sliding after a move (None when nothing is moving)
+        self.animation = None
+
         # Set up sound effects
         self.piecemovesound = pygame.mixer.Sound("chess_piece_move.mp3")
         self.soundeffects = True
 
         # Set hint, firstslot, and validmoves to unselected
         self.hint = ((-1, -1), (-1, -1))
+        self.hintexchange = None      # Points won by the hint if it's a capture (by static exchange)
+        self.hintlines = []           # Best moves shown with the hint (AnalysisLine), best first
+        self.hintopenings = []        # Moves from the opening index shown with the hint, (SAN, games, score)
+        self.hintkey = None           # Analysis the hint is waiting for the ponderer to finish, None if not waiting
         self.firstslot = (-1, -1)
         self.validmoves = []
 
@@ -1162,6 +3292,25 @@ class Game():
         # If the home button has been clicked
         self.home_button = False    
 
+        # Moves made so far in SAN (for saving the game as PGN), moves after the current one can be redone
+        self.moves = []
+
+        # State after each move (for undo and redo), the game is at state number historyindex, which is also
+        # the number of moves made
+        self.history = [GameState(self)]
+        self.historyindex = 0
+
+        # Legal moves of pieces in positions already seen, (position key, slot) -> moves
+        self.legalmoves = {}
+
+        # Clocks of each player (None if the game isn't timed), white's starts running straight away
+        self.timecontrol = timecontrol
+        self.clock = None
+        self.flagged = False          # If the game was lost on time
+        if timecontrol != None:
+            self.clock = chess_clock.ChessClock(timecontrol)
+            self.clock.start(WHITE)
+
 
     def process_events(self, windowSurface):
         """Respond to keyboard and mouse clicks within the game"""
@@ -1172,62 +3321,91 @@ class Game():
             elif event.type == KEYUP:
                 if event.key == K_ESCAPE:
                     terminate()
+                # Left and right arrows undo and redo moves
+                elif event.key == K_LEFT:
+                    self.undo()
+                elif event.key == K_RIGHT:
+                    self.redo()
+                # Show or hide the performance overlay
+                elif event.key == PERFORMANCE_KEY:
+                    self.performance.toggle()
+            elif event.type == VIDEORESIZE:
+                # Window drawn again at the new size, a sliding piece jumps to its slot
+                LAYOUT.resize(event.w, event.h)
+                self.animation = None
             elif event.type == MOUSEBUTTONUP:
+                pos = LAYOUT.to_design(event.pos)    # Click in design co-ordinates
+                self.performance.click()
+
+                # Undo button clicked on
+                if (pos[0] >= 760 and pos[0] < 810
+                and pos[1] >= 5 and pos[1] < 40):
+                    self.undo()
+
+                # Redo button clicked on
+                elif (pos[0] >= 815 and pos[0] < 865
+                and pos[1] >= 5 and pos[1] < 40):
+                    self.redo()
 
                 # Home button clicked on
-                if (event.pos[0] >= 960 and event.pos[0] < 995
-                and event.pos[1] >= 5 and event.pos[1] < 40):
+                elif (pos[0] >= 960 and pos[0] < 995
+                and pos[1] >= 5 and pos[1] < 40):
                     # Return to main menu
                     self.home_button = True
 
                 # Sound button clicked on
-                elif (event.pos[0] >= 920 and event.pos[0] < 955
-                and event.pos[1] >= 5 and event.pos[1] < 40):
+                elif (pos[0] >= 920 and pos[0] < 955
+                and pos[1] >= 5 and pos[1] < 40):
                     # Turn on/off sound effects
                     if self.soundeffects:
                         self.soundeffects = False
                     else:
                         self.soundeffects = True
 
-                # Hint button clicked on
-                elif (event.pos[0] >= 877 and event.pos[0] < 912
-                and event.pos[1] >= 5 and event.pos[1] < 40):
+                # Hint button clicked on (not while the AI is thinking, it can only search one thing at a time)
+                elif (pos[0] >= 877 and pos[0] < 912
+                and pos[1] >= 5 and pos[1] < 40 and not self.mover.searching()):
                     # De-select hint
-                    if self.hint != ((-1, -1), (-1, -1)):
+                    if self.hint != ((-1, -1), (-1, -1)) or self.hintkey != None:
                         self.hint = ((-1, -1), (-1, -1))
-                    # Run AI for the hint, update self.hint with best move, to and from of piece
+                        self.hintkey = None
+                    # The hint is the ponderer's analysis of this position, it's shown once the analysis has
+                    # finished (instant if it already has), the window keeps responding meanwhile
                     else:
-                        ai = ChessAI()
-                        stats = ai.get_best_move(self.board, self.turn, HARD, 1000, -1000)
-                        self.hint = (stats[1], stats[2])
+                        self.hintkey = (self.board.get_position_key(self.turn), HARD, HINT_LINES)
+                        if self.hintkey not in self.ai.analyses and not self.ponderer.pondering():
+                            self.start_pondering()
+                        self.update_hint()
 
-                # Within the actual chess board
-                elif (event.pos[0] >= 50 and event.pos[0] < 650 and
-                    event.pos[1] >= 50 and event.pos[1] < 650):
+                # Within the actual chess board (the AI's pieces can't be moved while it's thinking)
+                elif (pos[0] >= 50 and pos[0] < 650 and
+                    pos[1] >= 50 and pos[1] < 650 and not self.mover.searching()):
 
                     # If first click has not been made (haven't selected a piece yet)
                     if self.firstslot == (-1, -1):
 
                         # Get the slot of the piece selected (transfer co-ordinates to slot in array)
-                        slot = self.get_slot((event.pos[0], event.pos[1]))
+                        slot = self.get_slot(pos)
 
                         # Nothing happens if user clicks a blank spot (not a piece) or clicks on the other team
                         if (self.board.board[slot[0]][slot[1]] != None
                         and self.board.board[slot[0]][slot[1]].colour == self.turn):
                             
-                            # Generate valid moves of selected piece
-                            self.validmoves = self.board.valid_moves(slot[0], slot[1])
-
-                            # Get rid of moves that move into check
-                            self.validmoves = self.board.do_not_move_into_check(self.validmoves, slot,
-                                                                                opposite_colour(self.board.board[slot[0]][slot[1]].colour))
+                            # Generate valid moves of selected piece, and get rid of moves that move into check
+                            # (kept for when this position is seen again, e.g. after undo)
+                            key = (self.board.get_position_key(self.turn), slot)
+                            if key not in self.legalmoves:
+                                self.validmoves = self.board.valid_moves(slot[0], slot[1])
+                                self.legalmoves[key] = self.board.do_not_move_into_check(self.validmoves, slot,
+                                                                                         opposite_colour(self.board.board[slot[0]][slot[1]].colour))
+                            self.validmoves = self.legalmoves[key]
                                            
                             # If no valid moves, don't let them select this piece
                             if len(self.validmoves) > 0:
                                 self.firstslot = slot
 
                     # Lets the player can de-select a piece
-                    elif self.get_slot((event.pos[0], event.pos[1])) == self.firstslot:
+                    elif self.get_slot(pos) == self.firstslot:
                         self.firstslot = (-1, -1)
                         self.validmoves = []
                             
@@ -1235,12 +3413,17 @@ class Game():
                     else:
                         
                         # Get the slot of the piece selected (transfer co-ordinates to slot in array)
-                        secondslot = self.get_slot((event.pos[0], event.pos[1]))
+                        secondslot = self.get_slot(pos)
 
                         # If the spot they clicked on is a valid move
                         if secondslot in self.validmoves:
 
-                            # Make the move
+                            # Stop pondering, the AI is needed for the reply (or next player's pondering)
+                            self.ponderer.stop()
+
+                            # Make the move (board before it is kept to write the move in SAN)
+                            firstslot = self.firstslot
+                            before = self.board.make_copy()
                             self.board.make_move(self.firstslot, secondslot, self.graveyard)
 
                             # If sound effects on, play sound effect for moving a piece
@@ -1252,56 +3435,102 @@ class Game():
                             self.firstslot = (-1, -1)
                             self.validmoves = []
 
-                            # Check if pawns have reached other side (for players, not AI)
-                            if self.turn == BLACK and not self.AI:
+                            # Check if pawns have reached other side (for players, not AI), the move is shown
+                            # under the promotion options instead of sliding
+                            promotes = before.board[firstslot[0]][firstslot[1]].kind == PAWN and secondslot[0] in (0, 7)
+                            if promotes and self.turn == BLACK and not self.AI:
                                 self.display_frame(windowSurface)
                                 self.check_if_pawns_at_end(windowSurface, 7, BLACK)
-                            else:
+                            elif promotes:
                                 self.display_frame(windowSurface)
                                 self.check_if_pawns_at_end(windowSurface, 0, WHITE)
 
+                            # Record the move (after promotion, which is part of it)
+                            self.record_move(before, firstslot, secondslot)
+
                             # Update game conditions
                             self.update_check_conditions()
-                            # Switch the turn
+                            # Switch the turn (and the clocks)
                             self.turn = opposite_colour(self.turn)
+                            self.press_clock()
+                            # Keep the game's state for undo
+                            self.save_state()
+
+                            # Slide the moved piece to its new slot
+                            if not promotes:
+                                self.start_animation(windowSurface, before, firstslot, secondslot)
+
+                            # Two player game, ponder for the next player's hint
+                            if not self.AI:
+                                self.start_pondering()
 
                          
     def display_frame(self, windowSurface):
         """Update the screen of main game"""
+
+        start = time.perf_counter()
+        self.draw_frame(windowSurface)
+
+        # Update the screen
+        pygame.display.update()
+        self.performance.frame_finished(start, self.ai)
+
+
+    def draw_frame(self, windowSurface):
+        """Draw the main game onto the surface (the window or an offscreen surface of the same size)"""
         
         # Draw tan background onto the surface
         windowSurface.fill(TAN_COLOUR)
         
         # Draw outline of board (rectangle (square) under board)
-        pygame.draw.rect(windowSurface, BLACK_COLOUR, (self.surfaceboard.rect.left-5,
-                                                      self.surfaceboard.rect.top-5,
-                                                      self.surfaceboard.rect.width+10,
-                                                      self.surfaceboard.rect.height+10))
-        # Draw white squares on board (rectangle (square) under transparent board)
-        pygame.draw.rect(windowSurface, WHITE_COLOUR, (self.surfaceboard.rect.left,
-                                                      self.surfaceboard.rect.top,
-                                                      self.surfaceboard.rect.width,
-                                                      self.surfaceboard.rect.height))
-
-        # Display the chess board image
-        windowSurface.blit(self.surfaceboard.image, self.surfaceboard.rect)
+        pygame.draw.rect(windowSurface, BLACK_COLOUR, LAYOUT.rect(self.surfaceboard.rect.left-5,
+                                                                  self.surfaceboard.rect.top-5,
+                                                                  self.surfaceboard.rect.width+10,
+                                                                  self.surfaceboard.rect.height+10))
+        # Draw the board area (board, hint and selected piece boxes, possible moves and pieces) with the board
+        # renderer, made at the size the board is drawn in the window. Pieces still sliding are drawn by the
+        # animation
+        rect = LAYOUT.rect(self.surfaceboard.rect.left, self.surfaceboard.rect.top, self.surfaceboard.rect.width,
+                           self.surfaceboard.rect.height)
+        size = min(rect.width, rect.height)
+        if self.renderer == None or self.renderer.size != size:
+            self.renderer = BoardRenderer(size)
+        hint = None
+        if self.hint != ((-1, -1), (-1, -1)):
+            hint = self.hint
+        selected = None
+        if self.firstslot != (-1, -1):
+            selected = self.firstslot
+        hidden = []
+        if self.animation != None:
+            hidden = self.animation.hidden()
+        self.renderer.render(self.board, hint=hint, selected=selected, validmoves=self.validmoves, hidden=hidden,
+                             surface=windowSurface.subsurface(rect.left, rect.top, size, size))
 
         # Display the home icon
-        windowSurface.blit(self.homeicon.image, self.homeicon.rect)
+        LAYOUT.blit(windowSurface, self.homeicon)
 
         # Display the sound icon, either normal or mute depending on if it's toggled on or off
         if self.soundeffects:
-            windowSurface.blit(self.soundicon.image, self.soundicon.rect)
+            LAYOUT.blit(windowSurface, self.soundicon)
         else:
-            windowSurface.blit(self.nosoundicon.image, self.nosoundicon.rect)
+            LAYOUT.blit(windowSurface, self.nosoundicon)
 
         # Display the hint icon
-        windowSurface.blit(self.hinticon.image, self.hinticon.rect)
+        LAYOUT.blit(windowSurface, self.hinticon)
 
         # Set up fonts
-        basicFont = pygame.font.SysFont("Arial", 30)
-        winFont = pygame.font.SysFont("Arial", 37)
-        doneFont = pygame.font.SysFont("Arial", 20)
+        basicFont = LAYOUT.font("Arial", 30)
+        winFont = LAYOUT.font("Arial", 37)
+        doneFont = LAYOUT.font("Arial", 20)
+
+        # Display the undo and redo buttons, gray if there is nothing to undo or redo
+        buttons = [("Undo", 785, self.can_undo()), ("Redo", 840, self.can_redo())]
+        for text, centre, enabled in buttons:
+            if enabled:
+                draw_text_middle(text, doneFont, windowSurface, centre, 12, BLACK_COLOUR)
+            else:
+                draw_text_middle(text, doneFont, windowSurface, centre, 12, GRAY_COLOUR)
 
         # Display the scores
         scoretext = ["Black Score: " + str(self.blackscore), "White Score: " + str(self.whitescore)]
@@ -1309,6 +3538,47 @@ class Game():
         for i in range(len(scoretext)):
             draw_text(scoretext[i], basicFont, windowSurface, 45, scoreheight[i], BLACK_COLOUR)
 
+        # Display the clocks, the running one on a light box, red when it's low on time
+        if self.clock != None:
+            for colour, height in [(BLACK, 5), (WHITE, 660)]:
+                remaining = self.clock.remaining(colour)
+                if self.clock.running == colour:
+                    pygame.draw.rect(windowSurface, WHITE_TURN_COLOUR, LAYOUT.rect(660, height - 2, 90, 37))
+                textcolour = BLACK_COLOUR
+                if remaining < LOW_TIME_SECONDS:
+                    textcolour = RED_COLOUR
+                draw_text(chess_clock.clock_text(remaining), basicFont, windowSurface, 665, height, textcolour)
+
+        # The hint is waiting for the ponderer's analysis
+        if self.hintkey != None:
+            draw_text("Hint: thinking...", doneFont, windowSurface, 665, 590, BLACK_COLOUR)
+
+        # Display what the hint wins or loses in the exchange if it's a capture
+        if self.hint != ((-1, -1), (-1, -1)) and self.hintexchange != None:
+            exchangetext = str(self.hintexchange)
+            if self.hintexchange > 0:
+                exchangetext = "+" + exchangetext
+            draw_text("Hint exchange: " + exchangetext, basicFont, windowSurface, 380, 660, BLACK_COLOUR)
+
+        # Display the best moves with their scores (for the player to move) and expected lines
+        if self.hint != ((-1, -1), (-1, -1)):
+            if self.turn == WHITE:
+                sign = 1
+            else:
+                sign = -1
+            for i in range(len(self.hintlines)):
+                linetext = str(i + 1) + ". " + score_text(sign*self.hintlines[i].score)
+                for move in self.hintlines[i].line[:HINT_LINE_MOVES]:
+                    linetext += " " + slot_name(move[0]) + slot_name(move[1])
+                draw_text(linetext, doneFont, windowSurface, 665, 590 + i*22, BLACK_COLOUR)
+
+            # Moves played from this position in the opening index, with how many games and how they scored
+            if len(self.hintopenings) > 0:
+                openingtext = "Book:"
+                for san, games, score in self.hintopenings:
+                    openingtext += " " + san + " " + str(round(score*100)) + "% (" + str(games) + ")"
+                draw_text(openingtext, doneFont, windowSurface, 665, 566, BLACK_COLOUR)
+
         # Display the captured captions
         capturedtextheight = [45, 350]
         for i in range(len(capturedtextheight)):
@@ -1327,7 +3597,7 @@ class Game():
                     # Update position of piece to be displayed, display the piece
                     self.graveyard[row][col].rect.left = left
                     self.graveyard[row][col].rect.top = height
-                    windowSurface.blit(self.graveyard[row][col].image, self.graveyard[row][col].rect)
+                    LAYOUT.blit(windowSurface, self.graveyard[row][col])
                     
                     # Decrease counter and move ticker to right
                     counter -= 1
@@ -1339,94 +3609,16 @@ class Game():
                         left = 665
                         counter = 5
 
-        # Draw box around hint (from and to)
-        if self.hint != ((-1, -1), (-1, -1)):
-
-            # Hint Destination:
-            # Corners of selected square 
-            left = 51 + self.hint[1][1]*(600/8)
-            right = left + (600/8) - 3
-            top = 51 + self.hint[1][0]*(600/8)
-            bottom = top + (600/8) - 4
-
-            # Needed for display purposes (clean right side of board)
-            if self.hint[1][1] == 7:
-                right -= 1
-            
-            # Draw lines for box
-            self.draw_box_around_piece(windowSurface, left, right, top, bottom, RED_COLOUR)
-
-            # Hint Start:
-            # Corners of selected squares
-            left = 51 + self.hint[0][1]*(600/8)
-            right = left + (600/8) - 3
-            top = 51 + self.hint[0][0]*(600/8)
-            bottom = top + (600/8) - 4
-
-            # Needed for display purposes (clean right side of board)
-            if self.hint[0][1] == 7:
-                right -= 1
-                    
-            # Draw lines for box
-            self.draw_box_around_piece(windowSurface, left, right, top, bottom, RED_COLOUR)
-
-        # Draw a box around selected piece
-        if self.firstslot != (-1, -1):
-            
-            # Corners of selected squares
-            left = 51 + self.firstslot[1]*(600/8)
-            right = left + (600/8) - 3
-            top = 51 + self.firstslot[0]*(600/8)
-            bottom = top + (600/8) - 4
-            
-            # Needed for display purposes (clean right side of board)
-            if self.firstslot[1] == 7:
-                right -= 1
-                
-            # Needed for display purposes (if hint is next to selected piece, has to do with chess board image)
-            if self.hint != ((-1, -1), (-1, -1)):
-                neighbour = self.check_neighbour_square()
-                if neighbour == ON_RIGHT:
-                    right -= 1
-                elif neighbour == ON_LEFT:
-                    left += 1
-                    
-            # Draw lines for box
-            self.draw_box_around_piece(windowSurface, left, right, top, bottom, LIME_COLOUR)
-
-
-        # Display possible moves for selected piece, iterate through board and check if the square is in valid moves
-        for row in range(SIZE):
-            for col in range(SIZE):
-                
-                # Check if this square is a valid move for piece selected
-                slot = (row, col)
-                if slot in self.validmoves:
-                    
-                    # Display green circle for given circle
-                    width = 88 + col*(600/8)            #Find the x co-ordinate based off the column on board
-                    height = 88.75 + row*(600/8)        #Find the y co-ordinate based off the row on board
-                    gfxdraw.aacircle(windowSurface, int(width), int(height), 23, LIME_COLOUR)
-                    gfxdraw.filled_circle(windowSurface, int(width), int(height), 23, LIME_COLOUR)
-
-        # Display pieces on board, iterate thorugh each square/slot on board
-        for row in range(SIZE):
-            for col in range(SIZE):
-                if self.board.board[row][col] != None:
-                    self.board.board[row][col].rect.left = 55 + col*(600/8)
-                    self.board.board[row][col].rect.top = 55 + row*(600/8)
-                    windowSurface.blit(self.board.board[row][col].image, self.board.board[row][col].rect)
-
         # Display whose turn it is
         if not self.game_over:
             # Blacks turn
             if self.turn == BLACK:
-                pygame.draw.rect(windowSurface, GREEN_COLOUR, (8, 73, 29, 29))
-                pygame.draw.rect(windowSurface, BLACK_COLOUR, (11, 76, 23, 23))
+                pygame.draw.rect(windowSurface, GREEN_COLOUR, LAYOUT.rect(8, 73, 29, 29))
+                pygame.draw.rect(windowSurface, BLACK_COLOUR, LAYOUT.rect(11, 76, 23, 23))
             # Whites turn                                    
             else:
-                pygame.draw.rect(windowSurface, GREEN_COLOUR, (8, 598, 29, 29))
-                pygame.draw.rect(windowSurface, WHITE_TURN_COLOUR, (11, 601, 23, 23))
+                pygame.draw.rect(windowSurface, GREEN_COLOUR, LAYOUT.rect(8, 598, 29, 29))
+                pygame.draw.rect(windowSurface, WHITE_TURN_COLOUR, LAYOUT.rect(11, 601, 23, 23))
             
         # Display if black is in check
         if self.board.incheck[BLACK] and not self.win[WHITE]:
@@ -1443,57 +3635,137 @@ class Game():
             self.draw_win_or_tie_box(windowSurface, "White Wins", winFont, doneFont, 257)
         elif self.tie:
             self.draw_win_or_tie_box(windowSurface, "Stalemate", winFont, doneFont, 265)
-          
-        # Update the screen
+
+        # Performance overlay
+        if self.performance.visible:
+            self.performance.draw(windowSurface, self.ai)
+
+
+    def start_animation(self, windowSurface, before, firstslot, secondslot):
+        """Slides the piece of the move just made (before is the board before it), and the rook when castling.
+        The game is drawn once without the sliding pieces, frames after that only draw around them"""
+
+        sprites = [(before.board[firstslot[0]][firstslot[1]], firstslot, secondslot)]
+
+        # Castling, the king moves two slots and the rook jumps over it
+        if sprites[0][0].kind == KING and abs(secondslot[1] - firstslot[1]) == 2:
+            row = firstslot[0]
+            if secondslot[1] > firstslot[1]:
+                sprites.append((before.board[row][7], (row, 7), (row, 5)))
+            else:
+                sprites.append((before.board[row][0], (row, 0), (row, 3)))
+
+        self.animation = MoveAnimation(sprites)
+        self.draw_frame(windowSurface)
+        self.animation.background = windowSurface.copy()
+        self.animation.draw(windowSurface)
         pygame.display.update()
 
 
-    def check_neighbour_square(self):
-        """Determines if selected piece is next to hint display, and which side"""
-        # Needed for display purposes because of background board image
+    def animate(self, windowSurface):
+        """Draws the next frame of the animation, the whole game once the pieces have reached their slots"""
 
-        hintstart = self.hint[1]
-        hintfinal = self.hint[0]
+        start = time.perf_counter()
+        self.animation.advance()
+        if self.animation.finished():
+            self.animation = None
+            self.display_frame(windowSurface)
+        else:
+            self.animation.draw(windowSurface)
+            self.performance.frame_finished(start, self.ai)
+
+
+    def update_hint(self):
+        """Shows the hint once the ponderer has analysed the position: updates self.hint with the best move, to
+        and from of piece, and the other best moves. The hint is dropped if the position has changed or the
+        ponderer stopped (out of time) before finishing the analysis"""
+
+        if self.hintkey == None:
+            return
+        if self.hintkey[0] != self.board.get_position_key(self.turn):
+            self.hintkey = None
+            return
+
+        # Pondering checked first, the analysis is stored before the thread finishes
+        pondering = self.ponderer.pondering()
+        analysis = self.ai.analyses.get(self.hintkey)
+        if analysis == None:
+            if not pondering:
+                self.hintkey = None
+            return
+
+        self.hintkey = None
+        self.hintlines = analysis
+        if len(self.hintlines) > 0:
+            self.hint = self.hintlines[0].move
+        self.hintexchange = None
+        if self.hint[0] != (-1, -1) and self.board.board[self.hint[1][0]][self.hint[1][1]] != None:
+            self.hintexchange = self.board.static_exchange(self.hint[0], self.hint[1])
+        self.hintopenings = []
+        for opening in self.ai.opening_moves(self.board, self.turn)[:HINT_OPENING_MOVES]:
+            firstslot, secondslot = move_to_tuple(opening.move)
+            self.hintopenings.append((self.board.get_san(firstslot, secondslot, QUEEN),
+                                      opening.games, opening.score(self.turn == WHITE)))
+
+
+    def start_pondering(self):
+        """Ponder the position in the background while the human player is thinking"""
 
-        if self.firstslot[0] == hintstart[0]:
-            if self.firstslot[1] - 1 == hintstart[1]:
-                return ON_LEFT
-            elif self.firstslot[1] + 1 == hintstart[1]:
-                return ON_RIGHT
+        if not self.game_over:
+            # Against the AI, also ponder the AI's reply
+            if self.AI:
+                self.ponderer.start(self.board, self.turn, HARD, self.difficulty)
+            else:
+                self.ponderer.start(self.board, self.turn, HARD, -1)
 
-        if self.firstslot[0] == hintfinal[0]:
-            if self.firstslot[1] - 1 == hintfinal[1]:
-                return ON_LEFT
-            elif self.firstslot[1] + 1 == hintfinal[1]:
-                return ON_RIGHT
 
-        return NO_NEIGHBOUR
+    def press_clock(self):
+        """A move has been made, adds the increment of the player who moved and starts the other player's clock
+        (stops both once the game is over)"""
+
+        if self.clock != None:
+            self.clock.press()
+            if self.game_over:
+                self.clock.stop()
+
+
+    def check_time(self):
+        """Ends the game if the player to move has run out of time, the other player wins"""
+
+        if self.clock == None or self.game_over or self.clock.flagged() == None:
+            return
+        self.clock.stop()
+        self.ponderer.stop()
+        self.mover.stop()
+        self.animation = None
+        self.win[opposite_colour(self.clock.flagged())] = True
+        self.flagged = True
+        self.game_over = True
+
+
+    def search_time(self):
+        """Returns the seconds (soft, hard) the AI can search its move for, (None, None) if the game isn't timed"""
+
+        if self.clock == None:
+            return None, None
+        return chess_clock.allocate_time(self.clock.remaining(BLACK), self.timecontrol, self.historyindex)
+
 
-    
     def draw_win_or_tie_box(self, windowSurface, words, winFont, doneFont, left):
         """Draw the box for if a team has won or stalemate occured"""
 
         # Draw rectangle and inputted message (win/tie)
-        pygame.draw.rect(windowSurface, BLACK_COLOUR, (245, 290, 210, 117))
-        pygame.draw.rect(windowSurface, GRAY_COLOUR, (250, 295, 200, 107))
+        pygame.draw.rect(windowSurface, BLACK_COLOUR, LAYOUT.rect(245, 290, 210, 117))
+        pygame.draw.rect(windowSurface, GRAY_COLOUR, LAYOUT.rect(250, 295, 200, 107))
         draw_text(words, winFont, windowSurface, left, 305, BLACK_COLOUR)
 
         # Draw "DONE" button
-        pygame.draw.rect(windowSurface, MENU_GRAY_COLOUR, (290, 353, 120, 35))
+        pygame.draw.rect(windowSurface, MENU_GRAY_COLOUR, LAYOUT.rect(290, 353, 120, 35))
         draw_text_middle("CONTINUE", doneFont, windowSurface, 350, 358, BLACK_COLOUR)           
         draw_border_lines(windowSurface, 353, 387, 290, 410,
                           LIGHT_GRAY_COLOUR, DARK_GRAY_COLOUR)
 
 
-    def draw_box_around_piece(self, windowSurface, left, right, top, bottom, colour):
-        """Draws lines to create a box around a piece"""
-        
-        pygame.draw.line(windowSurface, colour, (left-1, top), (right+2, top), 4)        # Top
-        pygame.draw.line(windowSurface, colour, (left-1, bottom), (right+2, bottom), 4)  # Bottom
-        pygame.draw.line(windowSurface, colour, (left, top), (left, bottom), 4)          # Left
-        pygame.draw.line(windowSurface, colour, (right, top), (right, bottom), 4)        # Right
-        
-        
     def get_slot(self, location):
         """Transfer the mouse click co-ordinates into a slot on the board/array"""
 
@@ -1519,9 +3791,9 @@ class Game():
         """When a pawn is to be promoted, display the pieces to choose from"""
 
         # Display background border
-        pygame.draw.rect(windowSurface, BLACK_COLOUR, (195, 300, 310, 100))
+        pygame.draw.rect(windowSurface, BLACK_COLOUR, LAYOUT.rect(195, 300, 310, 100))
         # Display backgroudn
-        pygame.draw.rect(windowSurface, GRAY_COLOUR, (200, 305, 300, 90))
+        pygame.draw.rect(windowSurface, GRAY_COLOUR, LAYOUT.rect(200, 305, 300, 90))
 
         # Display the pieces to choose from (rook, knight, bishop, queen)
         top = 317
@@ -1529,7 +3801,7 @@ class Game():
         for col in range(len(pawnimages[colour])):
             pawnimages[colour][col].rect.top = top
             pawnimages[colour][col].rect.left = left
-            windowSurface.blit(pawnimages[colour][col].image, pawnimages[colour][col].rect)
+            LAYOUT.blit(windowSurface, pawnimages[colour][col])
             left += 75      # Move left parameter over (so the images are displayed beside each other)
 
         # Update screen
@@ -1546,24 +3818,141 @@ class Game():
                 elif event.type == KEYUP:
                     if event.key == K_ESCAPE:
                         terminate()
+                elif event.type == VIDEORESIZE:
+                    LAYOUT.resize(event.w, event.h)
+                    return RESIZED
                 elif event.type == MOUSEBUTTONUP:
+                    pos = LAYOUT.to_design(event.pos)    # Click in design co-ordinates
                     # Within the actual selection area
-                    if (event.pos[0] >= 200 and event.pos[0] < 500
-                    and event.pos[1] >= 275 and event.pos[1] < 425):
+                    if (pos[0] >= 200 and pos[0] < 500
+                    and pos[1] >= 275 and pos[1] < 425):
                         # Rook
-                        if event.pos[0] < 275:
+                        if pos[0] < 275:
                             return 0
                         # Knight
-                        elif event.pos[0] < 350:
+                        elif pos[0] < 350:
                             return 1
                         # Bishop
-                        elif event.pos[0] < 425:
+                        elif pos[0] < 425:
                             return 2
                         # Queen
                         else:
                             return 3
 
 
+    def record_move(self, before, firstslot, secondslot):
+        """Adds the move just made (before is the board before it was made) to the game's moves in SAN"""
+
+        promotion = QUEEN
+        if self.board.board[secondslot[0]][secondslot[1]].kind != before.board[firstslot[0]][firstslot[1]].kind:
+            promotion = self.board.board[secondslot[0]][secondslot[1]].kind
+
+        # Moves that were undone can't be redone anymore
+        del self.moves[self.historyindex:]
+        self.moves.append(before.get_san(firstslot, secondslot, promotion))
+
+
+    def save_state(self):
+        """Keeps the game's state after a move for undo, moves that were undone can't be redone anymore"""
+
+        del self.history[self.historyindex + 1:]
+        self.history.append(GameState(self))
+        self.historyindex += 1
+
+
+    def can_undo(self):
+        """Returns if there is a move to undo (against the AI, a move of the human player)"""
+
+        for index in range(self.historyindex - 1, -1, -1):
+            if not self.AI or self.history[index].turn == WHITE:
+                return True
+        return False
+
+
+    def can_redo(self):
+        """Returns if there is an undone move to redo"""
+
+        return self.historyindex < len(self.history) - 1
+
+
+    def undo(self):
+        """Takes back the last move, against the AI takes back the AI's reply and the human's move"""
+
+        if not self.can_undo():
+            return
+        self.historyindex -= 1
+        while self.AI and self.history[self.historyindex].turn != WHITE:
+            self.historyindex -= 1
+        self.go_to_state()
+
+
+    def redo(self):
+        """Makes the last undone move again, against the AI the human's move and the AI's reply"""
+
+        if not self.can_redo():
+            return
+        self.historyindex += 1
+        while self.AI and self.history[self.historyindex].turn != WHITE and self.can_redo():
+            self.historyindex += 1
+        self.go_to_state()
+
+
+    def go_to_state(self):
+        """Puts the game back to the state at historyindex, searches already done for the position are reused"""
+
+        self.ponderer.stop()
+        self.mover.stop()
+        self.animation = None
+        self.history[self.historyindex].restore(self)
+
+        # Clock of the player to move runs (times used aren't given back)
+        if self.clock != None and not self.game_over:
+            self.clock.start(self.turn)
+
+        # Reset selection and hint
+        self.hint = ((-1, -1), (-1, -1))
+        self.firstslot = (-1, -1)
+        self.validmoves = []
+
+        self.start_pondering()
+
+
+    def save_pgn(self):
+        """Adds the game to the saved games (PGN file), unless no moves were made"""
+
+        if self.historyindex == 0:
+            return
+
+        # Players, human or the AI's difficulty (any search depth, the simul can be given others)
+        names = {EASY: "AI (Easy)", MEDIUM: "AI (Medium)", HARD: "AI (Hard)"}
+        black = "Human"
+        if self.AI:
+            black = names.get(self.difficulty, "AI (depth " + str(self.difficulty) + ")")
+
+        # Result, unfinished if the game was left with the home button
+        result = pgn.UNFINISHED
+        if self.win[WHITE]:
+            result = pgn.WHITE_WINS
+        elif self.win[BLACK]:
+            result = pgn.BLACK_WINS
+        elif self.tie:
+            result = pgn.DRAW
+
+        tags = {"Event": "PyChess game", "Site": "PyChess", "Date": pgn.today(), "Round": "-", "White": "Human",
+                "Black": black}
+        if self.timecontrol != None:
+            tags["TimeControl"] = self.timecontrol.pgn_tag()
+        if self.flagged:
+            tags["Termination"] = "time forfeit"
+        game = pgn.PgnGame(tags, self.moves[:self.historyindex], result)
+
+        # Game carries on without saving if the file can't be written to
+        try:
+            pgn.save_game(game)
+        except OSError:
+            pass
+
+
     def check_if_pawns_at_end(self, windowSurface, side, colour):
         """Check if pawns have reached other side of board"""
 
@@ -1576,9 +3965,13 @@ class Game():
                     self.display_pawn_options(colour, self.pawnimages, windowSurface)
 
                     col = c
-                    # Pawn promotion menu
+                    # Pawn promotion menu (game and options drawn again if the window is resized)
                     spot = self.process_pawn_options()
-                    self.board.board[row][col] = self.pawnimages[self.board.board[row][col].colour][spot]
+                    while spot == RESIZED:
+                        self.draw_frame(windowSurface)
+                        self.display_pawn_options(colour, self.pawnimages, windowSurface)
+                        spot = self.process_pawn_options()
+                    self.board.promote(row, col, self.pawnimages[self.board.board[row][col].colour][spot].kind)
                 
 
     def update_check_conditions(self):
@@ -1616,6 +4009,11 @@ class Game():
                     if self.board.board[row][col] != None:
                         piecesleft[self.board.board[row][col].colour][self.board.board[row][col].kind] += 1
 
+            # Endgame the bitbases say is a draw (other player to move)
+            if self.board.probe_bitbase(opposite_colour(self.turn)) == bitbase.DRAW:
+                self.tie = True
+                self.game_over = True
+
             # If either player has only a king
             if piecesleft[BLACK] == [0, 0, 0, 0, 1, 0]:                 # Black only has king
                 opposite = WHITE
@@ -1637,16 +4035,17 @@ def main():
     """Mainline for program"""
     pygame.init()
 
-    # Set up windowsurface
-    windowSurface = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT), 0, 32)
+    # Set up windowsurface, the window can be resized (everything is scaled to fit it)
+    windowSurface = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT), RESIZABLE, 32)
     pygame.display.set_caption('Chess')
+    LAYOUT.resize(windowSurface.get_width(), windowSurface.get_height())
 
     # Setup menu piece images
     blackbishopimage = load_image("black_bishop.png")
-    bigbishop = BigBishopImage(blackbishopimage, 25, windowSurface.get_rect().centery)
+    bigbishop = BigBishopImage(blackbishopimage, 25, WINDOW_HEIGHT//2)
 
     blackknightimage = load_image("black_knight.png")
-    bigknight = BigKnightImage(blackknightimage, 675, windowSurface.get_rect().centery)
+    bigknight = BigKnightImage(blackknightimage, 675, WINDOW_HEIGHT//2)
 
     # To be displayed on menu or instructions (next 4 images)
     # Load the home icon image in
@@ -1665,20 +4064,44 @@ def main():
     hintimage = load_image("lightbulb.png")
     hinticon = HintIcon(hintimage, 280, 95)
 
-    # Run the main menu
-    game = run_main_menu(windowSurface, bigbishop, bigknight, homeicon, hinticon, soundicon, menuhomeicon)
+    # Open the analysis cache (AI searches kept between runs), games are played without it if it can't be opened
+    # (tuned evaluation weights give different results, they are kept apart by the weights' name)
+    version = ANALYSIS_CACHE_VERSION
+    if EVALUATION_WEIGHTS_NAME != None:
+        version = str(version) + "-" + EVALUATION_WEIGHTS_NAME
+    cache = analysis_cache.open_cache(version)
 
-    # Run the game loop
+    # Performance numbers, written to a log if one is given ("python Chess.py --performance-log perf.csv")
+    performancelog = None
+    if "--performance-log" in sys.argv[1:-1]:
+        performancelog = sys.argv[sys.argv.index("--performance-log") + 1]
+    performance = PerformanceMonitor(performancelog)
+
+    # Run the main menu
+    game = run_main_menu(windowSurface, bigbishop, bigknight, homeicon, hinticon, soundicon, menuhomeicon, cache,
+                         performance, TIME_CONTROLS[0])
+    game.start_pondering()
+
+    # Run the game loop, FRAME_RATE times a second (switching threads more often so the AI searching in the
+    # background doesn't hold up frames)
+    sys.setswitchinterval(THREAD_SWITCH_SECONDS)
+    clock = pygame.time.Clock()
     while True:
+        clock.tick(FRAME_RATE)
 
         # If you are playing against the AI, run AI logic
-        if game.AI:
-            # If it is the AIs turn
-            if game.turn == BLACK:
-
-                # Run the AI logic and make the AIs move                
-                ai = ChessAI()
-                stats = ai.get_best_move(game.board, BLACK, game.difficulty, 1000, -1000)
+        if game.AI and not game.game_over:
+            # If it is the AIs turn, start the AI's search (in the background, instant if this position was
+            # pondered), it can think while the human's move is still sliding
+            if game.turn == BLACK and not game.mover.searching():
+                game.ponderer.stop()
+                soft, hard = game.search_time()
+                game.mover.start(game.board, BLACK, game.difficulty, soft, hard)
+
+            # Make the AIs move once it's found and nothing is sliding
+            elif game.turn == BLACK and game.mover.done() and game.animation == None:
+                stats = game.mover.finish()
+                before = game.board.make_copy()
                 game.board.make_move(stats[1], stats[2], game.graveyard)
 
                 # Play the sound effect for moving a piece if it is turned on
@@ -1686,29 +4109,61 @@ def main():
                     game.piecemovesound.play()
 
                 game.board.does_pawn_promote(stats[2][0], stats[2][1])  # Check if pawn needs to be promoted
-                game.display_frame(windowSurface)                       # Display the frame again
+                game.record_move(before, stats[1], stats[2])            # Record the move
                 game.update_check_conditions()                          # Update game conditions
                 game.turn = opposite_colour(BLACK)                      # Change the turn
+                game.press_clock()                                      # Start the human's clock
+                game.save_state()                                       # Keep the game's state for undo
+                game.start_animation(windowSurface, before, stats[1], stats[2])   # Slide the AI's piece
+                game.start_pondering()                                  # Ponder on the human's time
 
         # Processes events
         game.process_events(windowSurface)
 
+        # Show the hint once its analysis has finished
+        game.update_hint()
+
+        # Player to move loses if their clock has run out
+        game.check_time()
+
         # Update the score
         game.whitescore = game.get_score(BLACK)
         game.blackscore = game.get_score(WHITE)
     
-        # Displays the frame
-        game.display_frame(windowSurface)
+        # Displays the frame (only around the sliding pieces while a move is animated)
+        if game.animation != None:
+            game.animate(windowSurface)
+        else:
+            game.display_frame(windowSurface)
 
-        # If game is over, wait ten seconds, then proceed to home menu
-        if game.game_over:
-            process_win_screen()
+        # If game is over (and the last move has finished sliding), wait for continue, then proceed to home menu
+        finished = game.game_over and game.animation == None
+        if finished:
+            while process_win_screen() == RESIZED:
+                game.display_frame(windowSurface)
 
         # If game is over or home button clicked return to main menu
-        if game.game_over or game.home_button:
+        if finished or game.home_button:
             game.home_button = False
+            game.ponderer.stop()
+            game.mover.stop()
+            game.save_pgn()
 
             # Run game
-            game = run_main_menu(windowSurface, bigbishop, bigknight, homeicon, hinticon, soundicon, menuhomeicon)
-
-main()
+            game = run_main_menu(windowSurface, bigbishop, bigknight, homeicon, hinticon, soundicon, menuhomeicon,
+                                 cache, performance, game.timecontrol)
+            game.start_pondering()
+
+if __name__ == "__main__":
+    # "python Chess.py bench ..." runs the search benchmark (bench.py), "python Chess.py --profile ..." profiles
+    # the AI playing a game without the window (profile_engine.py), instead of the game
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        import bench
+        del sys.argv[1]
+        bench.main()
+    elif len(sys.argv) > 1 and sys.argv[1] == "--profile":
+        import profile_engine
+        del sys.argv[1]
+        profile_engine.main()
+    else:
+        main()
@@ -0,0 +1,160 @@
+# Analysis cache, keeps finished AI searches on disk (SQLite) so they are reused across games and runs
+# Entries are keyed by position key, depth and number of lines (0 for a single best move search),
+# the least recently used entries are removed once the cache holds too many
+
+
+import os, sqlite3, threading
+
+
+# Default file the cache is stored in
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "analysis_cache.sqlite3")
+
+# Size constants
+MAX_ENTRIES = 100000        # Most entries kept
+EVICT_FRACTION = 0.1        # Fraction of the entries removed (least recently used first) once there are too many
+
+USED_FLUSH_ENTRIES = 1000   # Lookups found whose use is written at most (written with the next put before this)
+
+
+def signed(key):
+    """Returns a 64 bit key as a signed integer (SQLite integers are signed)"""
+
+    if key >= 1 << 63:
+        return key - (1 << 64)
+    return key
+
+
+class AnalysisCache():
+    """Search results stored in an SQLite file, safe to use from the game and pondering threads"""
+
+    def __init__(self, version, path=CACHE_PATH, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries    # Most entries kept
+        self.lock = threading.Lock()      # One thread uses the connection at a time
+        self.hits = 0                     # Number of lookups found in the cache
+        self.misses = 0                   # Number of lookups not found
+        self.pending = {}                 # (key, depth, lines) -> use counter of entries found but not written yet
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        # Files made before the entries lost their (unused) bound column are started again
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(entries)")]
+        if "bound" in columns:
+            self.connection.execute("DROP TABLE entries")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS entries (key INTEGER, depth INTEGER, lines INTEGER, "
+                                "score INTEGER, move INTEGER, variations TEXT, used INTEGER, "
+                                "PRIMARY KEY (key, depth, lines)) WITHOUT ROWID")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+
+        # Results from a different version of the AI (evaluation or search changed) can't be reused
+        row = self.connection.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+        if row == None or row[0] != str(version):
+            self.connection.execute("DELETE FROM entries")
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(version),))
+        self.connection.commit()
+
+        # Entries are marked with an increasing counter when used, lowest are removed first
+        self.count = self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        self.used = self.connection.execute("SELECT COALESCE(MAX(used), 0) FROM entries").fetchone()[0]
+
+
+    def get(self, key, depth, lines):
+        """Returns the stored lines (score, list of packed moves) of the position, None if not stored"""
+
+        with self.lock:
+            if self.connection == None:
+                return None
+            try:
+                row = self.connection.execute("SELECT variations FROM entries "
+                                              "WHERE key = ? AND depth = ? AND lines = ?",
+                                              (signed(key), depth, lines)).fetchone()
+                if row == None:
+                    self.misses += 1
+                    return None
+
+                # The entry's use is written later (with the next put), so a lookup doesn't write to the disk
+                self.used += 1
+                self.pending[(signed(key), depth, lines)] = self.used
+                if len(self.pending) >= USED_FLUSH_ENTRIES:
+                    self.write_used()
+                    self.connection.commit()
+            except sqlite3.DatabaseError:
+                self.connection = None
+                return None
+
+        self.hits += 1
+        variations = []
+        if row[0] != "":
+            for variation in row[0].split(";"):
+                numbers = [int(number) for number in variation.split(" ")]
+                variations.append((numbers[0], numbers[1:]))
+        return variations
+
+
+    def write_used(self):
+        """Writes the use counters of the entries found since they were last written (lock held, not committed)"""
+
+        if len(self.pending) > 0:
+            self.connection.executemany("UPDATE entries SET used = ? WHERE key = ? AND depth = ? AND lines = ?",
+                                        [(used,) + entry for entry, used in self.pending.items()])
+            self.pending.clear()
+
+
+    def put(self, key, depth, lines, variations):
+        """Stores the lines (score, list of packed moves) of the position, best first"""
+
+        if len(variations) > 0:
+            score = variations[0][0]
+            move = variations[0][1][0]
+        else:
+            score = 0
+            move = 0
+        text = ";".join(" ".join(str(number) for number in [variation[0]] + variation[1]) for variation in variations)
+
+        with self.lock:
+            if self.connection == None:
+                return
+            try:
+                self.write_used()
+                self.used += 1
+                replaced = self.connection.execute("SELECT 1 FROM entries WHERE key = ? AND depth = ? AND lines = ?",
+                                                   (signed(key), depth, lines)).fetchone()
+                self.connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                        (signed(key), depth, lines, score, move, text, self.used))
+                if replaced == None:
+                    self.count += 1
+
+                # Too many entries, remove the least recently used ones (several at once so it isn't done every put)
+                if self.count > self.max_entries:
+                    evict = max(1, int(self.max_entries*EVICT_FRACTION))
+                    self.connection.execute("DELETE FROM entries WHERE used IN "
+                                            "(SELECT used FROM entries ORDER BY used LIMIT ?)", (evict,))
+                    self.count = self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+                self.connection.commit()
+            except sqlite3.DatabaseError:
+                self.connection = None
+
+
+    def close(self):
+        """Writes the entries' uses and closes the cache file"""
+
+        with self.lock:
+            if self.connection != None:
+                try:
+                    self.write_used()
+                    self.connection.commit()
+                except sqlite3.DatabaseError:
+                    pass
+                self.connection.close()
+                self.connection = None
+
+
+def open_cache(version, path=CACHE_PATH, max_entries=MAX_ENTRIES):
+    """Returns the analysis cache, None if the file can't be opened (e.g. the folder is read-only)"""
+
+    try:
+        return AnalysisCache(version, path, max_entries)
+    except sqlite3.Error:
+        return None
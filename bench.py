@@ -0,0 +1,154 @@
+# Search benchmark, the AI searches a fixed set of middlegame and endgame positions to set depths and reports the
+# nodes, time, nodes per second and best move of each, with a signature (hash of the nodes, moves and scores)
+# that only changes when the search does. Move ordering's random tie breaks are seeded, so the same code always
+# searches the same nodes. Results are written as JSON, and compared against a saved baseline run: the benchmark
+# fails (exit status 1) if it got slower overall by more than the threshold (percent nodes per second)
+# Run with "python bench.py [output.json] [--baseline baseline.json] [--threshold percent] [--repeat times]"
+# (or "python Chess.py bench ...")
+
+
+from Chess import *
+import sys, json, time, zlib, platform
+
+
+# Benchmark constants
+BENCH_SEED = 2022              # Seed of the AI's move ordering tie breaks
+BENCH_THRESHOLD = 10           # Percent slower (nodes per second) the benchmark can get before it fails
+BENCH_REPEATS = 1              # Times each position is searched, the fastest is kept (nodes must match)
+BENCH_OUTPUT = "bench.json"    # File the results are written to
+
+# Positions searched (name, FEN, depth)
+BENCH_POSITIONS = [
+    # Middlegames
+    ("italian", "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4", 4),
+    ("queens gambit", "rnbq1rk1/ppp1bppp/4pn2/3p2B1/2PP4/2N1PN2/PP3PPP/R2QKB1R b KQ - 0 6", 4),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", 3),
+    ("open centre", "r2q1rk1/pp2bppp/2n1bn2/3p4/3P4/2NBBN2/PP3PPP/R2Q1RK1 w - - 0 11", 4),
+    ("opposite castling", "2kr3r/pppq1ppp/2n1bn2/4p3/4P3/2N1BN2/PPPQ1PPP/R3K2R w KQ - 0 10", 4),
+    # Endgames
+    ("pawn race", "8/5pk1/6p1/8/5P2/6PK/8/8 w - - 0 1", 7),
+    ("rook endgame", "8/8/1p3k2/8/1P6/5K2/2R5/r7 w - - 0 1", 5),
+    ("bishops", "6k1/5p2/6p1/8/7P/1B4P1/4bPK1/8 w - - 0 1", 6),
+    ("queens", "8/2k5/8/8/3Q4/8/5K2/1q6 w - - 0 1", 4),
+    ("knight and pawns", "8/p4k2/1p3p2/8/3N4/P4P2/1P3K2/8 b - - 0 1", 5),
+]
+
+
+def signature(*values):
+    """Returns a short hash (8 hex digits) of the values"""
+
+    return format(zlib.crc32(" ".join(str(value) for value in values).encode()), "08x")
+
+
+def bench_position(fen, depth, repeats):
+    """Searches the position (a new AI each time, seeded), returns its result as a dictionary"""
+
+    board = Board(create_pieces(False))
+    colour = board.set_up_fen(fen)
+    best = None
+    for repeat in range(repeats):
+        ai = ChessAI()
+        ai.random.seed(BENCH_SEED)
+        start = time.perf_counter()
+        score, firstslot, secondslot = ai.get_best_move(board, colour, depth, 1000, -1000)
+        seconds = time.perf_counter() - start
+        if best != None and ai.nodes != best["nodes"]:
+            raise RuntimeError("Search isn't deterministic, " + str(ai.nodes) + " nodes then " + str(best["nodes"]))
+        if best == None or seconds < best["seconds"]:
+            move = "none"
+            if firstslot != (-1, -1):
+                move = move_name(board.encode_move(firstslot, secondslot, QUEEN))
+            best = {"nodes": ai.nodes, "seconds": round(seconds, 4), "nps": round(ai.nodes/max(seconds, 1e-9)),
+                    "move": move, "score": score}
+    best["signature"] = signature(fen, depth, best["nodes"], best["move"], best["score"])
+    return best
+
+
+def run(repeats=BENCH_REPEATS):
+    """Runs the benchmark, prints each position's results and returns them all (the JSON written)"""
+
+    results = {"python": platform.python_version(), "weights": EVALUATION_WEIGHTS_NAME, "seed": BENCH_SEED,
+               "positions": []}
+    print("Position            Depth      Nodes   Seconds      NPS  Move    Score  Signature")
+    for name, fen, depth in BENCH_POSITIONS:
+        result = bench_position(fen, depth, repeats)
+        results["positions"].append(dict({"name": name, "fen": fen, "depth": depth}, **result))
+        print(name.ljust(20) + str(depth).rjust(5) + str(result["nodes"]).rjust(11) +
+              str(round(result["seconds"], 2)).rjust(10) + str(result["nps"]).rjust(9) + "  " +
+              result["move"].ljust(6) + str(result["score"]).rjust(7) + "  " + result["signature"])
+
+    nodes = sum(position["nodes"] for position in results["positions"])
+    seconds = sum(position["seconds"] for position in results["positions"])
+    results["total"] = {"nodes": nodes, "seconds": round(seconds, 4), "nps": round(nodes/max(seconds, 1e-9)),
+                        "signature": signature(*[position["signature"] for position in results["positions"]])}
+    print("Total" + str(results["total"]["nodes"]).rjust(31) + str(round(seconds, 2)).rjust(10) +
+          str(results["total"]["nps"]).rjust(9) + "  signature " + results["total"]["signature"])
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Prints how the results differ from the baseline's, returns if the total is more than threshold percent
+    slower (nodes per second). Slower positions are marked, but short searches vary too much to fail on"""
+
+    regression = False
+    before = {position["name"]: position for position in baseline["positions"]}
+    print("Compared with baseline (signature " + baseline["total"]["signature"] + ", threshold " + str(threshold) +
+          "%):")
+    for position in results["positions"] + [dict(results["total"], name="Total")]:
+        if position["name"] == "Total":
+            old = baseline["total"]
+        elif position["name"] in before:
+            old = before[position["name"]]
+        else:
+            print("  " + position["name"] + ": not in the baseline")
+            continue
+
+        change = (position["nps"] - old["nps"])*100/max(old["nps"], 1)
+        text = "  " + position["name"] + ": " + str(old["nps"]) + " -> " + str(position["nps"]) + " nps (" + \
+               format(change, "+.1f") + "%)"
+        if position["signature"] != old["signature"]:
+            text += ", search changed (nodes " + str(old["nodes"]) + " -> " + str(position["nodes"])
+            if "move" in old and old["move"] != position["move"]:
+                text += ", move " + old["move"] + " -> " + position["move"]
+            text += ")"
+        if change < -threshold and position["name"] == "Total":
+            text += "  REGRESSION"
+            regression = True
+        elif change < -threshold:
+            text += "  slower"
+        print(text)
+    return regression
+
+
+def option(name, default):
+    """Returns the value given after the command line option name, default if it isn't given"""
+
+    if name in sys.argv[1:-1]:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+
+def main():
+    """Mainline for the benchmark, exits with status 1 if it was slower than the baseline"""
+
+    output = BENCH_OUTPUT
+    if len(sys.argv) > 1 and not sys.argv[1].startswith("--"):
+        output = sys.argv[1]
+    baselinepath = option("--baseline", None)
+    threshold = float(option("--threshold", BENCH_THRESHOLD))
+    repeats = int(option("--repeat", BENCH_REPEATS))
+
+    results = run(repeats)
+    with open(output, "w") as file:
+        json.dump(results, file, indent=1)
+    print("Results written to " + output)
+
+    if baselinepath != None:
+        with open(baselinepath) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Benchmark for batch (NumPy) evaluation of leaf positions against scoring each position with get_board_score
+# Run with "python benchmark_evaluation.py [number of positions] [depth]"
+
+
+import sys, time, random
+from Chess import *
+
+
+def create_positions(pieces, number, seed):
+    """Creates and returns random middlegame positions (board, colour to move) from random games"""
+
+    rng = random.Random(seed)
+    ai = ChessAI()
+    positions = []
+    while len(positions) < number:
+        board = Board(pieces)
+        board.set_up_initial_board()
+        colour = WHITE
+        for ply in range(rng.randrange(10, 40)):
+            moves = ai.generate_all_moves(board, colour)
+            if len(moves) == 0:
+                break
+            move = rng.choice(moves)
+            board.make_move(move[0], move[1], None)
+            board.does_pawn_promote(move[1][0], move[1][1])
+            colour = opposite_colour(colour)
+        else:
+            positions.append((board, colour))
+    return positions
+
+
+def create_frontiers(positions):
+    """Returns the positions after each move of each position (the leaves below a node on the last ply)"""
+
+    ai = ChessAI()
+    frontiers = []
+    for board, colour in positions:
+        leaves = []
+        for move in ai.generate_all_moves(board, colour):
+            new_board = board.make_copy()
+            new_board.make_move(move[0], move[1], None)
+            new_board.does_pawn_promote(move[1][0], move[1][1])
+            leaves.append((new_board, opposite_colour(colour)))
+        frontiers.append(leaves)
+    return frontiers
+
+
+def benchmark_leaves(pieces, frontiers):
+    """Times scoring each frontier one position at a time and all at once, checks the scores match"""
+
+    start = time.perf_counter()
+    single = [[board.get_board_score(colour) for board, colour in leaves] for leaves in frontiers]
+    singletime = time.perf_counter() - start
+
+    evaluator = BatchEvaluator(pieces)
+    start = time.perf_counter()
+    batch = [evaluator.evaluate([board for board, colour in leaves])[0] for leaves in frontiers]
+    batchtime = time.perf_counter() - start
+
+    # Checkmates (get_board_score's extreme scores) and bitbase endgames aren't batch scored
+    mismatches = 0
+    for i in range(len(frontiers)):
+        for j in range(len(frontiers[i])):
+            if abs(single[i][j]) < MATE_SCORE and single[i][j] != batch[i][j]:
+                mismatches += 1
+
+    leaves = sum(len(leaves) for leaves in frontiers)
+    print("Leaf positions:      " + str(leaves) + " (" + str(len(frontiers)) + " frontiers)")
+    print("get_board_score:     " + str(round(singletime*1000, 1)) + " ms (" + str(round(leaves/singletime)) + " per second)")
+    print("BatchEvaluator:      " + str(round(batchtime*1000, 1)) + " ms (" + str(round(leaves/batchtime)) + " per second)")
+    print("Speedup:             " + str(round(singletime/batchtime, 1)) + "x")
+    print("Score mismatches:    " + str(mismatches))
+
+
+def benchmark_search(positions, depth):
+    """Times the AI search with and without batch evaluation (both without quiescence, batch evaluation isn't
+    used with it, so both are the same search)"""
+
+    for batch in (False, True):
+        nodes = 0
+        start = time.perf_counter()
+        for board, colour in positions:
+            ai = ChessAI(batch_evaluation=batch, quiescence=False)
+            ai.random.seed(0)
+            ai.get_best_move(board, colour, depth, 1000, -1000)
+            nodes += ai.nodes
+        seconds = time.perf_counter() - start
+        print("Search depth " + str(depth) + ", batch evaluation " + str(batch) + ": " + str(round(seconds, 2)) +
+              " seconds, " + str(nodes) + " nodes")
+
+
+def main():
+    """Mainline for benchmark"""
+
+    if numpy == None:
+        print("NumPy isn't installed, batch evaluation isn't available")
+        return
+
+    number = 20
+    depth = 3
+    if len(sys.argv) > 1:
+        number = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        depth = int(sys.argv[2])
+
+    pieces = create_pieces(False)
+    positions = create_positions(pieces, number, 2022)
+    benchmark_leaves(pieces, create_frontiers(positions))
+    benchmark_search(positions, depth)
+
+
+if __name__ == "__main__":
+    main()
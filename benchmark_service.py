@@ -0,0 +1,169 @@
+# Benchmark for the engine service (engine_service.py), sends many best move requests at once from positions
+# of random games and measures requests per second and how long each request takes to be answered
+# Some positions are asked for by several requests at once, so requests waiting for the same search show up
+# Starts a service on the port if one isn't already running there
+# Run with "python benchmark_service.py [requests] [concurrency] [depth] [port]"
+
+
+from Chess import *
+import sys, os, json, time, random, asyncio, subprocess
+import engine_service
+from load_test import server_running, percentile
+
+
+# Benchmark constants
+REQUESTS = 500                 # Requests sent in total
+CONCURRENCY = 50               # Connections sending requests at once (one request at a time each, keep-alive)
+DEPTH = 2                      # Depth of each search
+TIME_LIMIT = 1.0               # Time limit of each search (seconds)
+POSITIONS = 100                # Different positions asked for (fewer than requests, so some are repeated)
+MAX_RANDOM_MOVES = 20          # Most random moves played to make each position
+SERVICE_START_SECONDS = 30     # Longest wait for a started service to accept connections
+
+
+class Results():
+    """Measurements of the whole benchmark"""
+    def __init__(self):
+        self.latencies = []       # Seconds from sending each request to receiving its answer
+        self.statuses = {}        # Number of answers with each HTTP status
+
+
+def random_positions(count, seed):
+    """Returns positions (lists of SAN moves from the starting position) made by playing random moves"""
+
+    rng = random.Random(seed)
+    pieces = create_pieces(False)
+    ai = ChessAI()
+    positions = []
+    while len(positions) < count:
+        board = Board(pieces)
+        board.set_up_initial_board()
+        colour = WHITE
+        moves = []
+        for i in range(rng.randint(0, MAX_RANDOM_MOVES)):
+            legal = ai.generate_all_moves(board, colour)
+            if len(legal) == 0:
+                break
+            # Pawns reaching the end are promoted to queens
+            move = board.encode_move(*rng.choice(legal)[:2], QUEEN)
+            moves.append(board.get_san(move_from(move), move_to(move), move_promotion(move)))
+            board.play_move(move, None)
+            colour = opposite_colour(colour)
+        positions.append(moves)
+    return positions
+
+
+async def request(reader, writer, method, path, body):
+    """Sends a request on a keep-alive connection, returns the status and answer"""
+
+    data = json.dumps(body).encode()
+    writer.write((method + " " + path + " HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                  "Content-Length: " + str(len(data)) + "\r\n\r\n").encode() + data)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def run_connection(host, port, jobs, depth, results):
+    """Sends requests from the shared list of jobs one at a time until there are none left"""
+
+    reader, writer = await asyncio.open_connection(host, port)
+    while len(jobs) > 0:
+        moves = jobs.pop()
+        sent = time.perf_counter()
+        try:
+            status, answer = await request(reader, writer, "POST", "/bestmove",
+                                           {"moves": moves, "depth": depth, "time_limit": TIME_LIMIT})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            results.statuses["disconnected"] = results.statuses.get("disconnected", 0) + 1
+            writer.close()
+            reader, writer = await asyncio.open_connection(host, port)
+            continue
+        results.latencies.append(time.perf_counter() - sent)
+        results.statuses[status] = results.statuses.get(status, 0) + 1
+
+        # Service closes the connection after an error, open another one
+        if status != 200:
+            writer.close()
+            reader, writer = await asyncio.open_connection(host, port)
+    writer.close()
+
+
+async def run(host, port, count, concurrency, depth):
+    """Sends all the requests, returns the results and the service's counts afterwards"""
+
+    positions = random_positions(POSITIONS, 0)
+    rng = random.Random(1)
+    jobs = [rng.choice(positions) for i in range(count)]
+
+    results = Results()
+    await asyncio.gather(*[run_connection(host, port, jobs, depth, results) for i in range(concurrency)])
+
+    reader, writer = await asyncio.open_connection(host, port)
+    health = (await request(reader, writer, "GET", "/health", {}))[1]
+    writer.close()
+    return results, health
+
+
+def main():
+    """Mainline for the benchmark"""
+
+    count = REQUESTS
+    concurrency = CONCURRENCY
+    depth = DEPTH
+    port = engine_service.SERVICE_PORT
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        concurrency = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        depth = int(sys.argv[3])
+    if len(sys.argv) > 4:
+        port = int(sys.argv[4])
+
+    # Start a service if there isn't one running
+    process = None
+    if not server_running(engine_service.SERVICE_HOST, port):
+        folder = os.path.dirname(os.path.abspath(__file__))
+        process = subprocess.Popen([sys.executable, os.path.join(folder, "engine_service.py"), str(port)],
+                                   cwd=folder, stdout=subprocess.DEVNULL)
+        start = time.monotonic()
+        while not server_running(engine_service.SERVICE_HOST, port):
+            if time.monotonic() - start > SERVICE_START_SECONDS:
+                process.kill()
+                print("Service didn't start")
+                return
+            time.sleep(0.1)
+
+    try:
+        start = time.perf_counter()
+        results, health = asyncio.run(run(engine_service.SERVICE_HOST, port, count, concurrency, depth))
+        seconds = time.perf_counter() - start
+    finally:
+        if process != None:
+            process.terminate()
+            process.wait()
+
+    print(str(count) + " requests, " + str(concurrency) + " at once, depth " + str(depth) + ", " +
+          str(round(seconds, 2)) + " seconds")
+    print("Answers: " + ", ".join(str(status) + " x" + str(results.statuses[status])
+                                  for status in sorted(results.statuses, key=str)))
+    print("Service: " + str(health["coalesced"]) + " coalesced, " + str(health["rejected"]) + " turned away")
+    if len(results.latencies) > 0:
+        print("Requests per second: " + str(round(len(results.latencies)/seconds, 1)))
+        print("Latency p50: " + str(round(percentile(results.latencies, 0.5)*1000, 1)) + " ms, p99: " +
+              str(round(percentile(results.latencies, 0.99)*1000, 1)) + " ms, max: " +
+              str(round(max(results.latencies)*1000, 1)) + " ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+# Endgame bitbases for king and queen/rook/pawn against a lone king (KQK, KRK, KPK)
+# Built offline by retrograde analysis (run "python bitbase.py"), stored as bit-packed files (one bit per
+# position, set if the side with the extra piece wins) that are memory-mapped when the game runs
+
+
+import os, sys, mmap, time
+from collections import deque
+
+
+# Endgame constants (also the file names)
+KQK = "kqk"
+KRK = "krk"
+KPK = "kpk"
+ENDGAMES = [KQK, KRK, KPK]       # Order they are built in, KPK needs KQK and KRK for promotions
+
+# Folder the bitbase files are stored in
+BITBASE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bitbases")
+
+# Result constants (for the side to move)
+LOSS = -1
+DRAW = 0
+WIN = 1
+
+# Positions are indexed by side to move, strong king square, weak king square and piece square.
+# Squares are row*8 + col with the strong side moving up the board (pawn towards row 0),
+# positions with the strong side to move come first
+SQUARES = 64
+WEAK_TO_MOVE = SQUARES*SQUARES*SQUARES
+POSITIONS = 2*WEAK_TO_MOVE
+
+# Counter value for weak-to-move positions that can never be lost (or aren't legal)
+NEVER_LOST = 255
+
+
+def index(strong_to_move, strongking, weakking, piece):
+    """Returns the index (bit number) of the position in a bitbase"""
+
+    if strong_to_move:
+        return strongking*4096 + weakking*64 + piece
+    return WEAK_TO_MOVE + strongking*4096 + weakking*64 + piece
+
+
+def create_king_moves():
+    """Creates and returns list of squares a king can move to from each square"""
+
+    moves = []
+    for square in range(SQUARES):
+        row = square // 8
+        col = square % 8
+        current = []
+        for r in range(row - 1, row + 2):
+            for c in range(col - 1, col + 2):
+                if (r != row or c != col) and r >= 0 and c >= 0 and r < 8 and c < 8:
+                    current.append(r*8 + c)
+        moves.append(current)
+    return moves
+
+
+def create_rays(directions):
+    """Creates and returns the squares along each direction from each square (nearest first)"""
+
+    rays = []
+    for square in range(SQUARES):
+        current = []
+        for dir in directions:
+            ray = []
+            r = square // 8 + dir[0]
+            c = square % 8 + dir[1]
+            while r >= 0 and c >= 0 and r < 8 and c < 8:
+                ray.append(r*8 + c)
+                r += dir[0]
+                c += dir[1]
+            current.append(ray)
+        rays.append(current)
+    return rays
+
+
+KING_MOVES = create_king_moves()
+ROOK_RAYS = create_rays([(1, 0), (0, 1), (-1, 0), (0, -1)])
+QUEEN_RAYS = create_rays([(1, 0), (0, 1), (-1, 0), (0, -1), (1, 1), (-1, -1), (-1, 1), (1, -1)])
+
+
+class Generator():
+    """Builds the bitbase of one endgame by retrograde analysis"""
+
+    def __init__(self, endgame, promotions):
+        self.endgame = endgame          # Endgame being built (KQK, KRK or KPK)
+        self.promotions = promotions    # Bitbases pawns can promote into (only needed for KPK)
+        self.win = bytearray(POSITIONS) # 1 if the strong side wins
+        self.counter = bytearray(POSITIONS)  # Weak-to-move positions, moves not yet proven to lose
+        self.queue = deque()            # Won positions whose predecessors haven't been looked at
+
+
+    def is_pawn_square(self, square):
+        """Returns if a pawn could be on the square (not on the first or last row)"""
+
+        return square >= 8 and square < 56
+
+
+    def attacks(self, piece, target, blocker):
+        """Checks if the strong piece (not king) attacks target square, blocker is the strong king"""
+
+        # Pawn (moving up the board) attacks diagonally forwards
+        if self.endgame == KPK:
+            if target // 8 != piece // 8 - 1:
+                return False
+            return target % 8 == piece % 8 - 1 or target % 8 == piece % 8 + 1
+
+        # Rook or queen, look along each line until the strong king is hit
+        if self.endgame == KRK:
+            rays = ROOK_RAYS[piece]
+        else:
+            rays = QUEEN_RAYS[piece]
+        for ray in rays:
+            for square in ray:
+                if square == target:
+                    return True
+                if square == blocker:
+                    break
+        return False
+
+
+    def is_legal(self, strong_to_move, strongking, weakking, piece):
+        """Checks if the position can happen in a game"""
+
+        if strongking == weakking or strongking == piece or weakking == piece:
+            return False
+        if weakking in KING_MOVES[strongking]:
+            return False
+        if self.endgame == KPK and not self.is_pawn_square(piece):
+            return False
+        # Weak king can't be in check when it isn't its move
+        if strong_to_move and self.attacks(piece, weakking, strongking):
+            return False
+        return True
+
+
+    def set_win(self, position):
+        """Marks position as won by the strong side, queues it so its predecessors are looked at"""
+
+        self.win[position] = 1
+        self.queue.append(position)
+
+
+    def set_up(self):
+        """Count the moves of each weak-to-move position, find the checkmates (and promotions for KPK)"""
+
+        for strongking in range(SQUARES):
+            for weakking in range(SQUARES):
+                for piece in range(SQUARES):
+                    position = index(False, strongking, weakking, piece)
+                    self.counter[position] = NEVER_LOST
+                    if not self.is_legal(False, strongking, weakking, piece):
+                        continue
+
+                    # Count the weak king's moves
+                    moves = 0
+                    escape = False
+                    for square in KING_MOVES[weakking]:
+                        if square == strongking or square in KING_MOVES[strongking]:
+                            continue
+                        # Capturing the piece (if it isn't protected) draws
+                        if square == piece:
+                            escape = True
+                        elif not self.attacks(piece, square, strongking):
+                            moves += 1
+
+                    if escape:
+                        continue
+                    if moves > 0:
+                        self.counter[position] = moves
+                    # No moves and in check, checkmate
+                    elif self.attacks(piece, weakking, strongking):
+                        self.set_win(position)
+
+                # Pawns that promote into a won position
+                if self.endgame == KPK:
+                    for piece in range(8, 16):
+                        if not self.is_legal(True, strongking, weakking, piece):
+                            continue
+                        square = piece - 8
+                        if square == strongking or square == weakking:
+                            continue
+                        for promotion in self.promotions:
+                            if promotion.probe_index(index(False, strongking, weakking, square)):
+                                self.set_win(index(True, strongking, weakking, piece))
+                                break
+
+
+    def unmoves(self, strongking, weakking, piece):
+        """Returns the squares the strong king and piece could have come from (strong king first)"""
+
+        kingsquares = []
+        for square in KING_MOVES[strongking]:
+            if square != weakking and square != piece and square not in KING_MOVES[weakking]:
+                kingsquares.append(square)
+
+        piecesquares = []
+        if self.endgame == KPK:
+            # Pawn moves backwards one square, or two from its starting row
+            square = piece + 8
+            if square < 56 and square != strongking and square != weakking:
+                piecesquares.append(square)
+                if piece // 8 == 4 and square + 8 != strongking and square + 8 != weakking:
+                    piecesquares.append(square + 8)
+        else:
+            if self.endgame == KRK:
+                rays = ROOK_RAYS[piece]
+            else:
+                rays = QUEEN_RAYS[piece]
+            for ray in rays:
+                for square in ray:
+                    if square == strongking or square == weakking:
+                        break
+                    piecesquares.append(square)
+
+        return kingsquares, piecesquares
+
+
+    def run(self):
+        """Retrograde analysis, works backwards from the won positions until no more are found"""
+
+        self.set_up()
+
+        while len(self.queue) > 0:
+            position = self.queue.popleft()
+            piece = position % 64
+            weakking = position // 64 % 64
+            strongking = position // 4096 % 64
+
+            # Weak side to move loses, every strong move into it wins
+            if position >= WEAK_TO_MOVE:
+                kingsquares, piecesquares = self.unmoves(strongking, weakking, piece)
+                for square in kingsquares:
+                    previous = index(True, square, weakking, piece)
+                    if not self.win[previous] and not self.attacks(piece, weakking, square):
+                        self.set_win(previous)
+                for square in piecesquares:
+                    previous = index(True, strongking, weakking, square)
+                    if not self.win[previous] and not self.attacks(square, weakking, strongking):
+                        self.set_win(previous)
+
+            # Strong side to move wins, weak king moves into it are lost, position is lost once all are
+            else:
+                for square in KING_MOVES[weakking]:
+                    if square == strongking or square == piece or square in KING_MOVES[strongking]:
+                        continue
+                    previous = index(False, strongking, square, piece)
+                    if self.counter[previous] == NEVER_LOST or self.win[previous]:
+                        continue
+                    self.counter[previous] -= 1
+                    if self.counter[previous] == 0:
+                        self.set_win(previous)
+
+
+    def save(self, folder):
+        """Writes the bitbase to its file, one bit per position"""
+
+        data = bytearray(POSITIONS // 8)
+        for position in range(POSITIONS):
+            if self.win[position]:
+                data[position >> 3] |= 1 << (position & 7)
+
+        with open(os.path.join(folder, self.endgame + ".bin"), "wb") as file:
+            file.write(data)
+
+
+    def probe_index(self, position):
+        """Returns if the strong side wins the position (same as Bitbases.probe_index)"""
+
+        return self.win[position] == 1
+
+
+class Bitbases():
+    """The built bitbase files, memory-mapped so only the parts that are probed are read"""
+
+    def __init__(self, folder=BITBASE_FOLDER):
+        self.files = {}    # Endgame -> memory-mapped file (endgames that haven't been built are left out)
+
+        for endgame in ENDGAMES:
+            path = os.path.join(folder, endgame + ".bin")
+            if os.path.exists(path) and os.path.getsize(path) == POSITIONS // 8:
+                with open(path, "rb") as file:
+                    self.files[endgame] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+    def probe(self, endgame, strong_to_move, strongking, weakking, piece):
+        """Returns WIN, DRAW or LOSS for the side to move, None if the bitbase hasn't been built"""
+
+        if endgame not in self.files:
+            return None
+
+        position = index(strong_to_move, strongking, weakking, piece)
+        if not self.files[endgame][position >> 3] & (1 << (position & 7)):
+            return DRAW
+        if strong_to_move:
+            return WIN
+        return LOSS
+
+
+def build(folder=BITBASE_FOLDER):
+    """Builds every bitbase and writes them to folder"""
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    built = []
+    for endgame in ENDGAMES:
+        start = time.monotonic()
+        generator = Generator(endgame, built)
+        generator.run()
+        generator.save(folder)
+        built.append(generator)
+
+        print(endgame.upper() + ": " + str(sum(generator.win)) + " won positions, " +
+              str(round(time.monotonic() - start, 1)) + " seconds")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        build(sys.argv[1])
+    else:
+        build()
@@ -0,0 +1,143 @@
+# Chess clocks and time management
+# Each side has its own time, which only runs on its turn. Time controls can add an increment after each move
+# and/or a delay at the start of each turn (the clock doesn't run for the first seconds of the turn). Times
+# are measured with the monotonic clock, so they stay right whatever the computer's time of day does and
+# however long the AI thinks
+# Time management decides how long the AI can search each move from the time it has left
+
+
+import time
+
+
+# Colours (same as the game's)
+BLACK = 0
+WHITE = 1
+
+# Time management constants
+MOVES_TO_GO = 35               # Moves the remaining time is shared between at the start of a game
+MIN_MOVES_TO_GO = 15           # Fewest moves the remaining time is shared between (later in the game)
+INCREMENT_USE = 0.8            # Fraction of the increment that can be spent on each move
+HARD_LIMIT_FACTOR = 4          # A search can run this many times its planned time in a hard position...
+MAX_TIME_FRACTION = 0.25       # ...but never more than this fraction of the time left
+SAFETY_MARGIN = 0.3            # Seconds kept back for making the move (drawing, overhead)
+MIN_SEARCH_SECONDS = 0.01      # Least time given to a search
+
+
+class TimeControl():
+    """Starting time for each side, seconds added after each move (increment) and seconds at the start of
+    each turn the clock doesn't run for (delay)"""
+    def __init__(self, seconds, increment=0, delay=0):
+        self.seconds = seconds
+        self.increment = increment
+        self.delay = delay
+
+
+    def name(self):
+        """Returns the time control written the usual way, minutes+increment and d for a delay (e.g. 3+2, 5 d3)"""
+
+        minutes = self.seconds/60
+        if minutes == int(minutes):
+            minutes = int(minutes)
+        text = str(minutes)
+        if self.increment > 0 or self.delay == 0:
+            text += "+" + str(self.increment)
+        if self.delay > 0:
+            text += " d" + str(self.delay)
+        return text
+
+
+    def pgn_tag(self):
+        """Returns the time control as a PGN TimeControl tag value (seconds+increment)"""
+
+        return str(self.seconds) + "+" + str(self.increment)
+
+
+class ChessClock():
+    """Both sides' clocks, the side to move's clock runs until it moves"""
+
+    def __init__(self, control):
+        self.control = control                         # Time control (TimeControl)
+        self.times = [control.seconds, control.seconds]   # Seconds each side had left when its turn started
+        self.running = None                            # Colour whose clock is running, None if stopped
+        self.started = 0                               # Time (time.monotonic()) the running clock's turn started
+
+
+    def used(self):
+        """Returns the seconds the running clock has used this turn (not counting the delay)"""
+
+        if self.running == None:
+            return 0
+        return max(0, time.monotonic() - self.started - self.control.delay)
+
+
+    def remaining(self, colour):
+        """Returns the seconds colour has left (0 if it has run out)"""
+
+        left = self.times[colour]
+        if colour == self.running:
+            left -= self.used()
+        return max(0, left)
+
+
+    def start(self, colour):
+        """Starts colour's clock (stopping the other one without an increment)"""
+
+        self.stop()
+        self.running = colour
+        self.started = time.monotonic()
+
+
+    def stop(self):
+        """Stops the running clock, keeping its time left"""
+
+        if self.running != None:
+            self.times[self.running] = self.remaining(self.running)
+            self.running = None
+
+
+    def press(self):
+        """The running side has moved, adds its increment (unless it ran out of time) and starts the other side's
+        clock"""
+
+        colour = self.running
+        if colour == None:
+            return
+        self.stop()
+        if self.times[colour] > 0:
+            self.times[colour] += self.control.increment
+        self.start(1 - colour)
+
+
+    def flagged(self):
+        """Returns the colour that has run out of time, None if neither has"""
+
+        for colour in (BLACK, WHITE):
+            if self.remaining(colour) <= 0:
+                return colour
+        return None
+
+
+def clock_text(seconds):
+    """Returns the time left as minutes:seconds, with tenths under ten seconds"""
+
+    if seconds < 10:
+        return "0:0" + str(int(seconds*10)/10)
+    seconds = int(seconds)
+    return str(seconds//60) + ":" + str(seconds % 60).zfill(2)
+
+
+def allocate_time(remaining, control, moves_played):
+    """Returns the seconds (soft, hard) a search can take with remaining seconds left. No new search depth is
+    started after soft seconds, a depth still running after hard seconds is stopped. The time left is shared
+    between the moves expected to be left in the game, plus most of the increment and the delay (which
+    don't come out of the clock). Hard gives room for a position that needs more search, but never so much
+    that a single move could use up the clock"""
+
+    movestogo = max(MIN_MOVES_TO_GO, MOVES_TO_GO - moves_played//2)
+    usable = max(0, remaining - SAFETY_MARGIN)
+
+    soft = usable/movestogo + control.increment*INCREMENT_USE + control.delay
+    hard = min(soft*HARD_LIMIT_FACTOR, usable*MAX_TIME_FRACTION + control.delay)
+    soft = min(soft, hard)
+
+    return max(MIN_SEARCH_SECONDS, soft), max(MIN_SEARCH_SECONDS, hard)
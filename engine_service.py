@@ -0,0 +1,355 @@
+# Engine service, answers "best move" and "analyse" requests for positions over HTTP (JSON), so other programs
+# can use the AI without the game. Searches run in a fixed number of worker processes, each with a time limit.
+# Requests wait in a queue of limited size (busy answers once it's full), and requests for a position that is
+# already being searched wait for that search instead of starting another one
+# Run with "python engine_service.py [port] [workers]"
+#
+#   POST /bestmove  {"fen": "...", "moves": ["e4", "e5"], "depth": 4, "time_limit": 2.0}
+#   POST /analyse   {"fen": "...", "moves": [], "depth": 4, "lines": 3, "time_limit": 2.0}
+#   GET  /health    number of searches running and waiting, requests answered, coalesced and turned away
+# "fen" is the position (starting position if left out), "moves" are SAN moves played from it. Scores are
+# white positive, a pawn is 10
+
+
+from Chess import *
+import sys, os, json, time, signal, asyncio, threading, concurrent.futures
+
+
+# Service constants
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8766
+SERVICE_WORKERS = os.cpu_count() or 1   # Worker processes searching at once
+QUEUE_SIZE = 32                # Searches that can wait for a worker, busy (503) answered after that
+MAX_BODY = 65536               # Largest request body accepted (bytes)
+MAX_MOVES_PLAYED = 600         # Most moves a request can play from its position
+
+# Search limit constants
+DEFAULT_DEPTH = HARD
+MAX_DEPTH = 8
+DEFAULT_TIME_LIMIT = 2.0       # Seconds a search can take if the request doesn't say
+MAX_TIME_LIMIT = 30.0
+TIME_LIMIT_GRACE = 1.0         # Extra seconds allowed for a search to stop before the request is timed out
+MAX_QUEUE_WAIT = 10.0          # Longest a request waits for a worker (on top of its time limit) before it's timed out
+DEFAULT_LINES = 3
+MAX_LINES = 10
+
+# HTTP status messages
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+               504: "Gateway Timeout"}
+
+
+class RequestError(Exception):
+    """A request that can't be answered, with the HTTP status and message to answer with"""
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+def set_up_position(pieces, position):
+    """Returns the board and colour to move of a request's position ("fen" and "moves" played from it)"""
+
+    fen = position.get("fen", START_FEN)
+    moves = position.get("moves", [])
+    if not isinstance(fen, str):
+        raise ValueError("fen must be a string")
+    if not isinstance(moves, list) or not all(isinstance(san, str) for san in moves):
+        raise ValueError("moves must be a list of SAN moves")
+    if len(moves) > MAX_MOVES_PLAYED:
+        raise ValueError("Too many moves")
+
+    board = Board(pieces)
+    colour = board.set_up_fen(fen)
+    for san in moves:
+        board.play_move(board.parse_san(san, colour), None)
+        colour = opposite_colour(colour)
+    return board, colour
+
+
+# Each worker process keeps its pieces and AI between searches, so the AI's tables are reused
+worker_pieces = None
+worker_ai = None
+
+
+def start_worker():
+    """Worker process initializer, creates the pieces and AI the worker's searches use"""
+
+    global worker_pieces, worker_ai
+    worker_pieces = create_pieces(False)
+    worker_ai = ChessAI()
+
+
+def search_position(position, depth, seconds, lines):
+    """Worker process function, searches the position one depth at a time until depth or the time limit is
+    reached, returns the answer of the deepest search finished. lines is 0 for best move (get_best_move),
+    the number of best moves otherwise (get_best_moves)"""
+
+    start = time.monotonic()
+    board, colour = set_up_position(worker_pieces, position)
+    ai = worker_ai
+    ai.nodes = 0
+    ai.stop_event = None
+    ai.deadline = None
+
+    # Depth 1 always finishes (so there is an answer), deeper searches stop at the time limit
+    completed = 0
+    analysis = None
+    for current in range(1, depth + 1):
+        if current > 1:
+            ai.stop_event = threading.Event()
+            ai.deadline = start + seconds
+        try:
+            if lines == 0:
+                stats = ai.get_best_move(board, colour, current, 1000, -1000)
+                if stats[1] == (-1, -1):
+                    analysis = []
+                else:
+                    analysis = [AnalysisLine(stats[0], ai.principal_variation(board, colour, ai.rootmove, current))]
+            else:
+                analysis = ai.get_best_moves(board, colour, current, lines)
+        except SearchStopped:
+            break
+        completed = current
+
+    # Moves in the answer as from and to slots and SAN
+    answer = {"depth": completed, "nodes": ai.nodes, "seconds": round(time.monotonic() - start, 3),
+              "turn": COLOUR_NAMES[colour], "lines": []}
+    for line in analysis:
+        sans = []
+        current = board.make_copy()
+        for move in line.moves:
+            sans.append(current.get_san(move_from(move), move_to(move), move_promotion(move)))
+            current.play_move(move, None)
+        answer["lines"].append({"move": move_name(line.moves[0]), "san": sans[0], "score": line.score,
+                                "pv": [move_name(move) for move in line.moves], "pv_san": sans})
+
+    # No legal moves, checkmate or stalemate
+    if len(analysis) == 0:
+        if board.is_in_check(opposite_colour(colour)):
+            answer["result"] = "checkmate"
+        else:
+            answer["result"] = "stalemate"
+
+    return answer
+
+
+class EngineService():
+    """The HTTP service, one asyncio task per connection, searches in a process pool"""
+
+    def __init__(self, workers=SERVICE_WORKERS, queue=QUEUE_SIZE):
+        self.pieces = create_pieces(False)   # Pieces (without images) for checking positions
+        self.workers = workers               # Worker processes searching at once
+        self.pool = concurrent.futures.ProcessPoolExecutor(workers, initializer=start_worker)
+        self.capacity = workers + queue      # Most searches running and waiting at once
+        self.active = 0                      # Searches running or waiting for a worker
+        self.searches = {}                   # Searches running or waiting, request key -> future of the answer
+        self.answered = 0                    # Requests answered with a search result
+        self.coalesced = 0                   # Requests that waited for another request's search
+        self.rejected = 0                    # Requests turned away because the queue was full
+
+
+    async def handle(self, reader, writer):
+        """Task for one connection, answers its requests until it closes (keep-alive)"""
+
+        try:
+            while True:
+                keep_alive = True
+                try:
+                    request = await self.read_request(reader)
+                    if request == None:
+                        break
+                    method, path, headers, body = request
+                    keep_alive = headers.get("connection", "").lower() != "close"
+                    status, answer = await self.route(method, path, body)
+                except RequestError as error:
+                    status, answer = error.status, {"error": str(error)}
+                    keep_alive = False
+
+                self.write_response(writer, status, answer, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+    async def read_request(self, reader):
+        """Returns the method, path, headers and body of the next request, None if the connection closed"""
+
+        line = await reader.readline()
+        if line == b"":
+            return None
+        try:
+            method, path, version = line.decode("latin-1").split()
+        except ValueError:
+            raise RequestError(400, "Bad request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise RequestError(400, "Bad Content-Length")
+        if length > MAX_BODY:
+            raise RequestError(413, "Body too large")
+        body = await reader.readexactly(length)
+
+        return method, path, headers, body
+
+
+    def write_response(self, writer, status, answer, keep_alive):
+        """Writes a JSON response"""
+
+        data = json.dumps(answer, separators=(",", ":")).encode()
+        head = "HTTP/1.1 " + str(status) + " " + STATUS_TEXT[status] + "\r\n"
+        head += "Content-Type: application/json\r\nContent-Length: " + str(len(data)) + "\r\n"
+        if status == 503:
+            head += "Retry-After: 1\r\n"
+        if not keep_alive:
+            head += "Connection: close\r\n"
+        writer.write(head.encode() + b"\r\n" + data)
+
+
+    async def route(self, method, path, body):
+        """Answers a request, returns the status and answer"""
+
+        path = path.split("?")[0]
+        if path == "/health":
+            return 200, {"active": self.active, "capacity": self.capacity, "answered": self.answered,
+                         "coalesced": self.coalesced, "rejected": self.rejected}
+        if path not in ("/bestmove", "/analyse"):
+            raise RequestError(404, "Unknown endpoint")
+        if method != "POST":
+            raise RequestError(405, "Use POST")
+
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            raise RequestError(400, "Body must be JSON")
+        if not isinstance(request, dict):
+            raise RequestError(400, "Body must be a JSON object")
+
+        lines = 0
+        if path == "/analyse":
+            lines = self.get_number(request, "lines", DEFAULT_LINES, 1, MAX_LINES, int)
+        depth = self.get_number(request, "depth", DEFAULT_DEPTH, 1, MAX_DEPTH, int)
+        seconds = self.get_number(request, "time_limit", DEFAULT_TIME_LIMIT, 0, MAX_TIME_LIMIT, (int, float))
+
+        try:
+            board, colour = set_up_position(self.pieces, request)
+        except ValueError as error:
+            raise RequestError(400, str(error))
+
+        position = {"fen": request.get("fen", START_FEN), "moves": request.get("moves", [])}
+        return 200, await self.search(board.get_position_key(colour), position, depth, seconds, lines)
+
+
+    def get_number(self, request, name, default, low, high, types):
+        """Returns a number from the request (default if it isn't given), checks it's between low and high"""
+
+        value = request.get(name, default)
+        if isinstance(value, bool) or not isinstance(value, types) or value < low or value > high:
+            raise RequestError(400, name + " must be a number from " + str(low) + " to " + str(high))
+        return value
+
+
+    async def search(self, key, position, depth, seconds, lines):
+        """Returns the answer of a search, waits for the same search if it's already running"""
+
+        # Same position and limits already being searched, wait for its answer
+        request = (key, depth, seconds, lines)
+        if request in self.searches:
+            self.coalesced += 1
+            return await self.wait(self.searches[request], seconds + TIME_LIMIT_GRACE + self.queue_time(request))
+
+        # Queue is full, try again later
+        if self.active >= self.capacity:
+            self.rejected += 1
+            raise RequestError(503, "Too many searches waiting")
+
+        # Search is counted until the worker finishes it (even if the request times out first)
+        self.active += 1
+        future = asyncio.get_running_loop().run_in_executor(self.pool, search_position, position, depth, seconds,
+                                                            lines)
+        self.searches[request] = future
+
+        def finished(future):
+            self.active -= 1
+            del self.searches[request]
+        future.add_done_callback(finished)
+
+        return await self.wait(future, seconds + TIME_LIMIT_GRACE + self.queue_time(request))
+
+
+    async def wait(self, future, seconds):
+        """Returns the answer of a search, once it's done or seconds have passed"""
+
+        queued = time.monotonic()
+        try:
+            answer = await asyncio.wait_for(asyncio.shield(future), seconds)
+        except asyncio.TimeoutError:
+            raise RequestError(504, "Search took too long")
+        except Exception as error:
+            raise RequestError(500, "Search failed: " + str(error))
+
+        self.answered += 1
+        answer = dict(answer)
+        answer["waited"] = round(time.monotonic() - queued, 3)
+        return answer
+
+
+    def queue_time(self, request):
+        """Returns the longest the request's search could wait for a worker: the other searches running or
+        waiting each using all of their time limit, shared between the workers (at most MAX_QUEUE_WAIT)"""
+
+        others = sum(other[2] + TIME_LIMIT_GRACE for other in self.searches if other != request)
+        return min(MAX_QUEUE_WAIT, others/max(1, self.workers))
+
+
+    async def serve(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        """Runs the service until it's stopped"""
+
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_BODY)
+        print("Serving on http://" + host + ":" + str(port))
+
+        # Ctrl+C or terminate stops the service (not available on Windows, where Ctrl+C interrupts it instead)
+        stopped = asyncio.Event()
+        for signalnumber in (signal.SIGINT, signal.SIGTERM):
+            try:
+                asyncio.get_running_loop().add_signal_handler(signalnumber, stopped.set)
+            except NotImplementedError:
+                pass
+
+        async with server:
+            await stopped.wait()
+
+
+def main():
+    """Mainline for the engine service"""
+
+    port = SERVICE_PORT
+    workers = SERVICE_WORKERS
+    if len(sys.argv) > 1:
+        port = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        workers = int(sys.argv[2])
+
+    service = EngineService(workers)
+    try:
+        asyncio.run(service.serve(SERVICE_HOST, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.pool.shutdown(cancel_futures=True)
+
+
+if __name__ == "__main__":
+    main()
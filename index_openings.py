@@ -0,0 +1,129 @@
+# Builds the opening explorer index (openings.py) from a PGN database of games
+# Games are read one at a time and sent to worker processes in batches, each worker replays its games and
+# counts the moves played from each position. Counts are written to sorted run files whenever too many are
+# held in memory, and the runs are merged into the index at the end, so memory use doesn't grow with the
+# size of the database
+# Run with "python index_openings.py games.pgn [index file]"
+
+
+from Chess import *
+import sys, os, time, shutil, tempfile, multiprocessing
+from collections import deque
+import pgn, openings
+
+
+# Indexing constants
+INDEX_PLIES = 24               # Moves (of either colour) of each game that are indexed
+BATCH_GAMES = 500              # Games sent to a worker at a time
+RUN_MAX_ENTRIES = 1000000      # Counts held in memory before they are written to a run file
+MIN_GAMES = 2                  # Moves played in fewer games than this are left out of the index
+
+# Index of each result in the counts (white wins, draw, black wins)
+RESULT_INDEX = {pgn.WHITE_WINS: 0, pgn.DRAW: 1, pgn.BLACK_WINS: 2}
+
+
+def read_batches(path):
+    """Generator, yields lists of (moves, result) of the finished games in the PGN file, BATCH_GAMES at a time.
+    Games that don't start from the normal starting position are skipped"""
+
+    batch = []
+    for game in pgn.read_file(path):
+        if game.result not in RESULT_INDEX or "FEN" in game.tags:
+            continue
+        batch.append((game.moves[:INDEX_PLIES], game.result))
+        if len(batch) == BATCH_GAMES:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+def index_batch(batch):
+    """Worker function, replays the games and returns (position key, packed move) -> [white, draws, black]
+    counts, and the number of games with an illegal move (indexed up to that move)"""
+
+    pieces = create_pieces(False)
+    entries = {}
+    illegal = 0
+
+    for moves, result in batch:
+        try:
+            for board, colour, move in replay_game(moves, pieces):
+                entry = (board.get_position_key(colour), move)
+                if entry not in entries:
+                    entries[entry] = [0, 0, 0]
+                entries[entry][RESULT_INDEX[result]] += 1
+        except ValueError:
+            illegal += 1
+
+    return entries, illegal
+
+
+def add_entries(entries, new):
+    """Adds the counts in new to entries"""
+
+    for entry in new:
+        if entry in entries:
+            counts = entries[entry]
+            for i in range(3):
+                counts[i] += new[entry][i]
+        else:
+            entries[entry] = new[entry]
+
+
+def build(pgnpath, indexpath=openings.INDEX_PATH, processes=None):
+    """Indexes the games in the PGN file, writes the index file"""
+
+    start = time.monotonic()
+    if processes == None:
+        processes = os.cpu_count() or 1
+
+    folder = tempfile.mkdtemp()
+    runs = []
+    entries = {}
+    games = 0
+    illegal = 0
+
+    with multiprocessing.Pool(processes) as pool:
+
+        # Only a few batches are waiting for a worker at a time, so the PGN file isn't read ahead into memory
+        pending = deque()
+        batches = read_batches(pgnpath)
+        while True:
+            batch = next(batches, None)
+            if batch != None:
+                games += len(batch)
+                pending.append(pool.apply_async(index_batch, (batch,)))
+            if len(pending) == 0:
+                break
+            if batch != None and len(pending) < 2*processes:
+                continue
+
+            # Add the oldest batch's counts, write them to a run file if there are too many to hold
+            new, count = pending.popleft().get()
+            illegal += count
+            add_entries(entries, new)
+            if len(entries) >= RUN_MAX_ENTRIES:
+                runs.append(os.path.join(folder, "run" + str(len(runs)) + ".bin"))
+                openings.write_run(runs[-1], entries)
+                entries = {}
+
+    if len(entries) > 0:
+        runs.append(os.path.join(folder, "run" + str(len(runs)) + ".bin"))
+        openings.write_run(runs[-1], entries)
+        entries = {}
+
+    records = openings.merge_runs(runs, indexpath, MIN_GAMES)
+    shutil.rmtree(folder)
+
+    print(str(games) + " games (" + str(illegal) + " with illegal moves), " + str(records) + " moves indexed, " +
+          str(round(time.monotonic() - start, 1)) + " seconds")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        build(sys.argv[1], sys.argv[2])
+    elif len(sys.argv) > 1:
+        build(sys.argv[1])
+    else:
+        print("Usage: python index_openings.py games.pgn [index file]")
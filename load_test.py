@@ -0,0 +1,182 @@
+# Load test for the game server (server.py), plays many games at once with random legal moves and measures
+# moves per second and how long the server takes to answer each move
+# Starts a server on the port if one isn't already running there
+# Run with "python load_test.py [games] [moves per game] [AI depth, 0 for two player games] [port]"
+
+
+import sys, os, json, time, random, socket, asyncio, subprocess
+import server
+
+
+# Load test constants
+GAMES = 1000                   # Games played at once
+MOVES_PER_GAME = 40            # Moves (of either colour) played in each game
+AI_DEPTH = 0                   # Depth of the AI in human vs AI games, 0 for two player games
+START_SPREAD = 2.0             # Games start over this many seconds (so connections don't all arrive at once)
+SERVER_START_SECONDS = 30      # Longest wait for a started server to accept connections
+
+
+class Results():
+    """Measurements of the whole load test"""
+    def __init__(self):
+        self.latencies = []       # Seconds from sending each move to receiving the server's update for it
+        self.finished = 0         # Games played to the end (moves per game or a result)
+        self.errors = 0           # Error messages from the server
+
+
+async def send(writer, message):
+    """Sends a message to the server"""
+
+    writer.write(json.dumps(message).encode() + b"\n")
+    await writer.drain()
+
+
+async def receive(reader):
+    """Returns the next message from the server, None if it disconnected"""
+
+    line = await reader.readline()
+    if line == b"":
+        return None
+    return json.loads(line)
+
+
+async def play(reader, writer, colour, limit, rng, results, message=None):
+    """Plays one side of a game with random legal moves until the game ends or limit moves have been made
+    (message is the first message if it has already been read)"""
+
+    sent = None
+    move = None
+    while True:
+        if message == None:
+            message = await receive(reader)
+        if message == None:
+            return
+        if message["type"] == "error":
+            results.errors += 1
+            return
+        if message["type"] != "update" and message["type"] != "state":
+            message = None
+            continue
+
+        # Server's answer to the move sent
+        if message["type"] == "update" and sent != None and message["move"] == move:
+            results.latencies.append(time.perf_counter() - sent)
+            sent = None
+
+        if message["result"] != "*" or len(message["moves"]) >= limit:
+            return
+        if message["turn"] == colour and sent == None and len(message["legal"]) > 0:
+            move = rng.choice(message["legal"])
+            sent = time.perf_counter()
+            await send(writer, {"type": "move", "game": message["game"], "move": move})
+        message = None
+
+
+async def run_game(host, port, delay, limit, aidepth, seed, results):
+    """Creates a game (and joins it with a second connection for two players) and plays it"""
+
+    await asyncio.sleep(delay)
+    rng = random.Random(seed)
+
+    reader, writer = await asyncio.open_connection(host, port)
+    create = {"type": "create", "colour": "white"}
+    if aidepth > 0:
+        create["ai"] = aidepth
+    await send(writer, create)
+    state = await receive(reader)
+    if state == None or state["type"] != "state":
+        results.errors += 1
+        writer.close()
+        return
+
+    players = [play(reader, writer, "white", limit, rng, results, state)]
+    writers = [writer]
+    if aidepth == 0:
+        blackreader, blackwriter = await asyncio.open_connection(host, port)
+        await send(blackwriter, {"type": "join", "game": state["game"]})
+        players.append(play(blackreader, blackwriter, "black", limit, rng, results))
+        writers.append(blackwriter)
+
+    await asyncio.gather(*players)
+    results.finished += 1
+    for writer in writers:
+        writer.close()
+
+
+async def run(host, port, games, limit, aidepth):
+    """Plays all the games at once, returns the results"""
+
+    results = Results()
+    await asyncio.gather(*[run_game(host, port, START_SPREAD*i/games, limit, aidepth, i, results)
+                           for i in range(games)], return_exceptions=True)
+    return results
+
+
+def server_running(host, port):
+    """Returns if something is accepting connections on the port"""
+
+    try:
+        socket.create_connection((host, port), 1).close()
+        return True
+    except OSError:
+        return False
+
+
+def percentile(values, fraction):
+    """Returns the value fraction of the way through the sorted values"""
+
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction*len(values)))]
+
+
+def main():
+    """Mainline for the load test"""
+
+    games = GAMES
+    limit = MOVES_PER_GAME
+    aidepth = AI_DEPTH
+    port = server.SERVER_PORT
+    if len(sys.argv) > 1:
+        games = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        limit = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        aidepth = int(sys.argv[3])
+    if len(sys.argv) > 4:
+        port = int(sys.argv[4])
+
+    # Start a server if there isn't one running
+    process = None
+    if not server_running(server.SERVER_HOST, port):
+        folder = os.path.dirname(os.path.abspath(__file__))
+        process = subprocess.Popen([sys.executable, os.path.join(folder, "server.py"), str(port)], cwd=folder,
+                                   stdout=subprocess.DEVNULL)
+        start = time.monotonic()
+        while not server_running(server.SERVER_HOST, port):
+            if time.monotonic() - start > SERVER_START_SECONDS:
+                process.kill()
+                print("Server didn't start")
+                return
+            time.sleep(0.1)
+
+    try:
+        start = time.perf_counter()
+        results = asyncio.run(run(server.SERVER_HOST, port, games, limit, aidepth))
+        seconds = time.perf_counter() - start
+    finally:
+        if process != None:
+            process.terminate()
+            process.wait()
+
+    moves = len(results.latencies)
+    print(str(games) + " games (" + str(results.finished) + " finished, " + str(results.errors) + " errors), " +
+          str(moves) + " player moves in " + str(round(seconds, 2)) + " seconds")
+    if moves > 0:
+        print("Moves per second: " + str(round(moves/seconds)))
+        print("Latency p50: " + str(round(percentile(results.latencies, 0.5)*1000, 2)) + " ms, p99: " +
+              str(round(percentile(results.latencies, 0.99)*1000, 2)) + " ms, max: " +
+              str(round(max(results.latencies)*1000, 2)) + " ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# Opening explorer index, how often each move was played from each position in a database of games and
+# how those games ended. Built offline from a PGN file (python index_openings.py games.pgn), stored as fixed
+# size records sorted by position key so a position is found by binary search of the memory-mapped file
+
+
+import os, mmap, struct, heapq
+
+
+# Default file the index is stored in
+INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "openings.bin")
+
+# File format, header (magic, version, number of records) then the records
+MAGIC = b"PYCO"
+VERSION = 1
+HEADER = struct.Struct("<4sII")
+# Record: position key, packed move, games white won, games drawn, games black won
+RECORD = struct.Struct("<QHIII")
+
+
+class OpeningMove():
+    """A move played from a position in the database and the results of the games it was played in"""
+    def __init__(self, move, white, draws, black):
+        self.move = move          # Packed move
+        self.white = white        # Games white won
+        self.draws = draws        # Games drawn
+        self.black = black        # Games black won
+        self.games = white + draws + black
+
+
+    def score(self, white_to_move):
+        """Returns the fraction of points the side to move scored after the move (win 1, draw 0.5)"""
+
+        if white_to_move:
+            return (self.white + self.draws/2)/self.games
+        return (self.black + self.draws/2)/self.games
+
+
+class OpeningIndex():
+    """The built index file, memory-mapped so only the parts that are looked up are read"""
+
+    def __init__(self, path=INDEX_PATH):
+        self.data = None     # Memory-mapped file (None if the index hasn't been built)
+        self.count = 0       # Number of records
+
+        if os.path.exists(path) and os.path.getsize(path) >= HEADER.size:
+            with open(path, "rb") as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, count = HEADER.unpack_from(data, 0)
+            if magic == MAGIC and version == VERSION and len(data) == HEADER.size + count*RECORD.size:
+                self.data = data
+                self.count = count
+
+
+    def key_at(self, index):
+        """Returns the position key of record number index"""
+
+        return struct.unpack_from("<Q", self.data, HEADER.size + index*RECORD.size)[0]
+
+
+    def lookup(self, key):
+        """Returns the moves played from the position (OpeningMove), most played first, empty if it isn't in
+        the index. Binary search for the first record of the position, its moves are the records after it"""
+
+        if self.data == None:
+            return []
+
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high)//2
+            if self.key_at(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        moves = []
+        while low < self.count and self.key_at(low) == key:
+            record = RECORD.unpack_from(self.data, HEADER.size + low*RECORD.size)
+            moves.append(OpeningMove(record[1], record[2], record[3], record[4]))
+            low += 1
+        moves.sort(key=lambda move: move.games, reverse=True)
+        return moves
+
+
+def write_run(path, entries):
+    """Writes (key, move) -> [white, draws, black] entries to a file as sorted records (no header)"""
+
+    with open(path, "wb") as file:
+        for key, move in sorted(entries):
+            results = entries[(key, move)]
+            file.write(RECORD.pack(key, move, results[0], results[1], results[2]))
+
+
+def read_run(path):
+    """Generator, yields the records of a run file written by write_run"""
+
+    with open(path, "rb") as file:
+        while True:
+            data = file.read(RECORD.size)
+            if len(data) < RECORD.size:
+                return
+            yield RECORD.unpack(data)
+
+
+def merge_runs(runs, path, min_games=1):
+    """Merges sorted run files into the index file, adding up records of the same position and move. Moves
+    played in fewer than min_games games are left out. Only one record of each run is in memory at a time"""
+
+    count = 0
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, 0))
+
+        current = None
+        for record in heapq.merge(*[read_run(run) for run in runs]):
+            if current != None and record[0] == current[0] and record[1] == current[1]:
+                current = [current[0], current[1], current[2] + record[2], current[3] + record[3],
+                           current[4] + record[4]]
+                continue
+            if current != None and current[2] + current[3] + current[4] >= min_games:
+                file.write(RECORD.pack(*current))
+                count += 1
+            current = list(record)
+        if current != None and current[2] + current[3] + current[4] >= min_games:
+            file.write(RECORD.pack(*current))
+            count += 1
+
+        # Number of records goes in the header once it's known
+        file.seek(0)
+        file.write(HEADER.pack(MAGIC, VERSION, count))
+
+    return count
@@ -0,0 +1,176 @@
+# PGN (Portable Game Notation) writing and reading
+# Games are read one at a time from a file with a generator, so files of any size can be read without
+# holding more than one game in memory. Moves are kept as SAN text, Board.parse_san/get_san in Chess.py
+# turn them into moves on a board (replay_game replays a whole game)
+
+
+import os, re, time
+
+
+# Result constants
+WHITE_WINS = "1-0"
+BLACK_WINS = "0-1"
+DRAW = "1/2-1/2"
+UNFINISHED = "*"
+RESULTS = [WHITE_WINS, BLACK_WINS, DRAW, UNFINISHED]
+
+# Tags every game has, written first and in this order
+SEVEN_TAG_ROSTER = ["Event", "Site", "Date", "Round", "White", "Black", "Result"]
+
+# Longest line of moves written
+LINE_LENGTH = 79
+
+# Folder and file finished games are saved to
+GAMES_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "games")
+GAMES_FILE = "games.pgn"
+
+# Tag pair and movetext tokens (comments, variations, NAGs, moves and move numbers)
+TAG_PATTERN = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+TOKEN_PATTERN = re.compile(r"\{[^}]*\}?|;.*|\(|\)|\$\d+|[^\s{}();]+")
+MOVE_NUMBER_PATTERN = re.compile(r"^\d+\.*")
+
+
+class PgnGame():
+    """A game as PGN, its tags (name -> value), SAN moves and result"""
+
+    def __init__(self, tags=None, moves=None, result=UNFINISHED):
+        if tags == None:
+            tags = {}
+        if moves == None:
+            moves = []
+        self.tags = tags          # Tag name -> value
+        self.moves = moves        # Moves in SAN (e.g. "e4", "Nxf7+", "O-O", "e8=Q#")
+        self.result = result      # One of RESULTS
+
+
+def write_game(game):
+    """Returns the game as PGN text"""
+
+    # Tags, seven tag roster first
+    tags = dict(game.tags)
+    tags["Result"] = game.result
+    text = ""
+    for name in SEVEN_TAG_ROSTER:
+        text += '[' + name + ' "' + tags.pop(name, "?").replace("\\", "\\\\").replace('"', '\\"') + '"]\n'
+    for name in tags:
+        text += '[' + name + ' "' + tags[name].replace("\\", "\\\\").replace('"', '\\"') + '"]\n'
+    text += "\n"
+
+    # Moves with move numbers, wrapped so no line is too long
+    tokens = []
+    for i in range(len(game.moves)):
+        if i % 2 == 0:
+            tokens.append(str(i//2 + 1) + ".")
+        tokens.append(game.moves[i])
+    tokens.append(game.result)
+
+    line = ""
+    for token in tokens:
+        if line == "":
+            line = token
+        elif len(line) + 1 + len(token) > LINE_LENGTH:
+            text += line + "\n"
+            line = token
+        else:
+            line += " " + token
+    text += line + "\n\n"
+
+    return text
+
+
+def save_game(game, path=None):
+    """Adds the game to the end of a PGN file (the games file if no path is given)"""
+
+    if path == None:
+        if not os.path.exists(GAMES_FOLDER):
+            os.makedirs(GAMES_FOLDER)
+        path = os.path.join(GAMES_FOLDER, GAMES_FILE)
+
+    with open(path, "a") as file:
+        file.write(write_game(game))
+
+
+def read_games(lines):
+    """Generator, yields each game (PgnGame) in the lines of PGN text (e.g. an open file) as it's read.
+    Comments, variations and NAGs are skipped"""
+
+    game = PgnGame()
+    movetext = False      # If the moves of the current game have started
+    incomment = False     # Inside a comment that continues onto the next line
+    depth = 0             # How many variations deep (moves in variations are skipped)
+
+    for line in lines:
+        line = line.strip()
+
+        # Rest of a comment from an earlier line
+        if incomment:
+            if "}" not in line:
+                continue
+            line = line[line.index("}") + 1:]
+            incomment = False
+
+        # Escaped line
+        if line.startswith("%"):
+            continue
+
+        # Tag pair (a new game has started if the last one had moves but no result)
+        if line.startswith("[") and depth == 0:
+            match = TAG_PATTERN.match(line)
+            if match != None:
+                if movetext:
+                    yield game
+                    game = PgnGame()
+                    movetext = False
+                game.tags[match.group(1)] = match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+                continue
+
+        for token in TOKEN_PATTERN.findall(line):
+            # Comment (might continue onto the next lines), rest of line comment
+            if token[0] == "{":
+                if not token.endswith("}"):
+                    incomment = True
+                continue
+            if token[0] == ";":
+                break
+
+            # Variations
+            if token == "(":
+                depth += 1
+                continue
+            if token == ")":
+                depth = max(0, depth - 1)
+                continue
+            if depth > 0 or token[0] == "$":
+                continue
+
+            # Result ends the game
+            movetext = True
+            if token in RESULTS:
+                game.result = token
+                yield game
+                game = PgnGame()
+                movetext = False
+                continue
+
+            # Move (move number in front of it taken off)
+            token = MOVE_NUMBER_PATTERN.sub("", token)
+            if token != "":
+                game.moves.append(token)
+
+    # Last game had no result
+    if movetext or len(game.tags) > 0:
+        yield game
+
+
+def read_file(path):
+    """Generator, yields each game in the PGN file"""
+
+    with open(path, errors="replace") as file:
+        for game in read_games(file):
+            yield game
+
+
+def today():
+    """Returns the date in PGN format (year.month.day)"""
+
+    return time.strftime("%Y.%m.%d")
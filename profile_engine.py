@@ -0,0 +1,198 @@
+# Profiles the AI on a whole game without the window, to see where its time goes. The game is either the first
+# game of a PGN file (the AI searches each position of it, then the game's move is played) or the AI playing
+# itself (move ordering seeded, so it's the same game every run). The game is played twice: under cProfile,
+# written as a pstats file with a summary of the time spent in the search's main functions, then with a
+# sampling profiler (the main thread's stack looked at every millisecond from another thread, which slows the
+# game far less than cProfile) written as collapsed stacks, one "outer;inner;function count" line per stack,
+# the format flamegraph tools (flamegraph.pl, speedscope, inferno) read
+# Run with "python profile_engine.py [game.pgn|selfplay] [depth] [plies] [output folder]"
+# (or "python Chess.py --profile ...")
+
+
+from Chess import *
+import sys, os, time, threading, cProfile, pstats
+import pgn
+
+
+# Profiling constants
+PROFILE_FOLDER = "profile"     # Folder the profiles are written to
+PROFILE_DEPTH = 3              # Depth the AI searches each move
+PROFILE_PLIES = 40             # Moves (of either colour) played in a self-play game
+PROFILE_SEED = 2022            # Seed of the AI's move ordering tie breaks
+SAMPLE_SECONDS = 0.001         # Time between the sampling profiler's looks at the stack
+SUMMARY_TOP = 15               # Functions listed by their own time in the summary
+
+# Functions the summary reports on (function name in the profile, name shown)
+PROFILED_FUNCTIONS = [("get_best_move", "ChessAI.get_best_move"), ("valid_moves", "Board.valid_moves"),
+                      ("do_not_move_into_check", "Board.do_not_move_into_check"),
+                      ("make_copy", "Board.make_copy"), ("get_board_score", "Board.get_board_score")]
+
+
+def play_game(moves, depth, plies):
+    """Plays the game, the AI searching each position, returns the number of positions searched. Moves is a
+    list of SAN moves to play (a scripted game), or None for the AI to play itself for plies moves"""
+
+    board = Board(create_pieces(False))
+    board.set_up_initial_board()
+    ai = ChessAI()
+    ai.random.seed(PROFILE_SEED)
+    colour = WHITE
+
+    searched = 0
+    while (moves == None and searched < plies) or (moves != None and searched < len(moves)):
+        score, firstslot, secondslot = ai.search(board, colour, depth)
+        if moves != None:
+            board.play_move(board.parse_san(moves[searched], colour), None)
+        elif firstslot == (-1, -1):
+            break
+        else:
+            board.make_move(firstslot, secondslot, None)
+            board.does_pawn_promote(secondslot[0], secondslot[1])
+        colour = opposite_colour(colour)
+        searched += 1
+    return searched
+
+
+class StackSampler():
+    """Sampling profiler, a thread that looks at a thread's stack at regular times and counts how often each
+    stack was seen"""
+
+    def __init__(self, interval=SAMPLE_SECONDS):
+        self.interval = interval
+        self.target = threading.get_ident()      # Thread sampled (the one that made the sampler)
+        self.counts = {}                          # Stack ("outer;inner" function names) -> times seen
+        self.stopping = threading.Event()
+        self.thread = None
+
+
+    def start(self):
+        """Starts sampling"""
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+
+    def stop(self):
+        """Stops sampling, returns the number of samples taken"""
+
+        self.stopping.set()
+        self.thread.join()
+        return sum(self.counts.values())
+
+
+    def run(self):
+        """Samples the stack until stopped"""
+
+        while not self.stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            names = []
+            while frame != None:
+                code = frame.f_code
+                names.append(os.path.basename(code.co_filename) + ":" + getattr(code, "co_qualname", code.co_name))
+                frame = frame.f_back
+            if len(names) > 0:
+                stack = ";".join(reversed(names))
+                self.counts[stack] = self.counts.get(stack, 0) + 1
+
+
+    def write(self, path):
+        """Writes the stacks as collapsed stacks (one "stack count" line for each)"""
+
+        with open(path, "w") as file:
+            for stack in sorted(self.counts):
+                file.write(stack + " " + str(self.counts[stack]) + "\n")
+
+
+def summary(stats, seconds):
+    """Returns the lines of the summary of a cProfile run (pstats.Stats) that took seconds: the search's main
+    functions with their calls, own time and time including what they call, then the functions the most time
+    was spent in"""
+
+    lines = ["Function                              Calls   Own (s)   Total (s)  % of game"]
+    for name, shown in PROFILED_FUNCTIONS:
+        calls = own = total = 0
+        for (filename, line, function), (primitive, count, tottime, cumtime, callers) in stats.stats.items():
+            if function == name and os.path.basename(filename) == "Chess.py":
+                calls += count
+                own += tottime
+                total += cumtime
+        lines.append(shown.ljust(34) + str(calls).rjust(9) + str(round(own, 2)).rjust(10) +
+                     str(round(total, 2)).rjust(12) + str(round(total*100/max(seconds, 1e-9), 1)).rjust(11))
+
+    lines += ["", "Most own time".ljust(46) + "Calls".rjust(9) + "Own (s)".rjust(10) + "% of game".rjust(11)]
+    ranked = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+    for (filename, line, function), (primitive, count, tottime, cumtime, callers) in ranked[:SUMMARY_TOP]:
+        name = os.path.basename(filename) + ":" + str(line) + " " + function
+        lines.append(name[:46].ljust(46) + str(count).rjust(9) + str(round(tottime, 2)).rjust(10) +
+                     str(round(tottime*100/max(seconds, 1e-9), 1)).rjust(11))
+    return lines
+
+
+def profile(moves, depth, plies, folder):
+    """Plays the game under cProfile and then under the sampling profiler, writes the profiles to the folder"""
+
+    os.makedirs(folder, exist_ok=True)
+
+    # Deterministic profile of every call
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    searched = play_game(moves, depth, plies)
+    profiler.disable()
+    seconds = time.perf_counter() - start
+    statspath = os.path.join(folder, "game.pstats")
+    profiler.dump_stats(statspath)
+    print(str(searched) + " positions searched to depth " + str(depth) + " in " + str(round(seconds, 1)) +
+          " seconds under cProfile")
+
+    lines = summary(pstats.Stats(profiler), seconds)
+    summarypath = os.path.join(folder, "summary.txt")
+    with open(summarypath, "w") as file:
+        file.write("\n".join(lines) + "\n")
+    print("\n".join(lines))
+
+    # Sampled stacks, the game is played again at close to full speed (threads switch as often as the samples)
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(SAMPLE_SECONDS)
+    sampler = StackSampler()
+    start = time.perf_counter()
+    sampler.start()
+    try:
+        play_game(moves, depth, plies)
+    finally:
+        samples = sampler.stop()
+        sys.setswitchinterval(interval)
+    stackspath = os.path.join(folder, "game.collapsed")
+    sampler.write(stackspath)
+    print(str(samples) + " stack samples in " + str(round(time.perf_counter() - start, 1)) + " seconds")
+
+    print("Written " + statspath + " (python -m pstats), " + summarypath + " and " + stackspath +
+          " (flamegraph.pl, speedscope)")
+
+
+def main():
+    """Mainline for profiling"""
+
+    moves = None
+    depth = PROFILE_DEPTH
+    plies = PROFILE_PLIES
+    folder = PROFILE_FOLDER
+    if len(sys.argv) > 1 and sys.argv[1] != "selfplay":
+        game = next(pgn.read_file(sys.argv[1]), None)
+        if game == None or "FEN" in game.tags:
+            print("No game from the starting position in " + sys.argv[1])
+            return
+        moves = game.moves
+    if len(sys.argv) > 2:
+        depth = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        plies = int(sys.argv[3])
+        if moves != None:
+            moves = moves[:plies]
+    if len(sys.argv) > 4:
+        folder = sys.argv[4]
+    profile(moves, depth, plies, folder)
+
+
+if __name__ == "__main__":
+    main()
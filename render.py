@@ -0,0 +1,164 @@
+# Headless rendering of boards to images, without a window (SDL's dummy video driver), for thumbnails of
+# positions and images or animations of whole games
+# Positions file has one FEN per line, each is saved as a PNG. Games in a PGN file are saved as animated GIFs
+# (needs Pillow) or folders of PNGs, one per move. Large batches are rendered by several worker processes
+# Run with "python render.py positions.txt|games.pgn output_folder [size] [gif|png]"
+
+
+from Chess import *
+import os, sys, time, multiprocessing
+import pgn
+
+# Pillow is only needed for saving animated GIFs
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+# Rendering constants (the board drawing constants are with BoardRenderer in Chess.py)
+IMAGE_SIZE = 240               # Width and height of rendered boards (pixels)
+
+# Export constants
+FRAME_MILLISECONDS = 700       # Time each move of a game is shown for in GIFs
+LAST_FRAME_MILLISECONDS = 3000 # Time the final position is shown for before the GIF starts again
+PARALLEL_MIN_JOBS = 16         # Fewest images rendered before worker processes are used
+RENDER_CHUNK = 32              # Images sent to a worker at a time
+
+
+def start_headless():
+    """Sets up pygame for drawing without a window (unless there already is one), images can only be converted
+    once there is a display"""
+
+    if not pygame.display.get_init():
+        # No window is needed, use SDL's dummy video driver unless another one has been chosen
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        pygame.display.init()
+    if pygame.display.get_surface() == None:
+        pygame.display.set_mode((1, 1))
+
+
+def save_gif(frames, path):
+    """Saves the frames (surfaces) as an animated GIF, the last one is shown longer. Needs Pillow"""
+
+    if Image == None:
+        raise RuntimeError("Saving GIFs needs Pillow (pip install pillow)")
+
+    images = []
+    for frame in frames:
+        images.append(Image.frombytes("RGB", frame.get_size(), pygame.image.tobytes(frame, "RGB")))
+    durations = [FRAME_MILLISECONDS]*(len(images) - 1) + [LAST_FRAME_MILLISECONDS]
+    images[0].save(path, save_all=True, append_images=images[1:], duration=durations, loop=0)
+
+
+# Each worker process keeps its renderer (and scaled images) between jobs
+worker_renderer = None
+
+
+def start_worker(size):
+    """Worker process initializer, creates the renderer the worker's jobs use"""
+
+    global worker_renderer
+    start_headless()
+    worker_renderer = BoardRenderer(size)
+
+
+def render_job(job):
+    """Worker function, renders one job and saves it, returns the path and an error message (None if it
+    was saved). Jobs are ("position", fen, path), ("gif", fen, moves, path) or ("png", fen, moves, folder)"""
+
+    kind = job[0]
+    path = job[-1]
+    renderer = worker_renderer
+    try:
+        if kind == "position":
+            board = Board(renderer.pieces)
+            colour = board.set_up_fen(job[1])
+            pygame.image.save(renderer.render(board, colour), path)
+        elif kind == "gif":
+            save_gif([frame.copy() for frame in renderer.render_game(job[1], job[2])], path)
+        else:
+            os.makedirs(path, exist_ok=True)
+            for i, frame in enumerate(renderer.render_game(job[1], job[2])):
+                pygame.image.save(frame, os.path.join(path, str(i).zfill(3) + ".png"))
+    except (ValueError, RuntimeError, OSError, pygame.error) as error:
+        return path, str(error)
+    return path, None
+
+
+def export(jobs, size=IMAGE_SIZE, processes=None):
+    """Renders and saves the jobs (see render_job), in worker processes if there are enough of them.
+    Returns the number saved and a list of (path, error message) of the ones that couldn't be"""
+
+    saved = 0
+    errors = []
+    if len(jobs) < PARALLEL_MIN_JOBS:
+        start_worker(size)
+        results = map(render_job, jobs)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes or os.cpu_count() or 1, start_worker, (size,))
+        results = pool.imap_unordered(render_job, jobs, RENDER_CHUNK)
+
+    try:
+        for path, error in results:
+            if error == None:
+                saved += 1
+            else:
+                errors.append((path, error))
+    finally:
+        if pool != None:
+            pool.close()
+            pool.join()
+
+    return saved, errors
+
+
+def read_positions(path):
+    """Returns the FEN positions in the file, one per line (blank lines and lines starting with # are skipped)"""
+
+    with open(path) as file:
+        return [line.strip() for line in file if line.strip() != "" and not line.startswith("#")]
+
+
+def main():
+    """Mainline for rendering positions or games to images"""
+
+    if len(sys.argv) < 3:
+        print("Usage: python render.py positions.txt|games.pgn output_folder [size] [gif|png]")
+        return
+    inputpath = sys.argv[1]
+    folder = sys.argv[2]
+    size = IMAGE_SIZE
+    imageformat = "gif"
+    if len(sys.argv) > 3:
+        size = int(sys.argv[3])
+    if len(sys.argv) > 4:
+        imageformat = sys.argv[4]
+    if imageformat == "gif" and Image == None:
+        print("Pillow isn't installed, saving games as PNGs")
+        imageformat = "png"
+    os.makedirs(folder, exist_ok=True)
+
+    # Games (one GIF or folder of PNGs each) or positions (one PNG each)
+    jobs = []
+    if inputpath.lower().endswith(".pgn"):
+        for i, game in enumerate(pgn.read_file(inputpath)):
+            name = os.path.join(folder, "game" + str(i + 1).zfill(5))
+            if imageformat == "gif":
+                name += ".gif"
+            jobs.append((imageformat, game.tags.get("FEN", START_FEN), game.moves, name))
+    else:
+        for i, fen in enumerate(read_positions(inputpath)):
+            jobs.append(("position", fen, os.path.join(folder, "position" + str(i + 1).zfill(5) + ".png")))
+
+    start = time.monotonic()
+    saved, errors = export(jobs, size)
+    for path, error in errors:
+        print(path + ": " + error)
+    print(str(saved) + " of " + str(len(jobs)) + " saved in " + str(round(time.monotonic() - start, 2)) +
+          " seconds")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+# Self-play training data, the AI plays itself in worker processes and positions sampled from the games are
+# written with their game's result and the AI's search score and move, for tuning the evaluation
+# (python tune_evaluation.py selfplay) and for regression suites. Positions are packed into fixed size records
+# (half a byte per square) that are only ever appended to chunk files, so a chunk can be memory-mapped and any
+# record read without reading the rest. Each game is played from its own seed (its game number) and written
+# whole in the order the games were started, so a stopped run carries on after the last complete game written
+# (a game cut short is played again). The main process holds nothing but the games being played and each
+# game gets a new AI, so memory use stays flat however long it runs
+# Run with "python selfplay.py [folder] [games] [depth] [processes]"
+
+
+from Chess import *
+import sys, os, mmap, struct, time, random, multiprocessing
+from collections import deque
+import bitbase
+
+
+# Self-play constants
+SELFPLAY_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "selfplay")
+SELFPLAY_DEPTH = 3             # Depth the AI searches each move
+RANDOM_PLIES = 8               # Moves (of either colour) at the start of each game made at random, so games differ
+SAMPLE_RATE = 0.5              # Chance each searched position is written (positions in check never are)
+MAX_PLIES = 400                # Games this long are drawn
+FIFTY_MOVE_PLIES = 100         # Moves (of either colour) without a capture or pawn move that draw the game
+ADJUDICATE_SCORE = 100         # Game is won once the search scores it past this (10 pawns)...
+ADJUDICATE_PLIES = 6           # ...this many moves in a row
+CHUNK_RECORDS = 1000000        # Records in a chunk file before the next one is started
+WORKER_GAMES = 50              # Games a worker process plays before it is replaced by a new one
+REPORT_SECONDS = 60            # Seconds between progress lines
+
+# Chunk file format, header (magic, version, record size) then the records, as many as the file's size holds
+MAGIC = b"PYSP"
+VERSION = 2
+HEADER = struct.Struct("<4sII")
+# Record: pieces (half a byte for each square, row 0 first, low half first: 0 empty, kind + 1 for black pieces,
+# kind + 9 for white's), flags (1 white to move, 2 4 8 16 white and black castling king and queen side,
+# LAST_RECORD on the last record of each game),
+# en passant column (NO_EN_PASSANT if none), result (0 black won, 1 draw, 2 white won), search depth,
+# search score (white positive), best move (packed), ply, game number
+RECORD = struct.Struct("<32sBBBBhHHI")
+NO_EN_PASSANT = 255
+LAST_RECORD = 32
+CASTLING_RIGHTS = [((7, 4), (7, 7)), ((7, 4), (7, 0)), ((0, 4), (0, 7)), ((0, 4), (0, 0))]   # K Q k q
+
+
+def pack_position(board, colour):
+    """Returns the board's pieces, flags and en passant column as a record has them"""
+
+    squares = bytearray(SIZE*SIZE//2)
+    for row in range(SIZE):
+        for col in range(SIZE):
+            piece = board.board[row][col]
+            if piece != None:
+                square = row*SIZE + col
+                squares[square//2] |= (piece.colour*8 + piece.kind + 1) << (4*(square % 2))
+
+    flags = 0
+    if colour == WHITE:
+        flags = 1
+    # Castling needs the king and rook unmoved (a rook captured on its square hasn't moved, but is gone)
+    for i, slots in enumerate(CASTLING_RIGHTS):
+        king = board.board[slots[0][0]][slots[0][1]]
+        rook = board.board[slots[1][0]][slots[1][1]]
+        if (king != None and king.kind == KING and rook != None and rook.kind == ROOK and rook.colour == king.colour
+                and not board.moved[slots[0][0]][slots[0][1]] and not board.moved[slots[1][0]][slots[1][1]]):
+            flags |= 2 << i
+
+    # Pawn of the other colour that has just moved two squares
+    enpassant = NO_EN_PASSANT
+    recent = board.recentblack
+    if colour == BLACK:
+        recent = board.recentwhite
+    if recent.kind == PAWN and abs(recent.initial[0] - recent.final[0]) == 2:
+        enpassant = recent.final[1]
+
+    return bytes(squares), flags, enpassant
+
+
+def record_fen(record):
+    """Returns the position of an unpacked record as FEN (move counters from its ply)"""
+
+    squares, flags, enpassant, result, depth, score, move, ply, game = record
+    rows = []
+    for row in range(SIZE):
+        text = ""
+        empty = 0
+        for col in range(SIZE):
+            square = row*SIZE + col
+            code = (squares[square//2] >> (4*(square % 2))) & 15
+            if code == 0:
+                empty += 1
+                continue
+            if empty > 0:
+                text += str(empty)
+                empty = 0
+            letter = "RNBQKP"[(code & 7) - 1]
+            if code < 8:
+                letter = letter.lower()
+            text += letter
+        if empty > 0:
+            text += str(empty)
+        rows.append(text)
+
+    castling = "".join(letter for i, letter in enumerate("KQkq") if flags & (2 << i)) or "-"
+    passant = "-"
+    if enpassant != NO_EN_PASSANT:
+        passant = "abcdefgh"[enpassant] + ("6" if flags & 1 else "3")
+    return " ".join(["/".join(rows), "w" if flags & 1 else "b", castling, passant, "0", str(ply//2 + 1)])
+
+
+def insufficient_material(board):
+    """Returns if neither side can checkmate (one side has only its king, the other at most one knight or bishop),
+    the same draws the game calls"""
+
+    counts = [[0]*6, [0]*6]
+    for row in range(SIZE):
+        for col in range(SIZE):
+            if board.board[row][col] != None:
+                counts[board.board[row][col].colour][board.board[row][col].kind] += 1
+
+    alone = [0, 0, 0, 0, 1, 0]
+    drawn = (alone, [0, 0, 1, 0, 1, 0], [0, 1, 0, 0, 1, 0])
+    return (counts[BLACK] == alone and counts[WHITE] in drawn) or (counts[WHITE] == alone and counts[BLACK] in drawn)
+
+
+def play_game(number, depth):
+    """Worker function, plays game number (its seed) and returns its records packed (bytes), its result (as a
+    record has it) and its length in plies"""
+
+    rng = random.Random(number)
+    board = Board(create_pieces(False))
+    board.set_up_initial_board()
+    ai = ChessAI()
+    ai.random.seed(number)
+
+    colour = WHITE
+    samples = []              # (pieces, flags, en passant, score, move, ply) of the positions to write
+    seen = {}                 # Times each position has been reached (repetitions)
+    quiet = 0                 # Plies since the last capture or pawn move
+    winning = [0, 0]          # Searches in a row scored as won for each colour
+    result = 1
+    ply = 0
+    while ply < MAX_PLIES:
+        moves = ai.generate_all_moves(board, colour)
+
+        # Checkmate or stalemate
+        if len(moves) == 0:
+            if board.is_in_check(opposite_colour(colour)):
+                result = 2*opposite_colour(colour)
+            break
+
+        # Drawn by repetition, the fifty move rule, material or the bitbases
+        key = board.get_position_key(colour)
+        seen[key] = seen.get(key, 0) + 1
+        if (seen[key] >= 3 or quiet >= FIFTY_MOVE_PLIES or insufficient_material(board)
+                or board.probe_bitbase(colour) == bitbase.DRAW):
+            break
+
+        if ply < RANDOM_PLIES:
+            firstslot, secondslot, points = rng.choice(moves)
+        else:
+            score, firstslot, secondslot = ai.search(board, colour, depth)
+            if rng.random() < SAMPLE_RATE and not board.is_in_check(opposite_colour(colour)):
+                samples.append(pack_position(board, colour) +
+                               (score, board.encode_move(firstslot, secondslot, QUEEN), ply))
+
+            # Adjudicated once the search has scored it won for long enough
+            for side, sign in [(WHITE, 1), (BLACK, -1)]:
+                winning[side] = winning[side] + 1 if score*sign >= ADJUDICATE_SCORE else 0
+            if winning[WHITE] >= ADJUDICATE_PLIES or winning[BLACK] >= ADJUDICATE_PLIES:
+                result = 2*int(winning[WHITE] >= ADJUDICATE_PLIES)
+                break
+
+        quiet += 1
+        if board.board[secondslot[0]][secondslot[1]] != None or board.board[firstslot[0]][firstslot[1]].kind == PAWN:
+            quiet = 0
+        board.make_move(firstslot, secondslot, None)
+        board.does_pawn_promote(secondslot[0], secondslot[1])
+        colour = opposite_colour(colour)
+        ply += 1
+
+    # The game's last record is marked, so a game cut short while it was being written can be told apart
+    if len(samples) > 0:
+        samples[-1] = (samples[-1][0], samples[-1][1] | LAST_RECORD) + samples[-1][2:]
+    records = b"".join(RECORD.pack(squares, flags, enpassant, result, depth, score, move, at, number)
+                       for squares, flags, enpassant, score, move, at in samples)
+    return records, result, ply
+
+
+def chunk_paths(folder):
+    """Returns the paths of the chunk files in the folder, in the order they were written"""
+
+    if not os.path.isdir(folder):
+        return []
+    return [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+            if name.startswith("chunk") and name.endswith(".bin")]
+
+
+class ChunkFile():
+    """A chunk file's records, memory-mapped so only the records read are loaded"""
+
+    def __init__(self, path):
+        self.data = None     # Memory-mapped file (None if it has no records)
+        self.count = 0       # Number of records
+
+        with open(path, "rb") as file:
+            header = file.read(HEADER.size)
+            if len(header) < HEADER.size or HEADER.unpack(header) != (MAGIC, VERSION, RECORD.size):
+                raise ValueError("Not a self-play chunk file: " + path)
+            self.count = (os.path.getsize(path) - HEADER.size)//RECORD.size
+            if self.count > 0:
+                self.data = mmap.mmap(file.fileno(), HEADER.size + self.count*RECORD.size, access=mmap.ACCESS_READ)
+
+
+    def record(self, index):
+        """Returns record number index unpacked (pieces, flags, en passant, result, depth, score, move, ply, game)"""
+
+        return RECORD.unpack_from(self.data, HEADER.size + index*RECORD.size)
+
+
+    def close(self):
+        """Unmaps the file"""
+
+        if self.data != None:
+            self.data.close()
+            self.data = None
+
+
+class ChunkWriter():
+    """Appends games' records to the chunk files in a folder, carrying on after the records already written"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.file = None          # Chunk file being written (opened when the first game is written)
+        self.chunk = 0            # Number of the chunk file being written
+        self.count = 0            # Records in it
+        self.next_game = 0        # Game number to play next
+
+        # Records after the last complete game (the run was stopped while writing a game) are removed, the
+        # game is played again (games are the same every time they're played from their number). Games are
+        # written in order, so the last complete one is the last record marked as a game's last in the last
+        # chunk with one
+        paths = chunk_paths(folder)
+        if len(paths) > 0:
+            self.chunk = len(paths) - 1
+        for number in range(len(paths) - 1, -1, -1):
+            if os.path.getsize(paths[number]) < HEADER.size:
+                continue
+            chunk = ChunkFile(paths[number])
+            count = chunk.count
+            while count > 0 and not chunk.record(count - 1)[1] & LAST_RECORD:
+                count -= 1
+            if count > 0:
+                self.next_game = chunk.record(count - 1)[-1] + 1
+            chunk.close()
+            os.truncate(paths[number], HEADER.size + count*RECORD.size)
+            if number == self.chunk:
+                self.count = count
+            if count > 0:
+                break
+
+
+    def path(self):
+        """Returns the path of the chunk file being written"""
+
+        return os.path.join(self.folder, "chunk" + str(self.chunk).zfill(6) + ".bin")
+
+
+    def write(self, records):
+        """Appends a game's records (bytes), written to disk (synced) before returning. Games aren't split between
+        chunks"""
+
+        if self.count >= CHUNK_RECORDS:
+            self.close()
+            self.chunk += 1
+            self.count = 0
+        if self.file == None:
+            os.makedirs(self.folder, exist_ok=True)
+            self.file = open(self.path(), "ab")
+            if self.file.tell() < HEADER.size:
+                self.file.truncate(0)
+                self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        self.file.write(records)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.count += len(records)//RECORD.size
+
+
+    def close(self):
+        """Closes the chunk file being written"""
+
+        if self.file != None:
+            self.file.close()
+            self.file = None
+
+
+def generate(folder=SELFPLAY_FOLDER, games=None, depth=SELFPLAY_DEPTH, processes=None):
+    """Plays games (forever if None) and writes their sampled positions to the chunk files in the folder"""
+
+    if processes == None:
+        processes = os.cpu_count() or 1
+    writer = ChunkWriter(folder)
+    number = writer.next_game
+    last = None
+    if games != None:
+        last = number + games
+    print("Starting at game " + str(number) + ", writing to " + folder)
+
+    start = time.monotonic()
+    reported = start
+    played = 0
+    positions = 0
+    results = [0, 0, 0]
+    plies = 0
+
+    # Workers are replaced after WORKER_GAMES games, so nothing they hold on to can build up over a long run
+    with multiprocessing.Pool(processes, maxtasksperchild=WORKER_GAMES) as pool:
+        pending = deque()
+        try:
+            while True:
+                # A few games are waiting for a worker at a time, the oldest is written first (games in order)
+                while len(pending) < 2*processes and (last == None or number < last):
+                    pending.append(pool.apply_async(play_game, (number, depth)))
+                    number += 1
+                if len(pending) == 0:
+                    break
+
+                records, result, length = pending.popleft().get()
+                writer.write(records)
+                played += 1
+                positions += len(records)//RECORD.size
+                results[result] += 1
+                plies += length
+
+                if time.monotonic() - reported >= REPORT_SECONDS or len(pending) == 0:
+                    reported = time.monotonic()
+                    minutes = (reported - start)/60
+                    print(str(played) + " games (white " + str(results[2]) + ", draws " + str(results[1]) +
+                          ", black " + str(results[0]) + ", " + str(round(plies/played)) + " plies on average), " +
+                          str(positions) + " positions, " + str(round(played/max(minutes, 1e-9), 1)) +
+                          " games a minute")
+        except KeyboardInterrupt:
+            print("Stopped, " + str(played) + " games written (carries on from game " + str(writer.next_game +
+                  played) + ")")
+        finally:
+            writer.close()
+
+
+def main():
+    """Mainline for self-play"""
+
+    folder = SELFPLAY_FOLDER
+    games = None
+    depth = SELFPLAY_DEPTH
+    processes = None
+    if len(sys.argv) > 1:
+        folder = sys.argv[1]
+    if len(sys.argv) > 2 and sys.argv[2] != "forever":
+        games = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        depth = int(sys.argv[3])
+    if len(sys.argv) > 4:
+        processes = int(sys.argv[4])
+    generate(folder, games, depth, processes)
+
+
+if __name__ == "__main__":
+    main()
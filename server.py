@@ -0,0 +1,450 @@
+# Network game server, hosts many games at once (human vs human, or human vs AI) for clients over TCP or
+# WebSocket. The server keeps the board of each game and checks every move with the game's rules, sends each
+# move to both players and anyone watching, and makes the AI's moves in a pool of worker processes
+# Run with "python server.py [port]"
+#
+# Messages are JSON objects, one per line over TCP or one per text frame over WebSocket (clients that start
+# with an HTTP GET are WebSocket clients). Moves are written as from and to slots, e.g. "e2e4" ("e7e8n"
+# promotes to a knight, queen if no piece is given)
+#   {"type": "create", "colour": "white", "ai": 2}   new game, "ai" is the AI's depth (left out for two players)
+#   {"type": "join", "game": 1}                      take the free side of a two player game
+#   {"type": "watch", "game": 1}                     watch a game
+#   {"type": "move", "game": 1, "move": "e2e4"}      make a move
+# The server answers with "state" (after create, join or watch), "update" (after every move) and "error"
+
+
+from Chess import *
+import sys, json, signal, asyncio, base64, hashlib, struct, concurrent.futures
+import bitbase, pgn
+from concurrent.futures.process import BrokenProcessPool
+
+
+# Server constants
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+MAX_MESSAGE = 65536            # Longest message accepted from a client (bytes)
+SERVER_BACKLOG = 1024          # Connections waiting to be accepted
+MAX_AI_DEPTH = HARD            # Deepest AI clients can ask for
+MAX_BUFFERED = 1048576         # Bytes waiting to be sent to a client before it's disconnected (too slow to keep up)
+AI_RETRIES = 1                 # Times an AI move that failed in a worker is tried again before the game is ended
+
+# WebSocket constants
+WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OPCODE_TEXT = 1
+OPCODE_CLOSE = 8
+OPCODE_PING = 9
+OPCODE_PONG = 10
+
+# Letters of pieces pawns can promote to in moves
+PROMOTION_LETTERS = {"r": ROOK, "n": KNIGHT, "b": BISHOP, "q": QUEEN}
+
+
+def parse_move_name(board, colour, name):
+    """Returns the packed move of colour written as from and to slots, raises ValueError if it isn't legal"""
+
+    if len(name) not in (4, 5) or name[0] not in "abcdefgh" or name[2] not in "abcdefgh":
+        raise ValueError("Not a move: " + name)
+    if name[1] not in "12345678" or name[3] not in "12345678":
+        raise ValueError("Not a move: " + name)
+    firstslot = (SIZE - int(name[1]), "abcdefgh".index(name[0]))
+    secondslot = (SIZE - int(name[3]), "abcdefgh".index(name[2]))
+    promotion = QUEEN
+    if len(name) == 5:
+        if name[4] not in PROMOTION_LETTERS:
+            raise ValueError("Not a promotion piece: " + name[4])
+        promotion = PROMOTION_LETTERS[name[4]]
+
+    piece = board.board[firstslot[0]][firstslot[1]]
+    if piece == None or piece.colour != colour:
+        raise ValueError("No piece to move: " + name)
+    current = board.do_not_move_into_check(board.valid_moves(firstslot[0], firstslot[1]), firstslot,
+                                           opposite_colour(colour))
+    if secondslot not in current:
+        raise ValueError("Not a legal move: " + name)
+
+    return board.encode_move(firstslot, secondslot, promotion)
+
+
+def ai_move(moves, colour, depth):
+    """Worker process function, replays the game's SAN moves and returns the AI's move (packed)"""
+
+    board = Board(create_pieces(False))
+    board.set_up_initial_board()
+    turn = WHITE
+    for san in moves:
+        board.play_move(board.parse_san(san, turn), None)
+        turn = opposite_colour(turn)
+
+    stats = ChessAI().search(board, colour, depth)
+    return board.encode_move(stats[1], stats[2], QUEEN)
+
+
+class Connection():
+    """A client connected to the server, over TCP (JSON lines) or WebSocket (JSON text frames)"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader          # Stream the client's messages are read from
+        self.writer = writer          # Stream messages to the client are written to
+        self.websocket = False        # If the client is using WebSocket
+        self.games = set()            # Games the client is playing or watching
+
+
+    async def start(self):
+        """Reads the first line, answers the WebSocket handshake if the client is a WebSocket client.
+        Returns the first message of a TCP client (None for WebSocket)"""
+
+        line = await self.reader.readline()
+        if not line.startswith(b"GET "):
+            return line
+
+        # WebSocket handshake, answer with the hash of the client's key
+        key = b""
+        while True:
+            header = await self.reader.readline()
+            if header in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = header.partition(b":")
+            if name.strip().lower() == b"sec-websocket-key":
+                key = value.strip()
+        accept = base64.b64encode(hashlib.sha1(key + WEBSOCKET_GUID).digest())
+        self.writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                          b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        self.websocket = True
+        return None
+
+
+    async def receive(self, first=None):
+        """Returns the next message from the client (a dict), None once the client has disconnected"""
+
+        while True:
+            if self.websocket:
+                data = await self.receive_frame()
+            elif first != None:
+                data = first
+                first = None
+            else:
+                data = await self.reader.readline()
+            if data == None or data == b"":
+                return None
+            if len(data) > MAX_MESSAGE:
+                return None
+            if data.strip() == b"":
+                continue
+
+            try:
+                message = json.loads(data)
+            except ValueError:
+                message = None
+            if isinstance(message, dict):
+                return message
+            self.send({"type": "error", "message": "Messages must be JSON objects"})
+
+
+    async def receive_frame(self):
+        """Returns the data of the next WebSocket text frame, None once the client has closed the connection"""
+
+        data = b""
+        while True:
+            header = await self.reader.readexactly(2)
+            opcode = header[0] & 15
+            length = header[1] & 127
+            if length == 126:
+                length = struct.unpack(">H", await self.reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack(">Q", await self.reader.readexactly(8))[0]
+            if length > MAX_MESSAGE:
+                return None
+
+            # Client frames are masked
+            mask = b"\x00\x00\x00\x00"
+            if header[1] & 128:
+                mask = await self.reader.readexactly(4)
+            payload = bytearray(await self.reader.readexactly(length))
+            for i in range(length):
+                payload[i] ^= mask[i % 4]
+
+            if opcode == OPCODE_CLOSE:
+                return None
+            if opcode == OPCODE_PING:
+                self.write_frame(OPCODE_PONG, bytes(payload))
+                continue
+            if opcode == OPCODE_PONG:
+                continue
+
+            # Frames of a message until the final one
+            data += payload
+            if header[0] & 128:
+                return data
+
+
+    def write_frame(self, opcode, payload):
+        """Writes a WebSocket frame (server frames aren't masked)"""
+
+        if len(payload) < 126:
+            header = struct.pack(">BB", 128 | opcode, len(payload))
+        elif len(payload) < 65536:
+            header = struct.pack(">BBH", 128 | opcode, 126, len(payload))
+        else:
+            header = struct.pack(">BBQ", 128 | opcode, 127, len(payload))
+        self.writer.write(header + payload)
+
+
+    def send(self, message):
+        """Sends a message (a dict) to the client, without waiting for it to be written. Messages to other clients
+        (moves sent to opponents and spectators) aren't waited for, so a client that isn't reading them is
+        disconnected once too much is waiting to be sent to it"""
+
+        if self.writer.is_closing():
+            return
+        if self.writer.transport.get_write_buffer_size() > MAX_BUFFERED:
+            self.writer.transport.abort()
+            return
+        data = json.dumps(message, separators=(",", ":")).encode()
+        if self.websocket:
+            self.write_frame(OPCODE_TEXT, data)
+        else:
+            self.writer.write(data + b"\n")
+
+
+class NetworkGame():
+    """A game hosted by the server, the board here is the one that counts"""
+
+    def __init__(self, number, pieces, ai, aidepth):
+        self.number = number                  # Game number clients use to find the game
+        self.board = Board(pieces)            # Board of the game
+        self.board.set_up_initial_board()
+        self.turn = WHITE                     # Colour to move
+        self.players = [None, None]           # Connection of each colour's player (None if free or the AI)
+        self.spectators = set()               # Connections watching the game
+        self.ai = ai                          # Colour the AI plays, -1 if two players
+        self.aidepth = aidepth                # Depth of the AI's search
+        self.moves = []                       # Moves made so far in SAN
+        self.result = pgn.UNFINISHED          # Result (pgn result constants)
+        self.legal = []                       # Legal moves of the colour to move (as from and to slots)
+
+
+    def state(self, message_type):
+        """Returns the game as a message to send to clients"""
+
+        return {"type": message_type, "game": self.number, "moves": self.moves, "turn": COLOUR_NAMES[self.turn],
+                "legal": self.legal, "result": self.result}
+
+
+class GameServer():
+    """Hosts the games, one asyncio task per connected client"""
+
+    def __init__(self, workers=None):
+        self.pieces = create_pieces(False)    # Pieces (without images) for the boards
+        self.ai = ChessAI()                   # Used to generate legal moves
+        self.games = {}                       # Game number -> NetworkGame
+        self.next_number = 1                  # Number of the next game made
+        self.workers = workers                # Worker processes (None for one for each processor)
+        self.pool = concurrent.futures.ProcessPoolExecutor(workers)  # Worker processes for the AI's moves
+        self.moves = 0                        # Number of moves made (all games)
+
+
+    async def handle(self, reader, writer):
+        """Task for one client, answers its messages until it disconnects"""
+
+        connection = Connection(reader, writer)
+        try:
+            first = await connection.start()
+            while True:
+                message = await connection.receive(first)
+                first = None
+                if message == None:
+                    break
+                self.process(connection, message)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            self.disconnect(connection)
+            writer.close()
+
+
+    def process(self, connection, message):
+        """Responds to a message from a client"""
+
+        message_type = message.get("type")
+        game = None
+        if isinstance(message.get("game"), int):
+            game = self.games.get(message.get("game"))
+
+        if message_type == "create":
+            colour = WHITE
+            if message.get("colour") == "black":
+                colour = BLACK
+            ai = -1
+            aidepth = message.get("ai")
+            if aidepth != None:
+                if not isinstance(aidepth, int) or aidepth < 1 or aidepth > MAX_AI_DEPTH:
+                    connection.send({"type": "error", "message": "AI depth must be 1 to " + str(MAX_AI_DEPTH)})
+                    return
+                ai = opposite_colour(colour)
+
+            game = NetworkGame(self.next_number, self.pieces, ai, aidepth)
+            self.next_number += 1
+            self.games[game.number] = game
+            game.players[colour] = connection
+            game.legal = self.legal_moves(game)
+            connection.games.add(game.number)
+            connection.send(game.state("state"))
+            if game.ai == game.turn:
+                asyncio.ensure_future(self.play_ai(game))
+
+        elif game == None:
+            connection.send({"type": "error", "message": "No such game"})
+
+        elif message_type == "join":
+            if game.ai != -1 or (game.players[WHITE] != None and game.players[BLACK] != None):
+                connection.send({"type": "error", "message": "Game is full"})
+                return
+            if game.players[WHITE] == None:
+                game.players[WHITE] = connection
+            else:
+                game.players[BLACK] = connection
+            connection.games.add(game.number)
+            connection.send(game.state("state"))
+
+        elif message_type == "watch":
+            game.spectators.add(connection)
+            connection.games.add(game.number)
+            connection.send(game.state("state"))
+
+        elif message_type == "move":
+            if game.players[game.turn] != connection:
+                connection.send({"type": "error", "game": game.number, "message": "Not your move"})
+                return
+            if game.result != pgn.UNFINISHED:
+                connection.send({"type": "error", "game": game.number, "message": "Game is over"})
+                return
+            try:
+                move = parse_move_name(game.board, game.turn, str(message.get("move")))
+            except ValueError as error:
+                connection.send({"type": "error", "game": game.number, "message": str(error)})
+                return
+            self.make_move(game, move)
+            if game.ai == game.turn and game.result == pgn.UNFINISHED:
+                asyncio.ensure_future(self.play_ai(game))
+
+        else:
+            connection.send({"type": "error", "message": "Unknown message type"})
+
+
+    def make_move(self, game, move):
+        """Makes a (legal) move in the game, sends it to the players and spectators"""
+
+        colour = game.turn
+        game.moves.append(game.board.get_san(move_from(move), move_to(move), move_promotion(move)))
+        game.board.play_move(move, None)
+        game.turn = opposite_colour(colour)
+        game.legal = self.legal_moves(game)
+        self.moves += 1
+
+        # Checkmate, stalemate or an endgame the bitbases say is drawn
+        if len(game.legal) == 0:
+            if game.board.is_in_check(colour):
+                game.result = [pgn.BLACK_WINS, pgn.WHITE_WINS][colour]
+            else:
+                game.result = pgn.DRAW
+        elif game.board.probe_bitbase(game.turn) == bitbase.DRAW:
+            game.result = pgn.DRAW
+
+        message = game.state("update")
+        message["move"] = move_name(move)
+        message["san"] = game.moves[-1]
+        for connection in game.players + list(game.spectators):
+            if connection != None:
+                connection.send(message)
+
+
+    def legal_moves(self, game):
+        """Returns the legal moves of the colour to move (as from and to slots)"""
+
+        return [slot_name(move[0]) + slot_name(move[1]) for move in self.ai.generate_all_moves(game.board, game.turn)]
+
+
+    async def play_ai(self, game):
+        """Makes the AI's move, searched in a worker process so other games carry on meanwhile. A search that
+        fails is tried again (with new worker processes if they have stopped), if it still fails the players are
+        told and the game is ended"""
+
+        loop = asyncio.get_running_loop()
+        for attempt in range(AI_RETRIES + 1):
+            pool = self.pool
+            try:
+                move = await loop.run_in_executor(pool, ai_move, list(game.moves), game.turn, game.aidepth)
+                break
+            except Exception as error:
+                # Only the first search to find the pool broken replaces it, the others retry on the new one
+                if isinstance(error, BrokenProcessPool) and self.pool is pool:
+                    self.pool.shutdown(wait=False)
+                    self.pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+                print("AI move failed in game " + str(game.number) + ": " + repr(error))
+        else:
+            if game.number in self.games:
+                del self.games[game.number]
+                message = {"type": "error", "game": game.number, "message": "AI couldn't make its move, game ended"}
+                for connection in game.players + list(game.spectators):
+                    if connection != None:
+                        connection.send(message)
+            return
+
+        if game.number in self.games and game.result == pgn.UNFINISHED:
+            self.make_move(game, move)
+
+
+    def disconnect(self, connection):
+        """Removes a client from its games, games are ended once none of their players are connected"""
+
+        for number in connection.games:
+            game = self.games.get(number)
+            if game == None:
+                continue
+            game.spectators.discard(connection)
+            for colour in (BLACK, WHITE):
+                if game.players[colour] == connection:
+                    game.players[colour] = None
+            if game.players[WHITE] == None and game.players[BLACK] == None:
+                del self.games[number]
+        connection.games.clear()
+
+
+    async def serve(self, host=SERVER_HOST, port=SERVER_PORT):
+        """Runs the server until it's stopped"""
+
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_MESSAGE, backlog=SERVER_BACKLOG)
+        print("Serving on " + host + ":" + str(port))
+
+        # Ctrl+C or terminate stops the server (not available on Windows, where Ctrl+C interrupts it instead)
+        stopped = asyncio.Event()
+        for signalnumber in (signal.SIGINT, signal.SIGTERM):
+            try:
+                asyncio.get_running_loop().add_signal_handler(signalnumber, stopped.set)
+            except NotImplementedError:
+                pass
+
+        async with server:
+            await stopped.wait()
+
+
+def main():
+    """Mainline for the server"""
+
+    port = SERVER_PORT
+    if len(sys.argv) > 1:
+        port = int(sys.argv[1])
+
+    # AI worker processes are shut down with the server
+    server = GameServer()
+    try:
+        asyncio.run(server.serve(SERVER_HOST, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.pool.shutdown(cancel_futures=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+# Simultaneous exhibition, the AI plays black on many boards at once against human players (white), all boards
+# shown in one window. The AI's replies are searched by a shared pool of worker processes, boards waiting for a
+# reply are handed out to the workers earliest deadline first (the board that has waited longest, or is lowest
+# on its clock, goes first) and each search is given less time as more boards wait, so adding boards makes the
+# AI's replies shallower rather than leaving boards waiting in a line
+# Run with "python simul.py [boards] [difficulty] [workers] [minutes+increment]"
+
+
+from Chess import *
+import os, sys, math, time, heapq, concurrent.futures
+import chess_clock, engine_service
+from concurrent.futures.process import BrokenProcessPool
+
+
+# Simul constants
+SIMUL_BOARDS = 6               # Boards played at once
+SIMUL_WORKERS = os.cpu_count() or 1   # Worker processes searching the AI's replies
+SIMUL_REPLY_SECONDS = 3.0      # Time the AI aims to reply within on each board (less if its clock is low)
+SIMUL_MIN_SECONDS = 0.2        # Least time given to a search however many boards are waiting
+SIMUL_GAP = 10                 # Space around boards (pixels)
+SIMUL_TEXT_HEIGHT = 24         # Height of the line under each board (board number, status and clocks)
+SIMUL_FRAME_RATE = 30          # Frames per second the boards are drawn at
+SIMUL_RETRIES = 2              # Times a board's search that failed in a worker is tried again before it's given up
+
+
+class EngineScheduler():
+    """Hands a shared pool of engine worker processes out to the boards waiting for the AI's reply. Each
+    request has a deadline (when it was made plus the time the AI aims to reply in, sooner if its clock is low),
+    waiting requests get a worker earliest deadline first. A search's time limit is the fair share of the
+    workers between all the boards waiting, so replies get shallower rather than slower as boards are added"""
+
+    def __init__(self, workers=SIMUL_WORKERS):
+        self.workers = workers                # Searches running at once
+        self.pool = concurrent.futures.ProcessPoolExecutor(workers, initializer=engine_service.start_worker)
+        self.waiting = []                     # Heap of (deadline, order, board) waiting for a worker
+        self.running = {}                     # Board -> (pool, future of its search's answer)
+        self.order = 0                        # Requests made so far (requests with the same deadline go in order)
+        self.failures = {}                    # Board -> searches of its current move that have failed
+
+
+    def request(self, board, deadline):
+        """Adds a board waiting for the AI's reply, to be searched by deadline (time.monotonic())"""
+
+        heapq.heappush(self.waiting, (deadline, self.order, board))
+        self.order += 1
+
+
+    def cancel(self, board):
+        """Forgets a board's request (a search already running finishes, its answer isn't used)"""
+
+        self.waiting = [entry for entry in self.waiting if entry[2] != board]
+        heapq.heapify(self.waiting)
+        self.running.pop(board, None)
+        self.failures.pop(board, None)
+
+
+    def busy(self, board):
+        """Returns if the board is waiting for a worker or being searched"""
+
+        return board in self.running or any(entry[2] == board for entry in self.waiting)
+
+
+    def dispatch(self):
+        """Starts searches on free workers, earliest deadline first"""
+
+        while len(self.running) < self.workers and len(self.waiting) > 0:
+            # Fair share of the workers' time between every board waiting or being searched
+            share = SIMUL_REPLY_SECONDS*self.workers/max(self.workers, len(self.waiting) + len(self.running))
+            board = heapq.heappop(self.waiting)[2]
+
+            # Never more than the board's clock allows
+            soft, hard = board.game.search_time()
+            seconds = max(SIMUL_MIN_SECONDS, share)
+            if soft != None:
+                seconds = min(seconds, soft)
+
+            position = {"moves": board.game.moves[:board.game.historyindex]}
+            self.running[board] = (self.pool, self.pool.submit(engine_service.search_position, position,
+                                                               board.game.difficulty, seconds, 0))
+
+
+    def finished(self):
+        """Returns the (board, answer) of the searches that have finished since the last call. A search that
+        failed is asked for again (with new worker processes if they have stopped), after SIMUL_RETRIES failures
+        the board is marked as failed instead"""
+
+        answers = []
+        for board, (pool, future) in list(self.running.items()):
+            if future.done():
+                del self.running[board]
+                try:
+                    answers.append((board, future.result()))
+                    self.failures.pop(board, None)
+                except Exception as error:
+                    # Only the first search to find the pool broken replaces it
+                    if isinstance(error, BrokenProcessPool) and pool is self.pool:
+                        self.pool.shutdown(wait=False)
+                        self.pool = concurrent.futures.ProcessPoolExecutor(self.workers,
+                                                                           initializer=engine_service.start_worker)
+                    self.failures[board] = self.failures.get(board, 0) + 1
+                    if self.failures[board] > SIMUL_RETRIES:
+                        board.failed = True
+                    else:
+                        self.request(board, board.deadline())
+        return answers
+
+
+    def shutdown(self):
+        """Stops the worker processes (searches still running aren't waited for)"""
+
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class SimulBoard():
+    """One board of the simul, a game against the AI drawn at a place in the window"""
+
+    def __init__(self, number, difficulty, timecontrol):
+        self.number = number                           # Board number shown under it (from 1)
+        self.game = Game(True, difficulty, None, None, timecontrol)   # The scheduler searches the AI's moves
+        self.lastmove = None                           # (from, to) slots of the last move, None before one
+        self.rect = pygame.Rect(0, 0, 0, 0)            # Where the board is drawn in the window
+        self.saved = False                             # If the finished game has been saved
+        self.failed = False                            # If the AI's searches for its move kept failing
+
+
+    def get_slot(self, pos):
+        """Returns the slot of the board at window position pos"""
+
+        size = self.rect.width
+        return (min(SIZE - 1, (pos[1] - self.rect.top)*SIZE//size),
+                min(SIZE - 1, (pos[0] - self.rect.left)*SIZE//size))
+
+
+    def click(self, pos):
+        """Selects a piece or moves the selected one (the human plays white), returns if a move was made"""
+
+        game = self.game
+        if game.game_over or game.turn != WHITE:
+            return False
+
+        slot = self.get_slot(pos)
+        if game.firstslot != (-1, -1) and slot in game.validmoves:
+            self.make_move(game.firstslot, slot)
+            return True
+
+        # Select another piece or de-select this one, only pieces with legal moves can be selected
+        piece = game.board.board[slot[0]][slot[1]]
+        selected = game.firstslot
+        game.firstslot = (-1, -1)
+        game.validmoves = []
+        if piece != None and piece.colour == WHITE and slot != selected:
+            key = (game.board.get_position_key(WHITE), slot)
+            if key not in game.legalmoves:
+                game.legalmoves[key] = game.board.do_not_move_into_check(game.board.valid_moves(slot[0], slot[1]),
+                                                                         slot, BLACK)
+            if len(game.legalmoves[key]) > 0:
+                game.firstslot = slot
+                game.validmoves = game.legalmoves[key]
+        return False
+
+
+    def make_move(self, firstslot, secondslot):
+        """Makes a move (human's or AI's) the same way the game does, pawns reaching the end become queens"""
+
+        game = self.game
+        before = game.board.make_copy()
+        game.board.make_move(firstslot, secondslot, game.graveyard)
+        game.board.does_pawn_promote(secondslot[0], secondslot[1])
+        game.record_move(before, firstslot, secondslot)
+        game.update_check_conditions()
+        game.turn = opposite_colour(game.turn)
+        game.press_clock()
+        game.save_state()
+        game.firstslot = (-1, -1)
+        game.validmoves = []
+        self.lastmove = (firstslot, secondslot)
+
+
+    def deadline(self):
+        """Returns the time (time.monotonic()) the AI should reply on this board by"""
+
+        seconds = SIMUL_REPLY_SECONDS
+        soft, hard = self.game.search_time()
+        if soft != None:
+            seconds = min(seconds, soft)
+        return time.monotonic() + seconds
+
+
+    def status(self, searching):
+        """Returns the text shown under the board"""
+
+        game = self.game
+        if game.win[WHITE]:
+            text = "White wins"
+        elif game.win[BLACK]:
+            text = "Black wins"
+        elif game.tie:
+            text = "Draw"
+        elif self.failed:
+            text = "AI failed"
+        elif game.turn == WHITE:
+            text = "Your move"
+        elif searching:
+            text = "Thinking"
+        else:
+            text = "Waiting"
+        text = str(self.number) + ". " + text
+        if game.clock != None:
+            text += "  " + chess_clock.clock_text(game.clock.remaining(WHITE)) + " / " + \
+                    chess_clock.clock_text(game.clock.remaining(BLACK))
+        return text
+
+
+class Simul():
+    """The simul, its boards laid out in a grid in the window and the scheduler making the AI's moves"""
+
+    def __init__(self, boards, difficulty, workers, timecontrol):
+        self.boards = [SimulBoard(i + 1, difficulty, timecontrol) for i in range(boards)]
+        self.scheduler = EngineScheduler(workers)
+        self.renderer = None                  # Draws the boards at the size they fit the window at
+        self.font = pygame.font.SysFont("Arial", 18)
+        self.surface = None                   # Offscreen surface each board is drawn on
+
+
+    def lay_out(self, width, height):
+        """Places the boards in a grid filling the window, as big as they fit"""
+
+        cols = math.ceil(math.sqrt(len(self.boards)*width/height))
+        cols = max(1, min(cols, len(self.boards)))
+        rows = math.ceil(len(self.boards)/cols)
+        size = min((width - SIMUL_GAP*(cols + 1))//cols,
+                   (height - (SIMUL_GAP + SIMUL_TEXT_HEIGHT)*rows - SIMUL_GAP)//rows)
+        size = max(SIZE, size - size % SIZE)
+
+        for i, board in enumerate(self.boards):
+            left = SIMUL_GAP + (i % cols)*(size + SIMUL_GAP)
+            top = SIMUL_GAP + (i//cols)*(size + SIMUL_GAP + SIMUL_TEXT_HEIGHT)
+            board.rect = pygame.Rect(left, top, size, size)
+
+        if self.renderer == None or self.renderer.size != size:
+            self.renderer = BoardRenderer(size)
+            self.surface = pygame.Surface((size, size))
+
+
+    def draw(self, windowSurface):
+        """Draws every board with its status and clocks"""
+
+        windowSurface.fill(TAN_COLOUR)
+        for board in self.boards:
+            game = board.game
+            colour = None
+            if not game.game_over:
+                colour = game.turn
+            self.renderer.render(game.board, colour, board.lastmove, None, game.firstslot, game.validmoves,
+                                 surface=self.surface)
+            windowSurface.blit(self.surface, board.rect)
+            draw_text(board.status(board in self.scheduler.running), self.font, windowSurface, board.rect.left,
+                      board.rect.bottom + 2, BLACK_COLOUR)
+        pygame.display.update()
+
+
+    def update(self):
+        """Checks the clocks, makes the AI's finished moves and asks for replies on boards waiting for one"""
+
+        for board, answer in self.scheduler.finished():
+            if not board.game.game_over and len(answer["lines"]) > 0:
+                move = board.game.board.parse_san(answer["lines"][0]["san"], BLACK)
+                board.make_move(move_from(move), move_to(move))
+
+        for board in self.boards:
+            game = board.game
+            if not game.game_over:
+                game.check_time()
+            if game.game_over:
+                self.scheduler.cancel(board)
+                self.save(board)
+            elif game.turn == BLACK and not board.failed and not self.scheduler.busy(board):
+                self.scheduler.request(board, board.deadline())
+
+        self.scheduler.dispatch()
+
+
+    def save(self, board):
+        """Saves the board's game (once), unfinished games are saved when the simul is closed"""
+
+        if not board.saved:
+            board.saved = True
+            board.game.save_pgn()
+
+
+    def run(self, windowSurface):
+        """Runs the simul until the window is closed"""
+
+        self.lay_out(windowSurface.get_width(), windowSurface.get_height())
+        clock = pygame.time.Clock()
+        try:
+            while True:
+                clock.tick(SIMUL_FRAME_RATE)
+                for event in pygame.event.get():
+                    if event.type == QUIT or (event.type == KEYUP and event.key == K_ESCAPE):
+                        return
+                    elif event.type == VIDEORESIZE:
+                        self.lay_out(event.w, event.h)
+                    elif event.type == MOUSEBUTTONUP:
+                        for board in self.boards:
+                            if board.rect.collidepoint(event.pos):
+                                board.click(event.pos)
+                self.update()
+                self.draw(windowSurface)
+        finally:
+            for board in self.boards:
+                self.save(board)
+            self.scheduler.shutdown()
+
+
+def parse_time_control(text):
+    """Returns the time control written as minutes+increment (e.g. 5+3), None for "none" """
+
+    if text == "none":
+        return None
+    minutes, _, increment = text.partition("+")
+    return chess_clock.TimeControl(round(float(minutes)*60), int(increment or 0))
+
+
+def main():
+    """Mainline for the simul"""
+
+    boards = SIMUL_BOARDS
+    difficulty = MEDIUM
+    workers = SIMUL_WORKERS
+    timecontrol = None
+    if len(sys.argv) > 1:
+        boards = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        difficulty = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        workers = int(sys.argv[3])
+    if len(sys.argv) > 4:
+        timecontrol = parse_time_control(sys.argv[4])
+
+    pygame.init()
+    windowSurface = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT), RESIZABLE, 32)
+    pygame.display.set_caption("Chess Simul")
+
+    simul = Simul(boards, difficulty, workers, timecontrol)
+    simul.run(windowSurface)
+    terminate()
+
+
+if __name__ == "__main__":
+    main()
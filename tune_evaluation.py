@@ -0,0 +1,433 @@
+# Texel tuning of the evaluation, fits the material values and piece-square tables to the results of games.
+# Each labelled position (white's result: 1 win, 0.5 draw, 0 loss) should be predicted by its evaluation through
+# sigmoid(k*score) and the weights are moved to lower the mean squared error. Positions are turned into NumPy
+# arrays once (every piece on each position as one entry) and shuffled into batches, after that the loss and
+# its gradient for a batch are worked out a few NumPy calls at a time, so a pass over millions of positions
+# takes seconds. Writes a weights file the game loads when it starts (evaluation_weights.json)
+# Positions are FEN lines with the result in them ("1-0", "0-1", "1/2-1/2", or 1, 0.5, 0 at the end, e.g. EPD
+# with c9 "1-0";), games in a PGN file (every position from move SKIP_MOVES on, labelled with its game's result),
+# or self-play chunk files (python selfplay.py), a folder of them or one file, unpacked straight into the arrays
+# Run with "python tune_evaluation.py positions.txt|games.pgn|selfplay_folder [epochs] [output]"
+
+
+from Chess import *
+import sys, os, json, time
+from array import array
+import pgn, selfplay
+
+# NumPy is needed for tuning
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Tuning constants
+EPOCHS = 20                    # Times every position is tuned on
+BATCH_POSITIONS = 16384        # Positions in each gradient step (positions are shuffled into batches once)
+LEARNING_RATE = 1.0            # Most each weight moves in a step (hundredths of a pawn, Adam)
+ADAM_BETAS = (0.9, 0.999)      # Decay rates of Adam's averages of the gradient and squared gradient
+VALIDATION_FRACTION = 0.1      # Fraction of positions kept back to check the weights on (not tuned on)
+SKIP_MOVES = 8                 # Moves at the start of PGN games not used (mostly opening book moves)
+K_SEARCH_STEPS = 40            # Steps of the search for the sigmoid's scale
+
+# Results in positions files and PGN games, as white's score, and results written as numbers (only at the end of
+# a positions line, after the FEN's four or six fields, so the FEN's move numbers aren't taken for them)
+RESULTS = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+NUMBER_RESULTS = {"1": 1.0, "0": 0.0, "0.5": 0.5, "1.0": 1.0, "0.0": 0.0}
+
+# Letters of each piece kind in FEN (white's, black's are lower case)
+FEN_PIECES = {"R": ROOK, "N": KNIGHT, "B": BISHOP, "Q": QUEEN, "K": KING, "P": PAWN}
+
+# Weights tuned, each piece kind has a value for each square (material included) in the middlegame, then the same
+# for the endgame, for a white piece with row 0 on black's side (black's use the same weights flipped)
+WEIGHTS = 2*6*SIZE*SIZE
+ENDGAME_OFFSET = 6*SIZE*SIZE
+BLACK_OFFSET = 6*SIZE*SIZE     # Pieces are numbered by kind and square, black's after white's (weights negated)
+
+
+class Positions():
+    """Labelled positions as NumPy arrays, one entry for each piece of each position (a position's pieces are
+    next to each other). Sums over each position's pieces and over each weight's pieces are taken with
+    numpy.add.reduceat, the pieces are also kept in order of weight for that"""
+
+    def __init__(self, rows, pieces, phases, results):
+        self.rows = rows            # Position each piece is in
+        self.pieces = pieces        # Kind and square of each piece (BLACK_OFFSET added for black pieces)
+        self.middlegame = numpy.minimum(phases, PHASE_TOTAL)/PHASE_TOTAL   # How far each position is from the endgame
+        self.results = results      # White's result of each position
+
+        # First piece of each position, and the pieces in order of weight (position of each, first of each weight)
+        self.starts = numpy.flatnonzero(numpy.diff(rows, prepend=-1))
+        order = numpy.argsort(pieces, kind="stable")
+        self.sortedrows = rows[order]
+        sortedpieces = pieces[order]
+        weightstarts = numpy.flatnonzero(numpy.diff(sortedpieces, prepend=-1))
+        self.weights = sortedpieces[weightstarts]   # Weights (pieces) in at least one position
+        self.weightstarts = weightstarts
+
+
+    def count(self):
+        """Returns the number of positions"""
+
+        return len(self.results)
+
+
+    def split(self, fraction, seed):
+        """Returns two sets of the positions (picked at random), the second with fraction of them"""
+
+        order = numpy.random.default_rng(seed).permutation(self.count())
+        chosen = numpy.zeros(self.count(), dtype=bool)
+        chosen[order[:int(self.count()*fraction)]] = True
+        return self.subset(~chosen), self.subset(chosen)
+
+
+    def batches(self, size, seed):
+        """Returns the positions shuffled into batches of about size positions"""
+
+        count = max(1, -(-self.count()//size))
+        batch = numpy.random.default_rng(seed).integers(0, count, self.count())
+        batches = [self.subset(batch == number) for number in range(count)]
+        return [positions for positions in batches if positions.count() > 0]
+
+
+    def subset(self, chosen):
+        """Returns the positions where chosen (array of booleans, one for each position) is True"""
+
+        numbers = (numpy.cumsum(chosen) - 1).astype(numpy.int32)
+        inside = chosen[self.rows]
+        return Positions(numbers[self.rows[inside]], self.pieces[inside], self.middlegame[chosen]*PHASE_TOTAL,
+                         self.results[chosen])
+
+
+    def evaluate(self, weights):
+        """Returns the scores (hundredths of a pawn, white positive) of the positions with the weights, the same
+        way get_board_score does (without rounding, checkmates and bitbases)"""
+
+        middlegame = weights[:ENDGAME_OFFSET]
+        endgame = weights[ENDGAME_OFFSET:]
+        middlegame = numpy.add.reduceat(numpy.concatenate((middlegame, -middlegame))[self.pieces], self.starts)
+        endgame = numpy.add.reduceat(numpy.concatenate((endgame, -endgame))[self.pieces], self.starts)
+        return middlegame*self.middlegame + endgame*(1 - self.middlegame)
+
+
+    def loss(self, weights, k, scores=None):
+        """Returns the mean squared error of the results predicted from the scores (worked out from the weights if
+        they aren't given)"""
+
+        if scores is None:
+            scores = self.evaluate(weights)
+        return float(numpy.mean((self.results - sigmoid(scores, k))**2))
+
+
+    def gradient(self, weights, k):
+        """Returns the loss and its gradient for each weight"""
+
+        predicted = sigmoid(self.evaluate(weights), k)
+        error = predicted - self.results
+
+        # Derivative of the loss by each position's score, split between the middlegame and endgame by phase and
+        # shared out to the weights of the position's pieces (black's count against them)
+        scoregradient = 2*error*predicted*(1 - predicted)*k*numpy.log(10)/400/self.count()
+        gradient = numpy.zeros(WEIGHTS)
+        pieces = numpy.zeros(2*BLACK_OFFSET)
+        for offset, share in [(0, self.middlegame), (ENDGAME_OFFSET, 1 - self.middlegame)]:
+            pieces[self.weights] = numpy.add.reduceat((scoregradient*share)[self.sortedrows], self.weightstarts)
+            gradient[offset:offset + BLACK_OFFSET] = pieces[:BLACK_OFFSET] - pieces[BLACK_OFFSET:]
+        return float(numpy.mean(error**2)), gradient
+
+
+def sigmoid(scores, k):
+    """Returns the expected result (for white) of positions with the scores (hundredths of a pawn)"""
+
+    return 1/(1 + numpy.power(10, -k*scores/400))
+
+
+class PositionReader():
+    """Collects labelled positions as lists of pieces, turned into Positions once they have all been read"""
+
+    def __init__(self):
+        self.rows = array("i")      # Same as Positions, kept in compact arrays while reading
+        self.pieces = array("i")
+        self.phases = array("i")
+        self.results = array("d")
+
+
+    def add(self, pieces, result):
+        """Adds a position, pieces is a list of (colour, kind, row, col)"""
+
+        row = len(self.results)
+        phase = 0
+        for colour, kind, r, c in pieces:
+            self.rows.append(row)
+            if colour == WHITE:
+                self.pieces.append((kind*SIZE + r)*SIZE + c)
+            else:
+                self.pieces.append(BLACK_OFFSET + (kind*SIZE + SIZE - 1 - r)*SIZE + c)
+            phase += PHASE_WEIGHTS[kind]
+        self.phases.append(phase)
+        self.results.append(result)
+
+
+    def add_fen(self, line):
+        """Adds a position from a line with a FEN and result, returns if it had both"""
+
+        fields = line.replace(";", " ").replace('"', " ").split()
+        result = None
+        for field in fields[1:]:
+            if field in RESULTS:
+                result = RESULTS[field]
+        if result == None and len(fields) in (5, 7) and fields[-1] in NUMBER_RESULTS:
+            result = NUMBER_RESULTS[fields[-1]]
+        if result == None:
+            return False
+
+        pieces = []
+        ranks = fields[0].split("/")
+        if len(ranks) != SIZE:
+            return False
+        for r in range(SIZE):
+            c = 0
+            for letter in ranks[r]:
+                if letter.isdigit():
+                    c += int(letter)
+                elif letter.upper() in FEN_PIECES:
+                    if letter.isupper():
+                        pieces.append((WHITE, FEN_PIECES[letter], r, c))
+                    else:
+                        pieces.append((BLACK, FEN_PIECES[letter.upper()], r, c))
+                    c += 1
+                else:
+                    return False
+        if len(pieces) == 0:
+            return False
+        self.add(pieces, result)
+        return True
+
+
+    def add_game(self, game, board):
+        """Adds the positions of a PGN game with a result, returns the number added"""
+
+        if game.result not in RESULTS:
+            return 0
+        result = RESULTS[game.result]
+        colour = board.set_up_fen(game.tags.get("FEN", START_FEN))
+        added = 0
+        for number, san in enumerate(game.moves):
+            try:
+                board.play_move(board.parse_san(san, colour), None)
+            except ValueError:
+                break
+            colour = opposite_colour(colour)
+
+            # Positions in check are left out (their score says little about the result)
+            if number >= 2*SKIP_MOVES and not board.is_in_check(opposite_colour(colour)):
+                self.add([(piece.colour, piece.kind, r, c) for r in range(SIZE) for c in range(SIZE)
+                          for piece in [board.board[r][c]] if piece != None], result)
+                added += 1
+        return added
+
+
+    def positions(self):
+        """Returns the positions read as NumPy arrays"""
+
+        return Positions(numpy.frombuffer(self.rows, dtype=numpy.int32),
+                         numpy.frombuffer(self.pieces, dtype=numpy.int32),
+                         numpy.frombuffer(self.phases, dtype=numpy.int32), numpy.frombuffer(self.results))
+
+
+def read_chunks(paths):
+    """Returns the labelled positions in self-play chunk files. Each file is memory-mapped and its records
+    unpacked a chunk at a time with NumPy (the pieces from the half bytes of the squares)"""
+
+    record = numpy.dtype([("squares", numpy.uint8, SIZE*SIZE//2), ("flags", numpy.uint8),
+                          ("enpassant", numpy.uint8), ("result", numpy.uint8), ("depth", numpy.uint8),
+                          ("score", "<i2"), ("move", "<u2"), ("ply", "<u2"), ("game", "<u4")])
+    phaseweights = numpy.array(PHASE_WEIGHTS)
+    rows = []
+    pieces = []
+    phases = []
+    results = []
+    count = 0
+    for path in paths:
+        size = selfplay.ChunkFile(path).count
+        if size == 0:
+            continue
+        records = numpy.memmap(path, dtype=record, mode="r", offset=selfplay.HEADER.size, shape=(size,))
+
+        # Piece on each square of each position (row 0 first), then one entry for each piece
+        squares = records["squares"]
+        codes = numpy.stack((squares & 15, squares >> 4), axis=2).reshape(size, SIZE*SIZE)
+        position, square = numpy.nonzero(codes)
+        code = codes[position, square].astype(numpy.int32)
+        kind = (code & 7) - 1
+        white = code >= 8
+
+        # Same numbering as PositionReader.add, black's pieces flipped
+        row = square//SIZE
+        flipped = numpy.where(white, row, SIZE - 1 - row)
+        pieces.append((numpy.where(white, 0, BLACK_OFFSET) + (kind*SIZE + flipped)*SIZE +
+                       square % SIZE).astype(numpy.int32))
+        rows.append((position + count).astype(numpy.int32))
+        phases.append(numpy.bincount(position, phaseweights[kind], size).astype(numpy.int32))
+        results.append(records["result"]/2)
+        count += size
+
+    if count == 0:
+        return PositionReader().positions()
+    return Positions(numpy.concatenate(rows), numpy.concatenate(pieces), numpy.concatenate(phases),
+                     numpy.concatenate(results))
+
+
+def read_positions(path):
+    """Returns the labelled positions in a positions (FEN lines), PGN or self-play chunk file, or a folder of
+    self-play chunk files"""
+
+    if os.path.isdir(path):
+        return read_chunks(selfplay.chunk_paths(path))
+    if path.lower().endswith(".bin"):
+        return read_chunks([path])
+
+    reader = PositionReader()
+    if path.lower().endswith(".pgn"):
+        board = Board(create_pieces(False))
+        for game in pgn.read_file(path):
+            reader.add_game(game, board)
+    else:
+        with open(path) as file:
+            for line in file:
+                reader.add_fen(line)
+    return reader.positions()
+
+
+def starting_weights():
+    """Returns the game's current weights (from the weights file if there is one) as one array"""
+
+    weights = numpy.zeros(WEIGHTS)
+    for offset, material, tables in [(0, EVALUATION_WEIGHTS["middlegame_material"],
+                                      EVALUATION_WEIGHTS["middlegame_tables"]),
+                                     (ENDGAME_OFFSET, EVALUATION_WEIGHTS["endgame_material"],
+                                      EVALUATION_WEIGHTS["endgame_tables"])]:
+        for kind in range(6):
+            start = offset + kind*SIZE*SIZE
+            weights[start:start + SIZE*SIZE] = material[kind] + numpy.array(tables[kind]).flatten()
+    return weights
+
+
+def fit_k(positions, weights):
+    """Returns the sigmoid scale that best predicts the results from the starting weights' scores (ternary
+    search, the loss has one minimum)"""
+
+    scores = positions.evaluate(weights)
+    low = 0.0
+    high = 4.0
+    for step in range(K_SEARCH_STEPS):
+        first = low + (high - low)/3
+        second = high - (high - low)/3
+        if positions.loss(weights, first, scores) < positions.loss(weights, second, scores):
+            high = second
+        else:
+            low = first
+    return (low + high)/2
+
+
+def batches_loss(batches, weights, k):
+    """Returns the mean squared error over all the batches' positions"""
+
+    return sum(batch.loss(weights, k)*batch.count() for batch in batches)/sum(batch.count() for batch in batches)
+
+
+def tune(batches, validation, weights, k, epochs):
+    """Returns the weights after epochs of gradient descent (Adam, one step for each batch) on the loss"""
+
+    beta1, beta2 = ADAM_BETAS
+    mean = numpy.zeros(WEIGHTS)
+    square = numpy.zeros(WEIGHTS)
+    step = 0
+    start = time.perf_counter()
+    for epoch in range(1, epochs + 1):
+        total = 0
+        for batch in batches:
+            step += 1
+            loss, gradient = batch.gradient(weights, k)
+            mean = beta1*mean + (1 - beta1)*gradient
+            square = beta2*square + (1 - beta2)*gradient**2
+            corrected = mean/(1 - beta1**step)
+            weights = weights - LEARNING_RATE*corrected/(numpy.sqrt(square/(1 - beta2**step)) + 1e-12)
+            total += loss*batch.count()
+
+        # Loss while tuning this epoch, and on the positions kept back
+        text = "Epoch " + str(epoch) + ": loss " + str(round(total/sum(batch.count() for batch in batches), 6))
+        if validation.count() > 0:
+            text += ", validation " + str(round(validation.loss(weights, k), 6))
+        print(text + " (" + str(round(time.perf_counter() - start, 1)) + " seconds)")
+    return weights
+
+
+def weights_file(weights, seen, k, positions, loss):
+    """Returns the weights as the weights file's contents, each piece kind's average value over the squares it was
+    seen on is its material value and the rest its piece-square table (kings have no material value)"""
+
+    contents = {"positions": positions, "k": round(k, 4), "loss": round(loss, 6)}
+    for name, offset in [("middlegame", 0), ("endgame", ENDGAME_OFFSET)]:
+        material = []
+        tables = []
+        for kind in range(6):
+            values = weights[offset + kind*SIZE*SIZE:offset + (kind + 1)*SIZE*SIZE]
+            squares = seen[kind*SIZE*SIZE:(kind + 1)*SIZE*SIZE]
+            value = 0
+            if kind != KING and squares.any():
+                value = int(round(values[squares].mean()))
+            material.append(value)
+            tables.append([[int(round(values[row*SIZE + col])) - value for col in range(SIZE)] for row in range(SIZE)])
+        contents[name + "_material"] = material
+        contents[name + "_tables"] = tables
+    return contents
+
+
+def main():
+    """Mainline for tuning"""
+
+    if len(sys.argv) < 2:
+        print("Usage: python tune_evaluation.py positions.txt|games.pgn|selfplay_folder [epochs] [output]")
+        return
+    if numpy == None:
+        print("Tuning needs NumPy (pip install numpy)")
+        return
+    epochs = EPOCHS
+    output = EVALUATION_WEIGHTS_PATH
+    if len(sys.argv) > 2:
+        epochs = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        output = sys.argv[3]
+
+    start = time.perf_counter()
+    positions = read_positions(sys.argv[1])
+    print(str(positions.count()) + " positions read in " + str(round(time.perf_counter() - start, 1)) + " seconds")
+    if positions.count() == 0:
+        return
+    count = positions.count()
+    training, validation = positions.split(VALIDATION_FRACTION, 0)
+
+    weights = starting_weights()
+    k = fit_k(training, weights)
+    print("Sigmoid scale " + str(round(k, 4)) + ", starting loss " + str(round(training.loss(weights, k), 6)))
+
+    # Only the batches are kept (each has its own copy of its positions)
+    batches = training.batches(BATCH_POSITIONS, 1)
+    positions = training = None
+    weights = tune(batches, validation, weights, k, epochs)
+
+    # Squares each piece kind was seen on (by either colour)
+    seen = numpy.zeros(2*BLACK_OFFSET, dtype=bool)
+    for batch in batches:
+        seen[batch.weights] = True
+    seen = seen[:BLACK_OFFSET] | seen[BLACK_OFFSET:]
+
+    with open(output, "w") as file:
+        json.dump(weights_file(weights, seen, k, count, batches_loss(batches, weights, k)), file)
+    print("Weights written to " + output + ", the game uses them from its next start")
+
+
+if __name__ == "__main__":
+    main()